@@ -1,105 +1,89 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib import hub
-import os
-import socket
-import struct
-from ryu.lib.packet import packet, ethernet, ipv4, tcp
 
-class SnortSdnController(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+import base_app
+import block_manager
+import checkpoint
+import meter_manager
+import metrics
+import mitigation
+import snort_alerts
 
+class SnortSdnController(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(SnortSdnController, self).__init__(*args, **kwargs)
-        self.socket_path = "/tmp/snort_alert"
-        if os.path.exists(self.socket_path):
-            os.unlink(self.socket_path)
-            
-        self.logger.info(f"Creating Manual Socket at {self.socket_path}")
-        self.threads.append(hub.spawn(self._listen_to_snort))
-
-    # --- PART 1: SNORT ALERT LISTENER (Background Thread) ---
-    def _listen_to_snort(self):
-        self.logger.info("DEBUG: Socket is alive and waiting...")
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-        sock.bind(self.socket_path)
-        os.chmod(self.socket_path, 0o777)
-        
-        self.logger.info("IDS Listener: Waiting for Snort alerts...")
-        
-        while True:
-            data = sock.recv(65535)
-            if data:
-                print("----------------------------------------------------------------------")
-                self.logger.info("!!!!!!!!!!!! IDS ALERT RECEIVED FROM SNORT !!!!!!!!!!!!")
-                self.logger.info(f"Alert Data Size: {len(data)} bytes")
-
-                alert_msg = data[:256]
-                alert_msg = alert_msg.split(b'\x00', 1)[0]   # Remove null padding
-                alert_msg = alert_msg.decode(errors='ignore')
-
-                event_id = struct.unpack('I', data[256:260])[0]
-                priority = struct.unpack('I', data[264:268])[0]
-
-                raw_packet = data[284:]
-                pkt = packet.Packet(raw_packet)
-                eth = pkt.get_protocol(ethernet.ethernet)
-                ip  = pkt.get_protocol(ipv4.ipv4)
-                tcp_pkt = pkt.get_protocol(tcp.tcp)
-
-                if eth:
-                    print(f"Ethernet Header: {eth.src} -> {eth.dst}")
-
-                if ip:
-                    print(f"Ethernet Header: {ip.src} -> {ip.dst}")
-
-                self.logger.info(f"alertmsg: {alert_msg}")
-                self.logger.info(f"val: {event_id}")
-                self.logger.info(f"priority: {priority}")
-                print("----------------------------------------------------------------------")
+        self.log = snort_alerts.LogLimiter(self.logger, self.CONF.snort.log_rate)
+        # Alerts become drop rules or meters on every switch ([mitigation], [block] and
+        # [meter] config sections)
+        self.blocks = block_manager.BlockManager(self.logger, cluster=self.cluster)
+        self.meters = meter_manager.MeterManager(self.logger, self.blocks)
+        self.mitigator = mitigation.AlertMitigator(self.blocks, self.logger, meters=self.meters)
+        self.alerts = snort_alerts.AlertReceiver(self.logger, self._on_alert)
+        # Blocks survive a restart ([checkpoint] config section)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '12_snort_sdn',
+                                                {'blocks': self.blocks})
+        self.checkpoint.start()
+
+    def close(self):
+        self.alerts.close()
+        self.checkpoint.close()
+        super(SnortSdnController, self).close()
+
+    # --- PART 1: SNORT ALERTS (drained and decoded in the background, [snort] config) ---
+    def _on_alert(self, alert):
+        hdr = alert.hdr
+        if hdr is not None and hdr.ip_src is not None:
+            where = f"{hdr.eth_src} -> {hdr.eth_dst}, {hdr.ip_src} -> {hdr.ip_dst}"
+        elif hdr is not None:
+            where = f"{hdr.eth_src} -> {hdr.eth_dst}"
+        else:
+            where = "no packet"
+        self.log.info(f"IDS ALERT: {alert.msg} (event {alert.event_id},"
+                      f" priority {alert.priority}) {where}")
+        self.mitigator.handle(alert)
+
+    def add_datapath(self, datapath):
+        self.blocks.add_datapath(datapath)
+        self.meters.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.blocks.remove_datapath(datapath)
+        self.meters.remove_datapath(datapath)
+
+    # Offered rate of rate-limited offenders (escalation to a drop)
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_reply_handler(self, ev):
+        self.meters.stats_reply(ev.msg)
+        super(SnortSdnController, self).meter_stats_reply_handler(ev)
+
+    # Drop rules a reconnecting switch kept (block manager sync)
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        self.blocks.stats_reply(ev.msg)
 
     # --- PART 2: Table Flow-Miss Handler---
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_connected(self, ev):
         self.logger.info("---- SDN Switch Connected: Installing Table-Miss ----")
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        # TABLE-MISS FLOW: Match all, Send to Controller
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=0,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
+        # TABLE-MISS FLOW: Match all, Send to Controller (metered / truncated if configured)
+        self.install_table_miss(ev.msg)
 
     # --- Part 3: Flooding ---
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        in_port = msg.match['in_port']
 
-        actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
 
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
+        # Traffic of a mitigated offender that still reaches us: re-send the rule, drop it
+        hdr = self.parse(msg.data)
+        if hdr is not None and self.mitigator.check_packet_in(datapath, hdr):
+            return
 
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,
-            actions=actions,
-            data=data
-        )
-        datapath.send_msg(out)
\ No newline at end of file
+        self.flood(msg)
\ No newline at end of file
@@ -1,105 +1,154 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet
-from ryu.lib import hub
-import csv
-
-class NIDSCollector(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+import base_app
+import checkpoint
+import dataset_sink
+import flow_deltas
+import flow_policy
+import mac_table
+import metrics
+import pipeline
+import stats_scheduler
+
+# FLOW INSTALL POLICY
+# Every installed flow that saw traffic since the last poll becomes one row, so the
+# granularity decides what a row means: 'l2' = per (in_port, eth_dst), '5tuple' = per
+# connection direction
+FLOW_GRANULARITY = flow_policy.L2
+FLOW_IDLE_TIMEOUT = 30
+FLOW_HARD_TIMEOUT = 0
+
+# Cookie of the flows this collector installs; stats requests only ask for these
+# (cookie/cookie_mask) and only in the monitoring table of the pipeline, so the
+# table-miss and other apps' entries are never dumped
+COLLECT_COOKIE = 0xC011EC7000000000
+
+class NIDSCollector(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(NIDSCollector, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
-        self.datapaths = {}
-        self.monitor_thread = hub.spawn(self._monitor)
+        self.mac_to_port = mac_table.MacTable(self.logger)
+        self.flow_policy = flow_policy.FlowPolicy(granularity=FLOW_GRANULARITY,
+                                                  idle_timeout=FLOW_IDLE_TIMEOUT,
+                                                  hard_timeout=FLOW_HARD_TIMEOUT,
+                                                  send_flow_removed=True,
+                                                  table_id=pipeline.table(pipeline.MONITOR))
+        # Last-seen counters per flow entry: rows hold what happened since the last poll
+        self.deltas = flow_deltas.FlowDeltas()
+        # Staggered, adaptive per-switch polling ([stats] config section)
+        self.stats = stats_scheduler.StatsScheduler(self.logger, self._write_stats,
+                                                    cookie=COLLECT_COOKIE,
+                                                    cookie_mask=0xFFFFFFFFFFFFFFFF,
+                                                    table_id=pipeline.table(pipeline.MONITOR))
         self.label = 0  # Set to 0 for Normal, 1 for Attack
+        # Rows are buffered and written in the background ([dataset] config section):
+        # packets, bytes, seconds since the previous reading, packets/s, bytes/s,
+        # flow age (duration_sec), label
+        header = ["Packets", "Bytes", "Seconds", "Pkts/s", "Byts/s", "Duration", "Label"]
+        self.sink = dataset_sink.DatasetSink('13_dataset.csv', header=header, truncate=True,
+                                             logger=self.logger)
+        metrics.Gauge('ryu_flow_entries_tracked', 'Switch flow entries with counters kept',
+                      fn=lambda: len(self.deltas))
+        # Learned MACs survive a restart ([checkpoint] config section)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '13_collector_flow_reply',
+                                                {'mac_table': self.mac_to_port})
+        self.checkpoint.start()
+
+    def close(self):
+        self.checkpoint.close()
+        self.sink.close()
+        super(NIDSCollector, self).close()
 
     # --- PART 1: SWITCHING LOGIC (Handling Table-Miss) ---
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
         # Install table-miss flow entry
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                        ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
-        self.datapaths[datapath.id] = datapath
+        self.install_table_miss(ev.msg)
 
-    def add_flow(self, datapath, priority, match, actions):
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                match=match, instructions=inst)
-        datapath.send_msg(mod)
+    # Only the switches this instance manages are polled ([cluster] config section)
+    def add_datapath(self, datapath):
+        self.stats.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.stats.remove_datapath(datapath)
+        self.deltas.forget_switch(datapath.id)
+        self.mac_to_port.forget_switch(datapath.id)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def _packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-        dst = eth.dst
-        src = eth.src
-        dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
-
-        # Learn MAC address
-        self.mac_to_port[dpid][src] = in_port
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
 
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
-        else:
-            out_port = ofproto.OFPP_FLOOD
+        hdr = self.parse(msg.data)
+        if hdr is None:
+            return
+        # Learn MAC address, look up the destination ([mac_table] config section)
+        out_port = self.mac_to_port.forward(datapath, in_port, hdr.eth_src, hdr.eth_dst)
 
-        actions = [parser.OFPActionOutput(out_port)]
+        actions = self.output_actions(datapath, out_port)
+        out = self.packet_out(msg, actions)
 
-        # Install a flow to avoid packet_in next time
+        # Install a flow to avoid packet_in next time (flow and packet in one write)
         if out_port != ofproto.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-            self.add_flow(datapath, 1, match, actions)
-
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
-
-        out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
-                                  in_port=in_port, actions=actions, data=data)
-        datapath.send_msg(out)
+            match = self.flow_policy.match(datapath.ofproto_parser, in_port, hdr)
+            mod = self.flow_policy.flow_mod(datapath, match, actions, cookie=COLLECT_COOKIE,
+                                            instructions=self.output_instructions(datapath, out_port))
+            self.send(datapath, mod, out)
+        else:
+            self.send(datapath, out)
 
     # --- PART 2: DATA COLLECTION LOGIC ---
 
-    def _monitor(self):
-        while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(10)
-
-    def _request_stats(self, datapath):
-        parser = datapath.ofproto_parser
-        req = parser.OFPFlowStatsRequest(datapath)
-        datapath.send_msg(req)
-
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _flow_stats_reply_handler(self, ev):
-        with open('13_dataset.csv', 'a') as f:
-            writer = csv.writer(f)
-            for stat in ev.msg.body:
-                # Filter out the table-miss flow (priority 0) from dataset
-                if stat.priority == 1:
-                    writer.writerow([
-                        stat.packet_count, 
-                        stat.byte_count, 
-                        stat.duration_sec, 
-                        self.label
-                    ])
\ No newline at end of file
+        # Multipart parts are collected by the scheduler, _write_stats gets the full dump
+        self.stats.reply(ev.msg)
+
+    def _write_stats(self, datapath, entries):
+        dpid = datapath.id
+        seen = set()
+        for stat in entries:
+            # Filter out the table-miss flow (priority 0) from dataset
+            if stat.priority != 1:
+                continue
+            key = flow_deltas.entry_key(stat)
+            seen.add(key)
+            self._write_delta(self.deltas.update(dpid, key, stat.packet_count, stat.byte_count,
+                                                 stat.duration_sec + stat.duration_nsec / 1e9),
+                              stat.duration_sec)
+        # Entries gone without a FlowRemoved (e.g. switch restarted)
+        self.deltas.sweep(dpid, seen)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        if msg.priority != 1 or msg.cookie != COLLECT_COOKIE:
+            return
+        # Final counters: whatever happened between the last poll and the removal
+        delta = self.deltas.remove(msg.datapath.id, flow_deltas.entry_key(msg),
+                                   msg.packet_count, msg.byte_count,
+                                   msg.duration_sec + msg.duration_nsec / 1e9)
+        self._write_delta(delta, msg.duration_sec)
+
+    def _write_delta(self, delta, duration_sec):
+        packets, byts, seconds = delta
+        if packets == 0:
+            return                  # idle since the last poll: nothing to write
+        seconds = max(seconds, 0.001)
+        self.sink.write([
+            packets,
+            byts,
+            round(seconds, 3),
+            round(packets / seconds, 2),
+            round(byts / seconds, 2),
+            duration_sec,
+            self.label
+        ])
@@ -1,148 +1,425 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet, ipv4, tcp, udp
 from ryu.lib import hub
-import csv
+from itertools import chain
+import os
 import time
 
-class NIDSCollector(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+import numpy as np
 
+import base_app
+import block_manager
+import checkpoint
+import dataset_sink
+import fast_parser
+import flow_classifier
+import flow_extractor
+import flow_features
+import flow_policy
+import flow_table
+import mac_table
+import metrics
+import pipeline
+import table_sync
+import worker_pool
+
+# SAMPLE-THEN-OFFLOAD
+# The first OFFLOAD_AFTER packets of a flow are handled here (flags, IATs, sizes).
+# After that a 5-tuple flow is installed on the switch and the rest of the flow's
+# packet/byte counters are read back from flow stats / flow-removed messages.
+# OFFLOAD_AFTER = 0 keeps every packet on the controller (old behaviour).
+OFFLOAD_AFTER = 10
+OFFLOAD_IDLE_TIMEOUT = 10       # offloaded flow ends after 10s of silence
+OFFLOAD_HARD_TIMEOUT = 60       # ... or at most 60s after offload, so long flows still get rows
+STATS_INTERVAL = 10             # refresh offloaded flows' counters every 10s
+
+# FLOW EXPORT
+# A flow is written once it is finished: no packet for FLOW_IDLE_TIMEOUT seconds, or
+# older than FLOW_ACTIVE_TIMEOUT (long flows are split), or, if offloaded, removed from
+# the switch. Finished flows are checked for every EXPORT_INTERVAL seconds.
+FLOW_IDLE_TIMEOUT = 10
+FLOW_ACTIVE_TIMEOUT = 120
+EXPORT_INTERVAL = 1
+
+# Add CICFlowMeter-style IAT std/max and packet length min/max/std columns to the dataset
+EXTENDED_FEATURES = False
+
+# Cookie of offloaded flows: high bit marks "offloaded by the collector", then the flow
+# serial, lowest bit = 0 for the initiator -> responder entry, 1 for the reverse one.
+# Lets the stats request filter on exactly these entries (cookie/cookie_mask), in the
+# monitoring table of the pipeline where they are installed.
+OFFLOAD_COOKIE = 1 << 63
+
+# ONLINE INFERENCE
+# If the model file from train_classifier.py exists ([inference] model_path), every flow
+# is classified once it has classify_after packets (flows that end shorter are classified
+# when exported). Flows go through micro-batches with a latency budget (see
+# flow_classifier.py); the initiator's IPv4 address of every flow predicted as an attack
+# is blocked on all switches ([block] config section).
+
+# WARM RESTART
+# With [checkpoint] directory set, the MAC table, the blocks, the flow table and the
+# offloaded entries (cookie, switch, flow key) are checkpointed (checkpoint.py) and
+# restored at start. A switch that connects is asked for its offloaded entries
+# (table_sync.py): counters of known ones are read back, the ones whose flow is gone are
+# deleted, and known ones the switch no longer has count as removed.
+
+# WORKER PROCESSES
+# With [workers] processes > 0 parsing, the flow table, feature extraction and
+# classification run in worker processes (packet_workers.FlowFeatureWorker), sharded by
+# host pair; this process only forwards, writes the rows they export and blocks the
+# attackers they report. Offload needs the flow table here, so it is off in this mode.
+
+class NIDSCollector(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(NIDSCollector, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
+        self.mac_to_port = mac_table.MacTable(self.logger)
         self.datapaths = {}
         self.label = 0  # 0 for Normal, 1 for Attack
         
-        # flow_tracker stores: { flow_key: [stats_dict] }
-        # flow_key: (src_ip, dst_ip, protocol, src_port, dst_port)
-        self.flow_tracker = {} 
+        # cookie -> (flow row, dpid) for switch entries of offloaded flows
+        self.offloaded = {}
+        self.next_cookie = 1
+        self.offload_policy = flow_policy.FlowPolicy(granularity=flow_policy.FIVE_TUPLE,
+                                                     idle_timeout=OFFLOAD_IDLE_TIMEOUT,
+                                                     hard_timeout=OFFLOAD_HARD_TIMEOUT,
+                                                     send_flow_removed=True,
+                                                     table_id=pipeline.table(pipeline.MONITOR))
         
-        # Create CSV and write headers if it doesn't exist
-        with open('14_dataset.csv', 'w') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "Flow Duration", "Tot Fwd Pkts", "Tot Bwd Pkts", "Flow Byts/s",
-                "SYN Flag Cnt", "ACK Flag Cnt", "PSH Flag Cnt", "RST Flag Cnt",
-                "Flow Pkts/s", "Pkt Len Mean", "Flow IAT Mean", "Protocol", "Label"
-            ])
-        
-        self.monitor_thread = hub.spawn(self._flush_to_csv)
+        # Start a fresh CSV with headers; rows are buffered and written in the
+        # background ([dataset] config section)
+        header = flow_features.FEATURE_HEADER[:]
+        if EXTENDED_FEATURES:
+            header += flow_features.EXTENDED_HEADER
+        self.sink = dataset_sink.DatasetSink('14_dataset.csv', header=header + ["Label"],
+                                             truncate=True, logger=self.logger)
 
-    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
-    def switch_features_handler(self, ev):
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        match = parser.OFPMatch()
-        # Send full packet to controller for inspection
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        self.blocks = block_manager.BlockManager(self.logger, cluster=self.cluster)
+        self.inference = None
+        self.model_columns = None
+        self._load_model()
+
+        # Feature extraction engine (shared with the workers and pcap_features.py);
+        # flow_tracker: its bidirectional flow table, struct-of-arrays state, one row per
+        # connection (both directions of a connection share one packed-integer key)
+        self.extractor = flow_extractor.FlowExtractor(
+            FLOW_IDLE_TIMEOUT, FLOW_ACTIVE_TIMEOUT, self.label, EXTENDED_FEATURES,
+            classify=self._classify_exported if self.inference is not None else None,
+            classify_extended=self.inference is not None and self.model_extended)
+        self.flow_tracker = self.extractor.table
+
+        metrics.Gauge('ryu_flow_table_rows', 'Flows in the controller flow table',
+                      fn=lambda: len(self.flow_tracker))
+        metrics.Gauge('ryu_flow_entries_offloaded', 'Switch entries of offloaded flows',
+                      fn=lambda: len(self.offloaded))
+
+        self.workers = None
+        if self.CONF.workers.processes:
+            self.workers = worker_pool.WorkerPool(
+                self.logger, 'packet_workers:FlowFeatureWorker', self._worker_result,
+                args=(FLOW_IDLE_TIMEOUT, FLOW_ACTIVE_TIMEOUT, self.label, EXTENDED_FEATURES,
+                      self.model_columns),
+                groups=['inference'], tick_interval=EXPORT_INTERVAL)
+        else:
+            self.monitor_thread = hub.spawn(self._export_flows)
+
+        # Offloaded entries a (re)connecting switch still has
+        self.offload_sync = table_sync.TableSync(self.logger, self._offload_synced,
+                                                 OFFLOAD_COOKIE, OFFLOAD_COOKIE,
+                                                 self.offload_policy.table_id)
+        components = {'mac_table': self.mac_to_port, 'blocks': self.blocks}
+        if self.workers is None:
+            # The flow table lives in the workers otherwise
+            components.update(flows=self.flow_tracker, offload=self)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '14_collector_twelve_features',
+                                                components)
+        self.checkpoint.start()
+
+    def close(self):
+        self.checkpoint.close()
+        if self.workers is not None:
+            self.workers.close()
+        self.sink.close()
+        super(NIDSCollector, self).close()
+
+    def _load_model(self):
+        conf = self.CONF.inference
+        if not os.path.exists(conf.model_path):
+            self.logger.info(f"[ML] No model at {conf.model_path}, online inference disabled")
+            return
+        model = flow_classifier.FlowClassifier.load(conf.model_path, conf.threshold)
+        names = flow_features.FEATURE_HEADER + flow_features.EXTENDED_HEADER
+        missing = [name for name in model.feature_names if name not in names]
+        if missing:
+            self.logger.error(f"[ML] {conf.model_path} uses unknown features {missing},"
+                              f" online inference disabled")
+            return
+        # Model columns as indices into the feature columns
+        self.model_columns = [names.index(name) for name in model.feature_names]
+        self.logger.info(f"[ML] Loaded {conf.model_path} ({len(model.feature_names)} features)")
+        if self.CONF.workers.processes:
+            return          # the workers load and run the model themselves
+        self.model_extended = max(self.model_columns) >= len(flow_features.FEATURE_HEADER)
+        self.classify_after = conf.classify_after
+        self.inference = flow_classifier.InferenceStage(model, self._flow_features,
+                                                        self._block_attacker, self.logger)
+
+    # Only the switches this instance manages are polled ([cluster] config section)
+    def add_datapath(self, datapath):
         self.datapaths[datapath.id] = datapath
+        self.blocks.add_datapath(datapath)
+        self.offload_sync.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.datapaths.pop(datapath.id, None)
+        self.blocks.remove_datapath(datapath)
+        self.offload_sync.remove_datapath(datapath)
+        self.mac_to_port.forget_switch(datapath.id)
 
-    def add_flow(self, datapath, priority, match, actions):
-        inst = [datapath.ofproto_parser.OFPInstructionActions(
-                datapath.ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = datapath.ofproto_parser.OFPFlowMod(
-                datapath=datapath, priority=priority, match=match, instructions=inst)
-        datapath.send_msg(mod)
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        # Send packets to controller for inspection; the features only need the headers,
+        # so [packet_in] miss_max_len can truncate them (lengths come from total_len)
+        self.install_table_miss(ev.msg)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def _packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         in_port = msg.match['in_port']
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        if not self.guard.admit(msg):
+            return
+        if self.workers is not None:
+            self._packet_in_to_worker(msg)
+            return
+        hdr = self.parse(msg.data)
+        if hdr is None:
+            return
+        if hdr.ip_src is not None and self.blocks.check_packet_in(
+                datapath, block_manager.ipv4_match(hdr.ip_src)):
+            return
         
         # --- FEATURE EXTRACTION BLOCK ---
-        iph = pkt.get_protocol(ipv4.ipv4)
-        if iph:
-            src_ip = iph.src
-            dst_ip = iph.dst
-            proto = iph.proto
-            sport, dport = 0, 0
-            
-            # TCP/UDP parsing
-            tcph = pkt.get_protocol(tcp.tcp)
-            udph = pkt.get_protocol(udp.udp)
-            
-            flags = {'syn': 0, 'ack': 0, 'psh': 0, 'rst': 0}
-            if tcph:
-                sport, dport = tcph.src_port, tcph.dst_port
-                if tcph.bits & tcp.TCP_SYN: flags['syn'] = 1
-                if tcph.bits & tcp.TCP_ACK: flags['ack'] = 1
-                if tcph.bits & tcp.TCP_PSH: flags['psh'] = 1
-                if tcph.bits & tcp.TCP_RST: flags['rst'] = 1
-            elif udph:
-                sport, dport = udph.src_port, udph.dst_port
-
-            # Create bi-directional key (sort IPs so A->B and B->A are same flow)
-            flow_key = tuple(sorted((src_ip, dst_ip))) + (proto, sport, dport)
+        if hdr.ip_src is not None:
+            # A->B and B->A land on the same row; side says which endpoint sent this one
             now = time.time()
-            
-            if flow_key not in self.flow_tracker:
-                self.flow_tracker[flow_key] = {
-                    'start': now, 'last': now, 'fwd': 1, 'bwd': 0,
-                    'bytes': len(msg.data), 'syn': flags['syn'], 'ack': flags['ack'],
-                    'psh': flags['psh'], 'rst': flags['rst'], 'iat_sum': 0, 'proto': proto
-                }
-            else:
-                f = self.flow_tracker[flow_key]
-                f['fwd'] += 1 if src_ip == flow_key[0] else 0
-                f['bwd'] += 1 if src_ip == flow_key[1] else 0
-                f['bytes'] += len(msg.data)
-                f['iat_sum'] += (now - f['last'])
-                f['syn'] += flags['syn']
-                f['ack'] += flags['ack']
-                f['psh'] += flags['psh']
-                f['rst'] += flags['rst']
-                f['last'] = now
+            row, side = self.extractor.add_headers(hdr, now, msg.total_len)
+            if (self.inference is not None
+                    and self.flow_tracker.packet_count(row) == self.classify_after):
+                self.inference.submit((row, self.flow_tracker.keys[row]))
 
         # --- SWITCHING LOGIC ---
-        dst, src = eth.dst, eth.src
-        dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
-        self.mac_to_port[dpid][src] = in_port
-        out_port = self.mac_to_port[dpid].get(dst, datapath.ofproto.OFPP_FLOOD)
-        actions = [datapath.ofproto_parser.OFPActionOutput(out_port)]
-        
-        # Note: We do NOT install a flow here to keep packets coming to controller
-        # for real-time feature extraction.
-        out = datapath.ofproto_parser.OFPPacketOut(
-            datapath=datapath, buffer_id=msg.buffer_id, in_port=in_port,
-            actions=actions, data=msg.data if msg.buffer_id == datapath.ofproto.OFP_NO_BUFFER else None)
-        datapath.send_msg(out)
-
-    def _flush_to_csv(self):
-        """Periodically calculates final features and writes to CSV"""
+        out_port = self._learn(datapath, in_port, hdr.eth_src, hdr.eth_dst)
+
+        # Note: flows stay on the controller for real-time feature extraction
+        # until they have been sampled long enough, then they go to the switch.
+        if (hdr.ip_src is not None and OFFLOAD_AFTER
+                and out_port != datapath.ofproto.OFPP_FLOOD
+                and not self.flow_tracker.offloaded[row]
+                and self.flow_tracker.packet_count(row) >= OFFLOAD_AFTER):
+            self._offload(datapath, in_port, out_port, hdr, row, side, now)
+
+        self._packet_out(msg, out_port)
+
+    def _learn(self, datapath, in_port, src, dst):
+        # Aging, bounded, move-aware ([mac_table] config section)
+        return self.mac_to_port.forward(datapath, in_port, src, dst)
+
+    def _packet_out(self, msg, out_port):
+        datapath = msg.datapath
+        self.send(datapath, self.packet_out(msg, self.output_actions(datapath, out_port)))
+
+    # --- WORKER MODE ---
+
+    def _packet_in_to_worker(self, msg):
+        datapath = msg.datapath
+        link = fast_parser.parse_link(msg.data)
+        if link is None:
+            return
+        dst, src, ethertype, pair = link
+        if pair is not None:
+            # Full parse only to catch a blocked host whose drop rule the switch lost
+            if self.blocks.blocks:
+                hdr = self.parse(msg.data)
+                if hdr is not None and hdr.ip_src is not None and self.blocks.check_packet_in(
+                        datapath, block_manager.ipv4_match(hdr.ip_src)):
+                    return
+            # Both directions of a connection have the same host pair, so the same worker
+            self.workers.submit(pair, (time.time(), msg.total_len, msg.data))
+        self._packet_out(msg, self._learn(datapath, msg.match['in_port'], src, dst))
+
+    def _worker_result(self, result):
+        kind, value = result
+        if kind == 'rows':
+            self.sink.write_many(value)
+        else:
+            self._block_attacker(value)
+
+    # --- OFFLOAD: hand a sampled flow to the switch ---
+
+    def _offload(self, datapath, in_port, out_port, hdr, row, side, now):
+        parser = datapath.ofproto_parser
+        serial = OFFLOAD_COOKIE | (self.next_cookie << 1)
+        self.next_cookie += 1
+
+        # One entry per direction; the low cookie bit says which one is the initiator's
+        this_way = 0 if self.flow_tracker.is_fwd(row, side) else 1
+        reverse = hdr._replace(eth_src=hdr.eth_dst, eth_dst=hdr.eth_src,
+                               ip_src=hdr.ip_dst, ip_dst=hdr.ip_src,
+                               src_port=hdr.dst_port, dst_port=hdr.src_port)
+        entries = [
+            (serial | this_way, in_port, hdr, out_port),
+            (serial | (this_way ^ 1), out_port, reverse, in_port),
+        ]
+
+        self.flow_tracker.mark_offloaded(row, now, len(entries))
+        mods = []
+        for cookie, match_port, match_hdr, output in entries:
+            self.offloaded[cookie] = (row, datapath.id)
+            match = self.offload_policy.match(parser, match_port, match_hdr)
+            mods.append(self.offload_policy.flow_mod(
+                datapath, match, self.output_actions(datapath, output), cookie=cookie,
+                instructions=self.output_instructions(datapath, output)))
+        self.send(datapath, *mods)
+
+    def _request_offloaded_stats(self):
+        # Only the collector's offloaded entries, not the table-miss or anything else
+        for dp in self.datapaths.values():
+            req = dp.ofproto_parser.OFPFlowStatsRequest(dp, table_id=self.offload_policy.table_id,
+                                                        cookie=OFFLOAD_COOKIE,
+                                                        cookie_mask=OFFLOAD_COOKIE)
+            dp.send_msg(req)
+
+    def _update_switch_counters(self, cookie, packet_count, byte_count, duration):
+        row = self.offloaded.get(cookie, (None,))[0]
+        if row is not None:
+            is_fwd = not (cookie & 1)
+            self.flow_tracker.set_switch_counters(row, is_fwd, packet_count, byte_count, duration)
+        return row
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        if self.blocks.stats_reply(ev.msg) or self.offload_sync.reply(ev.msg):
+            return
+        for stat in ev.msg.body:
+            self._update_switch_counters(stat.cookie, stat.packet_count, stat.byte_count,
+                                         stat.duration_sec + stat.duration_nsec / 1e9)
+
+    def _offload_synced(self, datapath, stats):
+        # The switch's offloaded entries (None: it did not answer, assume it has none)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        present = set()
+        stale = []
+        for stat in stats or ():
+            known = self.offloaded.get(stat.cookie)
+            if known is None or known[1] != datapath.id:
+                # Its flow is not in the table (no checkpoint, or exported meanwhile)
+                stale.append(parser.OFPFlowMod(datapath=datapath, table_id=stat.table_id,
+                                               cookie=stat.cookie, cookie_mask=0xFFFFFFFFFFFFFFFF,
+                                               command=ofproto.OFPFC_DELETE_STRICT,
+                                               priority=stat.priority, out_port=ofproto.OFPP_ANY,
+                                               out_group=ofproto.OFPG_ANY, match=stat.match))
+                continue
+            present.add(stat.cookie)
+            self._update_switch_counters(stat.cookie, stat.packet_count, stat.byte_count,
+                                         stat.duration_sec + stat.duration_nsec / 1e9)
+        # Entries that timed out while nobody was listening: their flow-removed is lost
+        gone = [cookie for cookie, (_, dpid) in self.offloaded.items()
+                if dpid == datapath.id and cookie not in present]
+        for cookie in gone:
+            self.flow_tracker.switch_entry_removed(self.offloaded.pop(cookie)[0])
+        if stale:
+            self.send(datapath, *stale)
+        self.logger.info(f"[OFFLOAD] switch {datapath.id}: {len(present)} offloaded entries kept,"
+                         f" {len(gone)} gone, {len(stale)} stale deleted")
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        row = self._update_switch_counters(msg.cookie, msg.packet_count, msg.byte_count,
+                                           msg.duration_sec + msg.duration_nsec / 1e9)
+        if row is not None:
+            # Final counters of this direction are in; once both directions are
+            # removed the flow is exported
+            self.flow_tracker.switch_entry_removed(row)
+            del self.offloaded[msg.cookie]
+
+    # --- CHECKPOINTS: offloaded entries, restored after the flow table ---
+
+    def checkpoint_sections(self):
+        keys = self.flow_tracker.keys
+        records = chain.from_iterable(
+            (cookie, dpid, keys[row] >> 64, keys[row] & 0xFFFFFFFFFFFFFFFF)
+            for cookie, (row, dpid) in self.offloaded.items())
+        return {'': (32, checkpoint.u64_bytes(records))}
+
+    def restore_sections(self, sections):
+        size, view = sections.get('', (0, b''))
+        if size != 32:
+            return
+        records = checkpoint.u64_array(view)
+        entries = {}
+        for i in range(0, len(records), 4):
+            cookie, dpid, key_hi, key_lo = records[i:i + 4]
+            row = self.flow_tracker.index.get((key_hi << 64) | key_lo)
+            if row is None:
+                continue
+            self.offloaded[cookie] = (row, dpid)
+            entries[row] = entries.get(row, 0) + 1
+            self.next_cookie = max(self.next_cookie, ((cookie & ~OFFLOAD_COOKIE) >> 1) + 1)
+        # An offloaded flow waits for exactly the entries that were restored
+        for row in self.flow_tracker.active_rows().tolist():
+            if self.flow_tracker.offloaded[row]:
+                self.flow_tracker.sw_entries[row] = entries.get(row, 0)
+        self.logger.info(f"[OFFLOAD] {len(self.offloaded)} offloaded entries restored")
+
+    def _export_flows(self):
+        """Periodically exports finished flows (idle/active timeout, removed from the
+        switch) to the dataset sink; flows still running stay in the table"""
+        last_stats = 0
         while True:
-            hub.sleep(10)
-            if not self.flow_tracker: continue
-            
-            with open('14_dataset.csv', 'a') as f:
-                writer = csv.writer(f)
-                # Work on a copy to avoid dictionary size change during iteration
-                for key, data in list(self.flow_tracker.items()):
-                    duration = data['last'] - data['start']
-                    if duration == 0: duration = 0.001 # Avoid div by zero
-                    
-                    tot_pkts = data['fwd'] + data['bwd']
-                    writer.writerow([
-                        round(duration, 4),      # Flow Duration
-                        data['fwd'],             # Tot Fwd Pkts
-                        data['bwd'],             # Tot Bwd Pkts
-                        round(data['bytes']/duration, 2), # Flow Byts/s
-                        data['syn'],             # SYN Flag Cnt
-                        data['ack'],             # ACK Flag Cnt
-                        data['psh'],             # PSH Flag Cnt
-                        data['rst'],             # RST Flag Cnt
-                        round(tot_pkts/duration, 2),      # Flow Pkts/s
-                        round(data['bytes']/tot_pkts, 2), # Pkt Len Mean
-                        round(data['iat_sum']/tot_pkts, 4) if tot_pkts > 1 else 0, # IAT Mean
-                        data['proto'],           # Protocol
-                        self.label               # Label
-                    ])
-            self.flow_tracker.clear() # Clear memory after writing
\ No newline at end of file
+            hub.sleep(EXPORT_INTERVAL)
+            now = time.time()
+            if now - last_stats >= STATS_INTERVAL:
+                self._request_offloaded_stats()
+                last_stats = now
+
+            # Flows that ended short are classified on the way out (_classify_exported)
+            self.sink.write_many(self.extractor.expire(now))
+
+    # --- ONLINE INFERENCE ---
+
+    def _initiator_ip(self, row, key):
+        ip_a, ip_b = flow_table.unpack_key(key)[:2]
+        return ip_b if self.flow_tracker.initiator[row] else ip_a
+
+    def _model_matrix(self, columns):
+        return np.column_stack([columns[i] for i in self.model_columns]).astype(np.float64)
+
+    def _flow_features(self, items):
+        """Micro-batch of (row, key) -> (initiator IPs, feature matrix), skipping flows
+        that were exported (and their row reused) while waiting"""
+        keys = self.flow_tracker.keys
+        items = [(row, key) for row, key in items if keys[row] == key]
+        if not items:
+            return [], None
+        rows = np.array([row for row, _ in items])
+        columns = self.flow_tracker.features(rows, extended=self.model_extended)
+        return [self._initiator_ip(row, key) for row, key in items], self._model_matrix(columns)
+
+    def _classify_exported(self, rows, columns):
+        # Flows that ended before reaching classify_after were never classified
+        short = np.flatnonzero(self.flow_tracker.fwd[rows] + self.flow_tracker.bwd[rows]
+                               < self.classify_after)
+        if not len(short):
+            return
+        keys = self.flow_tracker.keys
+        ips = [self._initiator_ip(row, keys[row]) for row in rows[short].tolist()]
+        self.inference.submit_many(ips, self._model_matrix(columns)[short])
+
+    def _block_attacker(self, ip):
+        if not self.blocks.is_ip_blocked(ip):
+            self.logger.info(f"[ML] Flow from {ip} classified as attack")
+            self.blocks.block_ip(ip)
@@ -0,0 +1,255 @@
+from ryu import cfg
+from ryu.controller import ofp_event
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
+from ryu.lib.packet import ether_types
+from ryu.topology import event as topo_event
+
+import base_app
+import fabric_graph
+import metrics
+import pipeline
+
+# SHORTEST-PATH FORWARDING for multi-switch fabrics
+# OFPP_FLOOD loops (and multiplies traffic) as soon as the switches form a cycle, so:
+#   topology     ryu.topology discovers the inter-switch links with LLDP; the switches,
+#                links and every switch's next hop toward every other switch are kept
+#                in fabric_graph.FabricGraph, recomputed incrementally on link events
+#   hosts        MAC -> (switch, port), learned only on edge ports (not on link ports)
+#   known dst    the shortest path from this switch to the destination's switch is
+#                installed at once: one FlowMod per hop (match eth_dst), downstream
+#                switches first, then FlowMod + PacketOut on this one in one write
+#   unknown dst  (broadcast, ARP, not learned yet) the controller sends the packet out
+#                of the edge ports of every switch itself; nothing is forwarded over
+#                inter-switch links, so there is nothing to loop. A switch without
+#                links simply floods.
+#   link down    path entries leaving on the dead port are deleted; the next packet
+#                of those flows takes the recomputed path
+# A host seen on another edge port (moved) has its path entries deleted on every switch.
+#
+# Usage:
+#   ryu-manager 15_shortest_path_forwarding.py      (--observe-links is turned on here)
+#   sudo python fabric_topo.py
+
+FLOW_IDLE_TIMEOUT = 30          # path entries go after 30s without traffic
+FLOW_PRIORITY = 1
+MAX_HOSTS = 65536               # hosts beyond this are not learned (their traffic floods)
+
+# Cookie of the path entries, so link-down / host-move deletes only touch those
+PATH_COOKIE = 0x5A7400000000000
+PATH_COOKIE_MASK = 0xFFFFFFFFFFFFFFFF
+
+# Link discovery is what this app runs on
+cfg.CONF.set_override('observe_links', True)
+
+
+class ShortestPathForwarding(base_app.BaseApp):
+    def __init__(self, *args, **kwargs):
+        super(ShortestPathForwarding, self).__init__(*args, **kwargs)
+        self.fabric = fabric_graph.FabricGraph()
+        self.datapaths = {}             # dpid -> datapath
+        self.ports = {}                 # dpid -> port numbers (from ryu.topology)
+        self.hosts = {}                 # MAC -> (dpid, port)
+        self.edge_actions = {}          # (dpid, in_port) -> flood actions, reset on topology change
+        self.paths = 0
+        self.packet_log = metrics.PacketLog(self.logger)
+
+        fabric = self.fabric
+        metrics.Gauge('ryu_fabric_switches', 'Switches in the fabric graph', fn=lambda: len(fabric))
+        metrics.Gauge('ryu_fabric_links', 'Inter-switch links (one per direction)',
+                      fn=fabric.link_count)
+        metrics.Gauge('ryu_fabric_hosts', 'Hosts located on an edge port',
+                      fn=lambda: len(self.hosts))
+        metrics.Counter('ryu_fabric_paths_total', 'Paths installed', fn=lambda: self.paths)
+        metrics.Counter('ryu_fabric_trees_recomputed_total', 'Shortest-path trees recomputed',
+                        fn=lambda: fabric.recomputed)
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        self.install_table_miss(ev.msg)
+
+    def add_datapath(self, datapath):
+        self.datapaths[datapath.id] = datapath
+        self.fabric.add_switch(datapath.id)
+
+    def remove_datapath(self, datapath):
+        if datapath.id in self.datapaths:
+            del self.datapaths[datapath.id]
+            self.ports.pop(datapath.id, None)
+            self.fabric.remove_switch(datapath.id)
+            self._forget_hosts(lambda location: location[0] == datapath.id)
+            self.edge_actions = {}
+
+    # --- TOPOLOGY (ryu.topology) ---
+
+    @set_ev_cls(topo_event.EventSwitchEnter)
+    def switch_enter_handler(self, ev):
+        self.ports[ev.switch.dp.id] = {port.port_no for port in ev.switch.ports}
+        self.edge_actions = {}
+
+    @set_ev_cls(topo_event.EventPortAdd)
+    def port_add_handler(self, ev):
+        self.ports.setdefault(ev.port.dpid, set()).add(ev.port.port_no)
+        self.edge_actions = {}
+
+    @set_ev_cls(topo_event.EventPortDelete)
+    def port_delete_handler(self, ev):
+        port = (ev.port.dpid, ev.port.port_no)
+        self.ports.get(port[0], set()).discard(port[1])
+        self._forget_hosts(lambda location: location == port)
+        self.edge_actions = {}
+
+    @set_ev_cls(topo_event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        changed = self.fabric.add_link(src.dpid, src.port_no, dst.dpid)
+        self.logger.info(f"[FABRIC] link s{src.dpid}:{src.port_no} -> s{dst.dpid}:{dst.port_no}"
+                         f" up, {len(changed)} trees recomputed")
+        # Whatever was learned on this port came from the neighbour switch
+        link_port = (src.dpid, src.port_no)
+        self._forget_hosts(lambda location: location == link_port)
+        self.edge_actions = {}
+
+    @set_ev_cls(topo_event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        changed = self.fabric.remove_link(src.dpid, dst.dpid, src.port_no)
+        self.logger.info(f"[FABRIC] link s{src.dpid}:{src.port_no} -> s{dst.dpid}:{dst.port_no}"
+                         f" down, {len(changed)} trees recomputed")
+        datapath = self.datapaths.get(src.dpid)
+        if datapath is not None:
+            self._delete_paths(datapath, out_port=src.port_no)
+        self.edge_actions = {}
+
+    # --- PACKET-IN ---
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
+    def packet_in_handler(self, ev):
+        msg = ev.msg
+        datapath = msg.datapath
+        in_port = msg.match['in_port']
+
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
+
+        hdr = self.parse(msg.data)
+        if hdr is None:
+            return
+        # LLDP belongs to ryu.topology's link discovery
+        if hdr.ethertype == ether_types.ETH_TYPE_LLDP:
+            return
+
+        dpid = datapath.id
+        from_fabric = self.fabric.is_link_port(dpid, in_port)
+        if not from_fabric:
+            self._learn_host(hdr.eth_src, dpid, in_port)
+
+        location = self.hosts.get(hdr.eth_dst)
+        if location is None:
+            # Packets from a link were already sent out of every edge port
+            if not from_fabric:
+                self._flood(msg)
+            return
+        self._install_path(msg, hdr.eth_dst, location)
+
+    def _learn_host(self, mac, dpid, port):
+        if int(mac[:2], 16) & 1:
+            return                  # group address
+        location = (dpid, port)
+        old = self.hosts.get(mac)
+        if old == location:
+            return
+        if old is None and len(self.hosts) >= MAX_HOSTS:
+            return
+        self.hosts[mac] = location
+        if old is not None:
+            self.logger.info(f"[FABRIC] host {mac} moved from s{old[0]}:{old[1]}"
+                             f" to s{dpid}:{port}")
+            for datapath in self.datapaths.values():
+                self._delete_paths(datapath, eth_dst=mac)
+        self.packet_log.debug("Host %s on s%s:%s", mac, dpid, port)
+
+    def _forget_hosts(self, where):
+        for mac in [mac for mac, location in self.hosts.items() if where(location)]:
+            del self.hosts[mac]
+            for datapath in self.datapaths.values():
+                self._delete_paths(datapath, eth_dst=mac)
+
+    # --- PATHS ---
+
+    def _install_path(self, msg, mac, location):
+        datapath = msg.datapath
+        dst_dpid = location[0]
+        hops = self.fabric.path(datapath.id, dst_dpid)
+        if hops is None:
+            return                  # destination switch not reachable (partitioned fabric)
+        hops.append(location)
+        if hops[0] == (datapath.id, msg.match['in_port']):
+            return                  # would go back out where it came from
+        for dpid, _ in hops[1:]:
+            if dpid not in self.datapaths:
+                return
+
+        # Downstream switches first, so the packet finds its entries on the way
+        for dpid, port in reversed(hops[1:]):
+            dp = self.datapaths[dpid]
+            self.send(dp, self._path_mod(dp, mac, port))
+        port = hops[0][1]
+        self.send(datapath, self._path_mod(datapath, mac, port),
+                  self.packet_out(msg, self.output_actions(datapath, port)))
+        self.paths += 1
+        self.packet_log.debug("Path to %s: %s", mac,
+                              " -> ".join(f"s{dpid}:{port}" for dpid, port in hops))
+
+    def _path_mod(self, datapath, mac, port):
+        return self.flow_mod(datapath, FLOW_PRIORITY, self.match(datapath, eth_dst=mac), None,
+                             instructions=self.output_instructions(datapath, port),
+                             table_id=pipeline.table(pipeline.FORWARD),
+                             idle_timeout=FLOW_IDLE_TIMEOUT, cookie=PATH_COOKIE)
+
+    def _delete_paths(self, datapath, out_port=None, **fields):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.send(datapath, parser.OFPFlowMod(
+            datapath=datapath, command=ofproto.OFPFC_DELETE, table_id=ofproto.OFPTT_ALL,
+            cookie=PATH_COOKIE, cookie_mask=PATH_COOKIE_MASK,
+            out_port=ofproto.OFPP_ANY if out_port is None else out_port,
+            out_group=ofproto.OFPG_ANY, match=parser.OFPMatch(**fields)))
+
+    # --- FLOODING WITHOUT LOOPS ---
+
+    def _flood(self, msg):
+        datapath = msg.datapath
+        in_port = msg.match['in_port']
+        # The ingress switch releases its buffer; the others need the whole packet
+        whole = len(msg.data) >= msg.total_len
+        for dpid, dp in self.datapaths.items():
+            if dpid == datapath.id:
+                actions = self._edge_actions(dp, in_port)
+                if actions:
+                    self.send(dp, self.packet_out(msg, actions))
+            elif whole:
+                actions = self._edge_actions(dp, None)
+                if actions:
+                    self.send(dp, dp.ofproto_parser.OFPPacketOut(
+                        datapath=dp, buffer_id=dp.ofproto.OFP_NO_BUFFER,
+                        in_port=dp.ofproto.OFPP_CONTROLLER, actions=actions, data=msg.data))
+
+    def _edge_actions(self, datapath, in_port):
+        """Output actions to every edge port of the switch but in_port."""
+        key = (datapath.id, in_port)
+        actions = self.edge_actions.get(key)
+        if actions is None:
+            ofproto = datapath.ofproto
+            if not self.fabric.links.get(datapath.id):
+                # No inter-switch links: plain flood cannot loop
+                actions = self.output_actions(datapath, ofproto.OFPP_FLOOD)
+            else:
+                parser = datapath.ofproto_parser
+                ports = sorted(port for port in self.ports.get(datapath.id, ())
+                               if port <= ofproto.OFPP_MAX and port != in_port
+                               and not self.fabric.is_link_port(datapath.id, port))
+                actions = [parser.OFPActionOutput(port) for port in ports]
+            self.edge_actions[key] = actions
+        return actions
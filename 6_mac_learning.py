@@ -1,101 +1,84 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet
 
-class MyRyuApp(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+import base_app
+import checkpoint
+import flow_policy
+import mac_table
+import metrics
+import pipeline
 
+# FLOW INSTALL POLICY
+# 'l2' = one flow per (in_port, eth_dst), '5tuple' = one flow per connection direction
+FLOW_GRANULARITY = flow_policy.L2
+FLOW_IDLE_TIMEOUT = 30          # remove a learned flow after 30s without traffic
+FLOW_HARD_TIMEOUT = 0           # 0 = no hard limit
+
+class MyRyuApp(base_app.BaseApp):
     def __init__ (self, *args, **kwargs):
         super(MyRyuApp, self).__init__(*args, **kwargs)
-        self.mac_to_port = {}
+        # Aging, bounded, move-aware MAC table ([mac_table] config section)
+        self.mac_to_port = mac_table.MacTable(self.logger)
+        self.flow_policy = flow_policy.FlowPolicy(granularity=FLOW_GRANULARITY,
+                                                  idle_timeout=FLOW_IDLE_TIMEOUT,
+                                                  hard_timeout=FLOW_HARD_TIMEOUT,
+                                                  table_id=pipeline.table(pipeline.FORWARD))
+        # Per-packet lines: sampled, debug level ([metrics] log_sample)
+        self.packet_log = metrics.PacketLog(self.logger)
+        # Learned MACs survive a restart ([checkpoint] config section)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '6_mac_learning',
+                                                {'mac_table': self.mac_to_port})
+        self.checkpoint.start()
         print("----Ryu App has started----")
+
+    def close(self):
+        self.checkpoint.close()
+        super(MyRyuApp, self).close()
     
     # Table miss flow handler
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_connected(self, ev):
         print("----Switch connected----")
 
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
-                                             actions)]
-        
-        mod = parser.OFPFlowMod(datapath=datapath,
-                                priority=0,
-                                match=match,
-                                instructions=inst)
-        datapath.send_msg(mod)
+        # Send table misses to the controller (metered / truncated if configured)
+        self.install_table_miss(ev.msg)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
         ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
 
-        dst = eth.dst
-        src = eth.src
+        hdr = self.parse(msg.data)      # fast_parser: only the MACs are needed here, skip the full packet.Packet() parse
+        if hdr is None:
+            return
 
-        dpid = datapath.id
-        self.mac_to_port.setdefault(dpid, {})
+        dst = hdr.eth_dst
+        src = hdr.eth_src
 
-        # LEARNING STEP
-        self.mac_to_port[dpid][src] = in_port
-        print(f"Learned MAC {src} on port {in_port}")
+        # LEARNING STEP + FORWARDING DECISION (flood if dst mac is not learned)
+        out_port = self.mac_to_port.forward(datapath, in_port, src, dst)
+        self.packet_log.debug("MAC %s on port %s, destination %s -> port %s",
+                              src, in_port, dst, out_port)
 
-        # FORWARDING DECISION
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
-            print(f"Known destination {dst}, forward to port {out_port}")
-        else:
-            out_port = ofproto.OFPP_FLOOD           # if dst mac is not learned, flood the packet
-            print(f"Unknown destination {dst}, flooding")
-
-        actions = [parser.OFPActionOutput(out_port)]
+        actions = self.output_actions(datapath, out_port)
+        # SEND CURRENT PACKET (buffer_id if the switch buffered it, else the data)
+        out = self.packet_out(msg, actions)
 
         # INSTALL FLOW RULE (only if not flooding)
         if out_port != ofproto.OFPP_FLOOD:      # flooding is temporary behaviour
-            match = parser.OFPMatch(            # creating a match for future packets. Its applied/used only when eth_dst = dst (from above) && in_port = in_port (from above)
-                in_port=in_port,
-                eth_dst=dst
-            )
-
-            inst = [parser.OFPInstructionActions(
-                ofproto.OFPIT_APPLY_ACTIONS, actions
-            )]
-
-            mod = parser.OFPFlowMod(
-                datapath=datapath,
-                priority=1,
-                match=match,
-                instructions=inst
-            )
-
-            datapath.send_msg(mod)
-
-        # SEND CURRENT PACKET
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
-
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,
-            actions=actions,
-            data=data
-        )
-
-        datapath.send_msg(out)
\ No newline at end of file
+            # The policy builds the match for future packets (in_port + eth_dst, or the 5-tuple)
+            # and sets the idle/hard timeouts so stale entries age out of the switch
+            match = self.flow_policy.match(datapath.ofproto_parser, in_port, hdr)
+            mod = self.flow_policy.flow_mod(datapath, match, actions,
+                                            instructions=self.output_instructions(datapath, out_port))
+            # Flow and packet in one write
+            self.send(datapath, mod, out)
+        else:
+            self.send(datapath, out)
\ No newline at end of file
@@ -1,8 +1,11 @@
-from ryu.base import app_manager
+import os
+
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet
+
+import base_app
+import blocklist
+import metrics
 
 # STATIC HOST BLOCKING
 
@@ -17,11 +20,17 @@ from ryu.lib.packet import packet, ethernet
 # h1 <-> h2 (allowed)
 # The rule that blocks: h3 -> h1,h2; will also block: h1,h2 -> h3
 
-class MyRyuApp(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+# The blocked hosts come from list files ([blocklist] config section, this file's list
+# if none is set): IPs, CIDRs and MACs, aggregated, installed in paced batches and
+# reloaded when a file changes. The default list sits next to this file, whatever the
+# working directory
+BLOCKLIST_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '7_blocklist.txt')]
 
+class MyRyuApp(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(MyRyuApp, self).__init__(*args, **kwargs)
+        self.blocklist = blocklist.Blocklist(self.logger,
+                                             self.CONF.blocklist.files or BLOCKLIST_FILES)
         print("----Ryu app started----")
     
     # Switch connected -> table-miss
@@ -30,62 +39,37 @@ class MyRyuApp(app_manager.RyuApp):
     def switch_connected(self, ev):
         print("----Switch connected----")
 
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        # Static Blocking
-        blocked_mac = "16:33:94:1e:eb:da"
-        block_match = parser.OFPMatch(eth_src=blocked_mac)
-        block_inst = []                                     # No actions = DROP
-        block_flow = parser.OFPFlowMod(datapath=datapath,
-                                       priority=100,        # Higher than table-miss
-                                       match=block_match,
-                                       instructions=block_inst)
-        datapath.send_msg(block_flow)
-        print("----Blocking rule installed for h3----")
-
         # Table-miss flow
-        miss_match = parser.OFPMatch()
-        miss_actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        
-        miss_inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
-                                             miss_actions)]
-        
-        miss_flow = parser.OFPFlowMod(datapath=datapath,
-                                priority=0,
-                                match=miss_match,
-                                instructions=miss_inst)
-        datapath.send_msg(miss_flow)
+        self.install_table_miss(ev.msg)
+
+    # Static Blocking: drop rules (higher than table-miss, no actions = DROP) for every
+    # list entry the switch does not have yet
+    def add_datapath(self, datapath):
+        self.blocklist.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.blocklist.remove_datapath(datapath)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        self.blocklist.stats_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        self.blocklist.barrier_reply(ev.msg)
 
     # Packet-In Handling + Buffer Handling
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def packet_in_handler(self, ev):
         msg = ev.msg
-        datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        in_port = msg.match['in_port']      # The input port for the packet
-
-        actions = [
-            parser.OFPActionOutput(ofproto.OFPP_FLOOD)      # Flood packet to all ports except the input one
-        ]
-
-        # BUFFER HANDLING: 
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
-
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,            # Prevents sending packet back to same port
-            actions=actions,
-            data=data
-        )
-
-        datapath.send_msg(out)
+
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
+
+        # Flood packet to all ports except the input one
+        # (buffer_id if the switch buffered it, else the data)
+        self.flood(msg)
 
     
@@ -1,95 +1,104 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet
 
-class MyRyuApp(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+import base_app
+import block_manager
+import checkpoint
+import detectors
+import meter_manager
+import metrics
 
+class MyRyuApp(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(MyRyuApp, self).__init__(*args, **kwargs)
         print("----Ryu app has started----")
 
-        # Count packets per source MAC
-        self.packet_count={}
-        # Keep track of already blocked hosts
-        self.blocked_hosts = set()
+        # Packet rate per source MAC (bounded, decays with time)
+        # Threshold/window/algorithm come from the [detector] config section
+        # (counted over every controller instance in a cluster)
+        self.packet_rate = self.cluster.share(
+            detectors.create(self.CONF.detector.packet_threshold), 'packet_rate')
+        # Blocked hosts: drop rules on every switch, with expiry ([block] config section)
+        # ... shared with the other controller instances, if any ([cluster] config section)
+        self.blocks = block_manager.BlockManager(self.logger, cluster=self.cluster)
+        # Optional first response: rate limit with meters, escalate to a drop ([meter] config section)
+        self.meters = meter_manager.MeterManager(self.logger, self.blocks)
+        # Per-packet lines: sampled, debug level ([metrics] log_sample)
+        self.packet_log = metrics.PacketLog(self.logger)
+        # Rates and blocks survive a restart ([checkpoint] config section)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '8_dynamic_host_blocking',
+                                                {'packet_rate': self.packet_rate,
+                                                 'blocks': self.blocks})
+        self.checkpoint.start()
+
+    def close(self):
+        self.checkpoint.close()
+        super(MyRyuApp, self).close()
     
     # Table-Miss Handling
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_connected(self,ev):
         print("----Switch connected----")
+        self.install_table_miss(ev.msg)
+
+    # Switches this instance manages: blocks go to all of them and are restored on reconnect
+    def add_datapath(self, datapath):
+        self.blocks.add_datapath(datapath)
+        self.meters.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.blocks.remove_datapath(datapath)
+        self.meters.remove_datapath(datapath)
 
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                         ofproto.OFPCML_NO_BUFFER)]
-        ins = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
-                                           actions)]
-        mod = parser.OFPFlowMod(datapath=datapath,
-                                priority=0,
-                                match=match,
-                                instructions=ins)
-        datapath.send_msg(mod)
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_reply_handler(self, ev):
+        self.meters.stats_reply(ev.msg)
+        super(MyRyuApp, self).meter_stats_reply_handler(ev)
+
+    # Drop rules a reconnecting switch kept (block manager sync)
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        self.blocks.stats_reply(ev.msg)
 
     # Packet-In Handling (Dynamic IDS Logic)
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
+            return
+
+        hdr = self.parse(msg.data)
 
-        if eth is None:
+        if hdr is None:
             return
         
-        src_mac = eth.src
-        dst_mac = eth.dst
+        src_mac = hdr.eth_src
+        dst_mac = hdr.eth_dst
 
-        if src_mac in self.blocked_hosts:
+        # Normally the switch drops (or polices) these; if one still gets here the rule is re-sent
+        key = block_manager.mac_match(src_mac)
+        if self.blocks.check_packet_in(datapath, key) or self.meters.check_packet_in(datapath, key):
             return
         
-        self.packet_count[src_mac] = self.packet_count.get(src_mac,0) + 1 
-        print(f"[INFO] Packet from {src_mac}, count = {self.packet_count[src_mac]}")
-
-        THRESHOLD = 7
-        if self.packet_count[src_mac] > THRESHOLD:
-            print(f"[ALERT] {src_mac} detected as suspicious. Blocking...")
+        over_threshold = self.packet_rate.hit(src_mac)
+        if self.packet_log.due():
+            self.logger.debug("Packet from %s, rate = %.1f/window", src_mac, self.packet_rate.rate(src_mac))
 
-            block_match = parser.OFPMatch(eth_src=src_mac)
-            block_ins = []
-            block_flow = parser.OFPFlowMod(datapath=datapath,
-                                           priority=100,
-                                           match=block_match,
-                                           instructions=block_ins)
-            datapath.send_msg(block_flow)
-            self.blocked_hosts.add(src_mac)
-            print(f"[IDS] Dynamic block installed for {src_mac}")
+        if over_threshold:
+            if self.meters.enabled:
+                print(f"[ALERT] {src_mac} detected as suspicious. Rate limiting...")
+                self.meters.police(key)
+                print(f"[IDS] Meter installed for {src_mac}")
+            else:
+                print(f"[ALERT] {src_mac} detected as suspicious. Blocking...")
+                self.blocks.block_mac(src_mac)
+                print(f"[IDS] Dynamic block installed for {src_mac}")
+            self.packet_rate.forget(src_mac)
             return
 
-        # NORMAL FORWARDING IF NOT SUSPICIOUS
-        actions = [
-            parser.OFPActionOutput(ofproto.OFPP_FLOOD)
-        ]
-
-        # BUFFER HANDLING: 
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
-
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,
-            actions=actions,
-            data=data
-        )
-
-        datapath.send_msg(out)
\ No newline at end of file
+        # NORMAL FORWARDING IF NOT SUSPICIOUS (buffer_id if the switch buffered it, else the data)
+        self.flood(msg)
\ No newline at end of file
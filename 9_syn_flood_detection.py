@@ -1,131 +1,161 @@
-from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, CONFIG_DISPATCHER, set_ev_cls
-from ryu.ofproto import ofproto_v1_3
-from ryu.lib.packet import packet, ethernet, ipv4, tcp
+from ryu.lib.packet import tcp
 from ryu.lib.packet import ether_types
 
+import base_app
+import block_manager
+import checkpoint
+import detectors
+import fast_parser
+import meter_manager
+import metrics
+import worker_pool
 
-class MyRyuApp(app_manager.RyuApp):
-    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+class MyRyuApp(base_app.BaseApp):
     def __init__(self, *args, **kwargs):
         super(MyRyuApp, self).__init__(*args, **kwargs)
         print("----Ryu app has started----")
 
-        self.packet_count = {}
-        self.syn_count = {}
-        self.blocked_hosts = set()
+        # Per source MAC rates over a sliding window, bounded in memory
+        # Thresholds/window/algorithm come from the [detector] config section
+        # (counted over every controller instance in a cluster)
+        self.packet_rate = self.cluster.share(
+            detectors.create(self.CONF.detector.packet_threshold), 'packet_rate')
+        self.syn_rate = self.cluster.share(
+            detectors.create(self.CONF.detector.syn_threshold), 'syn_rate')
+        # Blocked hosts: drop rules on every switch, with expiry ([block] config section)
+        # ... shared with the other controller instances, if any ([cluster] config section)
+        self.blocks = block_manager.BlockManager(self.logger, cluster=self.cluster)
+        # Optional first response: rate limit with meters, escalate to a drop ([meter] config section)
+        self.meters = meter_manager.MeterManager(self.logger, self.blocks)
+        # Per-packet lines: sampled, debug level ([metrics] log_sample)
+        self.packet_log = metrics.PacketLog(self.logger)
+        # Optional: detection in worker processes sharded by source MAC ([workers] config section)
+        self.workers = None
+        if self.CONF.workers.processes:
+            self.workers = worker_pool.WorkerPool(self.logger, 'packet_workers:SynFloodWorker',
+                                                  self._syn_flood, groups=['detector', 'metrics'])
+        # Rates and blocks survive a restart ([checkpoint] config section); in worker
+        # mode the rates live in the workers
+        components = {'blocks': self.blocks}
+        if self.workers is None:
+            components.update(packet_rate=self.packet_rate, syn_rate=self.syn_rate)
+        self.checkpoint = checkpoint.Checkpoint(self.logger, '9_syn_flood_detection', components)
+        self.checkpoint.start()
+
+    def close(self):
+        self.checkpoint.close()
+        super(MyRyuApp, self).close()
 
     # TABLE-MISS FLOW (SEND TO CONTROLLER)
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_connected(self, ev):
         print("----Switch connected----")
+        self.install_table_miss(ev.msg)
 
-        datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-
-        match = parser.OFPMatch()
-        actions = [
-            parser.OFPActionOutput(
-                ofproto.OFPP_CONTROLLER,
-                ofproto.OFPCML_NO_BUFFER
-            )
-        ]
-
-        inst = [
-            parser.OFPInstructionActions(
-                ofproto.OFPIT_APPLY_ACTIONS,
-                actions
-            )
-        ]
-
-        flow = parser.OFPFlowMod(
-            datapath=datapath,
-            priority=0,
-            match=match,
-            instructions=inst
-        )
-
-        datapath.send_msg(flow)
+    # Switches this instance manages: blocks go to all of them and are restored on reconnect
+    def add_datapath(self, datapath):
+        self.blocks.add_datapath(datapath)
+        self.meters.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.blocks.remove_datapath(datapath)
+        self.meters.remove_datapath(datapath)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_reply_handler(self, ev):
+        self.meters.stats_reply(ev.msg)
+        super(MyRyuApp, self).meter_stats_reply_handler(ev)
+
+    # Drop rules a reconnecting switch kept (block manager sync)
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        self.blocks.stats_reply(ev.msg)
 
     # PACKET-IN HANDLER (IDS + SYN FLOOD)
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed(base_app.PACKET_IN_SECONDS)
     def packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
-        in_port = msg.match['in_port']
-
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
 
-        if eth is None:
+        # Port quota exceeded: shed before any parsing ([packet_in] config section)
+        if not self.guard.admit(msg):
             return
 
-        # Ignore LLDP packets
-        if eth.ethertype == ether_types.ETH_TYPE_LLDP:
+        if self.workers is not None:
+            self._packet_in_to_worker(msg)
             return
 
-        src_mac = eth.src
-        dst_mac = eth.dst
+        # MACs, ethertype, IPv4 and TCP flags in one pass over the raw bytes
+        hdr = self.parse(msg.data)
 
-        # Drop if already blocked
-        if src_mac in self.blocked_hosts:
+        if hdr is None:
             return
 
-        # GENERIC PACKET COUNT
-        self.packet_count[src_mac] = self.packet_count.get(src_mac, 0) + 1
-        print(f"[INFO] Packet from {src_mac}, total = {self.packet_count[src_mac]}")
-
-        ip_pkt = pkt.get_protocol(ipv4.ipv4)
-        tcp_pkt = pkt.get_protocol(tcp.tcp)
-
-        # SYN FLOOD DETECTION
-        if ip_pkt and tcp_pkt:
-            # SYN = 1 and ACK = 0
-            if (tcp_pkt.bits & tcp.TCP_SYN) and not (tcp_pkt.bits & tcp.TCP_ACK):
-                self.syn_count[src_mac] = self.syn_count.get(src_mac, 0) + 1
-                print(f"[INFO] SYN from {src_mac}, count = {self.syn_count[src_mac]}")
-
-                SYN_THRESHOLD = 10
-                if self.syn_count[src_mac] > SYN_THRESHOLD:
-                    print(f"[ALERT] SYN Flood detected from {src_mac}")
-                    print(f"[IDS] Installing drop rule...")
+        # Ignore LLDP packets
+        if hdr.ethertype == ether_types.ETH_TYPE_LLDP:
+            return
 
-                    match = parser.OFPMatch(eth_src=src_mac)
-                    flow = parser.OFPFlowMod(
-                        datapath=datapath,
-                        priority=100,
-                        match=match,
-                        instructions=[]
-                    )
+        src_mac = hdr.eth_src
+        dst_mac = hdr.eth_dst
 
-                    datapath.send_msg(flow)
-                    self.blocked_hosts.add(src_mac)
+        # Drop if already blocked or rate limited (and re-send the rule to this switch)
+        key = block_manager.mac_match(src_mac)
+        if self.blocks.check_packet_in(datapath, key) or self.meters.check_packet_in(datapath, key):
+            return
 
-                    print(f"[IDS] Host {src_mac} blocked")
-                    return
+        # GENERIC PACKET RATE (informational only)
+        self.packet_rate.hit(src_mac)
+
+        # SYN FLOOD DETECTION: SYN = 1 and ACK = 0
+        is_syn = (hdr.ip_proto == 6 and (hdr.tcp_flags & tcp.TCP_SYN)
+                  and not (hdr.tcp_flags & tcp.TCP_ACK))
+        syn_flood = is_syn and self.syn_rate.hit(src_mac)
+
+        # One sampling slot per packet, both rates on one line
+        if self.packet_log.due():
+            if is_syn:
+                self.logger.debug("SYN from %s, rate = %.1f/window, SYN rate = %.1f/window", src_mac,
+                                  self.packet_rate.rate(src_mac), self.syn_rate.rate(src_mac))
+            else:
+                self.logger.debug("Packet from %s, rate = %.1f/window", src_mac,
+                                  self.packet_rate.rate(src_mac))
+
+        if syn_flood:
+            print(f"[ALERT] SYN Flood detected from {src_mac}")
+            self._syn_flood(src_mac)
+            self.packet_rate.forget(src_mac)
+            self.syn_rate.forget(src_mac)
+            return
 
-        # -------------------------------
         # NORMAL FORWARDING (FLOOD)
-        # -------------------------------
-        actions = [
-            parser.OFPActionOutput(ofproto.OFPP_FLOOD)
-        ]
-
-        data = None
-        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
-            data = msg.data
-
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,
-            actions=actions,
-            data=data
-        )
-
-        datapath.send_msg(out)
+        self.flood(msg)
+
+    def _packet_in_to_worker(self, msg):
+        # Only the Ethernet header is read here; parsing and rates are done by the
+        # worker owning this source MAC, which reports SYN floods back to _syn_flood()
+        link = fast_parser.parse_link(msg.data)
+        if link is None or link[2] == ether_types.ETH_TYPE_LLDP:
+            return
+        src_mac = link[1]
+        key = block_manager.mac_match(src_mac)
+        if self.blocks.check_packet_in(msg.datapath, key) or self.meters.check_packet_in(msg.datapath, key):
+            return
+        self.workers.submit(src_mac, msg.data)
+        self.flood(msg)
+
+    def _syn_flood(self, src_mac):
+        key = block_manager.mac_match(src_mac)
+        if self.blocks.is_blocked(key) or self.meters.is_policed(key):
+            return          # a late report from a worker, already handled
+        if self.meters.enabled:
+            print(f"[IDS] Installing meter on all switches...")
+            self.meters.police(key)
+            print(f"[IDS] Host {src_mac} rate limited")
+        else:
+            print(f"[IDS] Installing drop rule on all switches...")
+            self.blocks.block_mac(src_mac)
+            print(f"[IDS] Host {src_mac} blocked")
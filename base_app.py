@@ -0,0 +1,270 @@
+import struct
+import time
+
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
+from ryu.ofproto import ofproto_v1_3
+
+import cluster
+import fast_parser
+import metrics
+import packet_in_guard
+import pipeline
+
+# BASE APP
+# The switch-side plumbing every app from 6_mac_learning.py on used to repeat:
+#   table-miss     install_table_miss() from the switch-features handler: the pipeline's
+#                  goto-next-table entries ([pipeline] config section), then the
+#                  controller entry through the packet-in guard ([packet_in] config
+#                  section); meter stats replies go to the guard (apps with more meters
+#                  override the handler and call super)
+#   switches       add_datapath(datapath) / remove_datapath(datapath): override to start
+#                  and stop managing a switch (blocks, meters, stats, ...). Called when a
+#                  switch connects / disconnects; in a cluster of controllers
+#                  ([cluster] config section, cluster.py) when this instance becomes /
+#                  stops being the switch's master, and the table-miss waits for that too
+#   FlowMods       flow_mod() / add_flow() with apply-actions instructions
+#   PacketOut      packet_out() for a packet-in: buffer_id if the switch buffered it,
+#                  the data otherwise; flood() is the common case
+#   object cache   output_actions() / output_instructions() are built once per switch
+#                  and port and reused by every message after that
+#   bursts         send(datapath, *msgs, barrier=...) serializes the messages into one
+#                  write (one send-queue entry and one sendall instead of one per
+#                  message), optionally closed by a barrier
+#   counters       every datapath that went through install_table_miss() has its send
+#                  path counted, whoever sends (the app, block/meter managers, stats):
+#                  self.sent[dpid] = [messages, bytes, writes, flow_mods]
+#   metrics        the counters above, the guard's admitted/shed packet-ins, and the
+#                  latency of packet-in handlers (@metrics.timed(PACKET_IN_SECONDS)) and
+#                  of parse() go to the [metrics] endpoint, which the base app starts
+# Lessons 1-5 keep writing these out by hand on purpose.
+
+# Longest burst written at once; longer lists are split
+MAX_BURST = 512
+# Most cached match/action/instruction objects per switch; the cache restarts past it
+MAX_CACHED = 4096
+
+_OFP_HEADER = struct.Struct('!xBH')         # type and length of the OpenFlow header
+_OFPT_FLOW_MOD = 14
+
+PACKET_IN_SECONDS = metrics.Histogram('ryu_packet_in_seconds',
+                                      'Time spent in the packet-in handler')
+PARSE_SECONDS = metrics.Histogram('ryu_parse_seconds', 'Time spent parsing packet-in headers')
+
+
+def send_burst(datapath, msgs, barrier=False):
+    """Serialize `msgs` and hand them to the switch connection in writes of up to
+    MAX_BURST messages. With barrier, a barrier request follows the last one."""
+    msgs = list(msgs)
+    if barrier:
+        msgs.append(datapath.ofproto_parser.OFPBarrierRequest(datapath))
+    if len(msgs) == 1:
+        return datapath.send_msg(msgs[0])
+    sent = True
+    for i in range(0, len(msgs), MAX_BURST):
+        bufs = []
+        for msg in msgs[i:i + MAX_BURST]:
+            if msg.xid is None:
+                datapath.set_xid(msg)
+            msg.serialize()
+            bufs.append(msg.buf)
+        sent = datapath.send(b''.join(bufs)) and sent
+    return sent
+
+
+def count_sends(datapath, counters):
+    """Count what goes out on `datapath` into counters = [messages, bytes, writes,
+    flow_mods] (kept as datapath.send_counters, so apps sharing a connection share them)."""
+    send = datapath.send
+    datapath.send_counters = counters
+
+    def counted_send(buf, close_socket=False):
+        size = len(buf)
+        offset = messages = flow_mods = 0
+        while offset + 4 <= size:
+            msg_type, length = _OFP_HEADER.unpack_from(buf, offset)
+            offset += length or size
+            messages += 1
+            if msg_type == _OFPT_FLOW_MOD:
+                flow_mods += 1
+        counters[0] += messages
+        counters[1] += size
+        counters[2] += 1
+        counters[3] += flow_mods
+        return send(buf, close_socket)
+
+    datapath.send = counted_send
+
+
+class BaseApp(app_manager.RyuApp):
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(BaseApp, self).__init__(*args, **kwargs)
+        # Table-miss meter / truncation and per-port packet-in quotas ([packet_in] config section)
+        self.guard = packet_in_guard.PacketInGuard(self.logger)
+        # Switch roles across controller instances ([cluster] config section)
+        self.cluster = cluster.Cluster(self.logger, self._role_changed)
+        self.features = {}          # dpid -> switch features, for a table-miss sent later
+        self.sent = {}              # dpid -> [messages, bytes, writes, flow_mods]
+        self.objects = {}           # dpid -> {key: prebuilt match/action/instruction list}
+        self._register_metrics()
+        metrics.serve(self.logger)
+
+    def close(self):
+        """Stops the base app's timers; apps that override close() call this last."""
+        self.guard.close()
+        self.cluster.close()
+
+    def _register_metrics(self):
+        sent = self.sent
+        for i, (name, what) in enumerate([('messages', 'OpenFlow messages'),
+                                           ('bytes', 'Bytes'),
+                                           ('writes', 'Writes (bursts count once)'),
+                                           ('flow_mods', 'FlowMods')]):
+            metrics.Counter(f'ryu_sent_{name}_total', f'{what} sent to the switch', ['dpid'],
+                            fn=lambda i=i: {(dpid,): c[i] for dpid, c in sent.items()})
+        guard = self.guard
+        metrics.Counter('ryu_packet_in_admitted_total', 'Packet-ins admitted by the port quotas',
+                        fn=lambda: guard.admitted)
+        metrics.Counter('ryu_packet_in_shed_total', 'Packet-ins shed by the port quotas',
+                        fn=lambda: guard.shed)
+        metrics.Counter('ryu_packet_in_meter_drops_total',
+                        'Packet-ins dropped by the table-miss meter', ['dpid'],
+                        fn=lambda: {(dpid,): n for dpid, n in guard.meter_drops.items()})
+
+    # --- TABLE-MISS ---
+
+    def install_table_miss(self, features):
+        """Call from the EventOFPSwitchFeatures handler with ev.msg."""
+        datapath = features.datapath
+        counters = getattr(datapath, 'send_counters', None)
+        if counters is None:
+            # Counters carry over when the switch reconnects
+            counters = self.sent.get(datapath.id) or [0, 0, 0, 0]
+            count_sends(datapath, counters)
+        self.sent[datapath.id] = counters
+        self.objects.pop(datapath.id, None)
+        if self.cluster.enabled:
+            # Only the master may write to the switch: sent once the role is known
+            self.features[datapath.id] = features
+            return
+        self._send_table_miss(features)
+
+    def _send_table_miss(self, features):
+        mods = pipeline.miss_mods(features, self.logger)
+        if mods:
+            self.send(features.datapath, *mods)
+        self.guard.install_table_miss(features)
+
+    # --- SWITCHES ---
+
+    def add_datapath(self, datapath):
+        """This instance manages `datapath` from now on."""
+
+    def remove_datapath(self, datapath):
+        """This instance no longer manages `datapath` (gone, or another instance's now)."""
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _switch_state_handler(self, ev):
+        if ev.state == MAIN_DISPATCHER:
+            self.cluster.add_datapath(ev.datapath)
+        elif ev.state == DEAD_DISPATCHER:
+            self.cluster.remove_datapath(ev.datapath)
+            self.features.pop(ev.datapath.id, None)
+
+    def _role_changed(self, datapath, master):
+        if master:
+            features = self.features.get(datapath.id)
+            if features is not None:
+                self._send_table_miss(features)
+            self.add_datapath(datapath)
+        else:
+            self.remove_datapath(datapath)
+
+    @set_ev_cls(ofp_event.EventOFPRoleReply, MAIN_DISPATCHER)
+    def _role_reply_handler(self, ev):
+        self.cluster.role_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def _error_handler(self, ev):
+        self.cluster.error(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_reply_handler(self, ev):
+        self.guard.stats_reply(ev.msg)
+
+    def parse(self, data):
+        """fast_parser.parse(), timed."""
+        start = time.perf_counter()
+        hdr = fast_parser.parse(data)
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        return hdr
+
+    # --- CACHED OBJECTS ---
+
+    def _cache(self, datapath):
+        objects = self.objects.get(datapath.id)
+        if objects is None or len(objects) >= MAX_CACHED:
+            objects = self.objects[datapath.id] = {}
+        return objects
+
+    def output_actions(self, datapath, port):
+        """[OFPActionOutput(port)]; shared, do not modify."""
+        objects = self._cache(datapath)
+        actions = objects.get(port)
+        if actions is None:
+            actions = objects[port] = [datapath.ofproto_parser.OFPActionOutput(port)]
+        return actions
+
+    def output_instructions(self, datapath, port):
+        """Apply-actions instructions for output_actions(port); shared, do not modify."""
+        objects = self._cache(datapath)
+        inst = objects.get(('inst', port))
+        if inst is None:
+            parser = datapath.ofproto_parser
+            inst = objects[('inst', port)] = [parser.OFPInstructionActions(
+                datapath.ofproto.OFPIT_APPLY_ACTIONS, self.output_actions(datapath, port))]
+        return inst
+
+    def match(self, datapath, **fields):
+        """OFPMatch for `fields`, built once per switch."""
+        objects = self._cache(datapath)
+        key = ('match',) + tuple(sorted(fields.items()))
+        match = objects.get(key)
+        if match is None:
+            match = objects[key] = datapath.ofproto_parser.OFPMatch(**fields)
+        return match
+
+    # --- FLOW MODS / PACKET-OUT ---
+
+    def flow_mod(self, datapath, priority, match, actions, **kwargs):
+        """OFPFlowMod applying `actions`; kwargs go to OFPFlowMod (cookie, timeouts,
+        or instructions instead of actions, e.g. output_instructions() or [] = drop)."""
+        if 'instructions' not in kwargs:
+            parser = datapath.ofproto_parser
+            kwargs['instructions'] = [parser.OFPInstructionActions(
+                datapath.ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        return datapath.ofproto_parser.OFPFlowMod(datapath=datapath, priority=priority,
+                                                  match=match, **kwargs)
+
+    def add_flow(self, datapath, priority, match, actions, **kwargs):
+        return self.send(datapath, self.flow_mod(datapath, priority, match, actions, **kwargs))
+
+    def packet_out(self, msg, actions):
+        """OFPPacketOut sending the packet of packet-in `msg` through `actions`."""
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        data = msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None
+        return datapath.ofproto_parser.OFPPacketOut(
+            datapath=datapath, buffer_id=msg.buffer_id, in_port=msg.match['in_port'],
+            actions=actions, data=data)
+
+    def flood(self, msg):
+        datapath = msg.datapath
+        return self.send(datapath, self.packet_out(
+            msg, self.output_actions(datapath, datapath.ofproto.OFPP_FLOOD)))
+
+    def send(self, datapath, *msgs, barrier=False):
+        return send_burst(datapath, msgs, barrier)
@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from ryu.ofproto import ofproto_v1_3 as ofp
+
+import pcap_reader
+
+# CONTROLLER BENCHMARK: the apps against emulated OpenFlow 1.3 switches, no Mininet/OVS
+# Usage: python bench_controller.py [APP ...] [--all] [--traffic normal|syn_flood|mac_spoof]
+#                                   [--pcap FILE] [--packets N] [--rate R] [--switches S]
+#                                   [--config-file FILE] [--record FILE]
+# Each app is started in its own ryu-manager (in a scratch directory, so the collectors'
+# datasets do not overwrite the repo's), then S asyncio switches connect to it, answer
+# the handshake (features, port description, barriers, echoes, empty multipart replies)
+# and replay the same packet-ins: generated traffic or a pcap/pcapng file.
+#   latency      every packet-in carries its own buffer_id (the switches advertise
+#                buffers), so the first PacketOut/FlowMod naming that buffer_id is its
+#                response; p50/p99 are over the packet-ins that got one
+#   throughput   packet-ins sent / time from the first packet-in to the last message
+#                from the controller (--rate 0 = as fast as the connection takes them)
+#   memory       peak RSS of ryu-manager and its worker processes (Linux /proc)
+# --record writes every message the controller sent during the replay as CSV
+# (app, time, dpid, type, buffer_id, length). --all runs 6_mac_learning.py to
+# 14_collector_twelve_features.py (11_snort.py has no OpenFlow side and is skipped).
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ALL_APPS = ['6_mac_learning.py', '7_static_host_blocking.py', '8_dynamic_host_blocking.py',
+            '9_syn_flood_detection.py', '12_snort_sdn.py', '13_collector_flow_reply.py',
+            '14_collector_twelve_features.py', '15_shortest_path_forwarding.py']
+
+PORT = 16633
+CONNECT_TIMEOUT = 20.0      # seconds for ryu-manager to start listening
+SETTLE = 0.5                # quiet seconds after the handshake before the replay starts
+IDLE = 2.0                  # quiet seconds after the replay that end the run
+BURST = 64                  # packet-ins per write
+
+_HEADER = struct.Struct('!BBHI')
+_PACKET_IN = struct.Struct('!BBHIIHBBQ')        # header, buffer_id, total_len, reason, table, cookie
+_FEATURES = struct.Struct('!QIBB2xII')
+_MULTIPART = struct.Struct('!HH4x')
+_PACKET_OUT_BUFFER = struct.Struct('!I')        # at offset 8
+_FLOW_MOD_BUFFER = struct.Struct('!I')          # at offset 32
+
+N_BUFFERS = 0xFFFF
+MAX_BUFFER_ID = 0xFFFFFFFE                      # 0xFFFFFFFF is OFP_NO_BUFFER
+
+TYPE_NAMES = {value: name[5:] for name, value in vars(ofp).items()
+              if name.startswith('OFPT_') and isinstance(value, int)}
+
+
+# --- TRAFFIC ---
+
+HOSTS = [(i, bytes([0, 0, 0, 0, 0, i]), bytes([10, 0, 0, i])) for i in range(1, 5)]
+BROADCAST = b'\xff' * 6
+
+_ETH = struct.Struct('!6s6sH')
+_IPV4 = struct.Struct('!BBHHHBBH4s4s')
+_TCP = struct.Struct('!HHIIBBHHH')
+_UDP = struct.Struct('!HHHH')
+_ARP = struct.Struct('!HHBBH6s4s6s4s')
+
+FIN, SYN, PSH, ACK = 0x01, 0x02, 0x08, 0x10
+
+
+def ipv4_frame(src, dst, proto, l4, payload=b''):
+    """(in_port, Ethernet frame) from host tuple src to host tuple dst."""
+    port, src_mac, src_ip = src
+    ip = _IPV4.pack(0x45, 0, 20 + len(l4) + len(payload), 0, 0, 64, proto, 0, src_ip, dst[2])
+    return port, _ETH.pack(dst[1], src_mac, 0x0800) + ip + l4 + payload
+
+
+def tcp_frame(src, dst, sport, dport, flags, payload=b''):
+    return ipv4_frame(src, dst, 6, _TCP.pack(sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0),
+                      payload)
+
+
+def udp_frame(src, dst, sport, dport, payload=b''):
+    return ipv4_frame(src, dst, 17, _UDP.pack(sport, dport, 8 + len(payload), 0), payload)
+
+
+def arp_frame(src, dst):
+    port, src_mac, src_ip = src
+    arp = _ARP.pack(1, 0x0800, 6, 4, 1, src_mac, src_ip, b'\0' * 6, dst[2])
+    return port, _ETH.pack(BROADCAST, src_mac, 0x0806) + arp
+
+
+def normal_traffic(rng, count):
+    """TCP connections (handshake, data, FIN), UDP exchanges and ARP between 4 hosts."""
+    frames = []
+    while len(frames) < count:
+        a, b = rng.sample(HOSTS, 2)
+        kind = rng.random()
+        if kind < 0.05:
+            frames.append(arp_frame(a, b))
+        elif kind < 0.35:
+            sport, dport = rng.randrange(1024, 65536), rng.choice((53, 123, 5000))
+            for _ in range(rng.randint(1, 4)):
+                frames.append(udp_frame(a, b, sport, dport, b'x' * rng.randint(16, 512)))
+                frames.append(udp_frame(b, a, dport, sport, b'x' * rng.randint(16, 512)))
+        else:
+            sport, dport = rng.randrange(1024, 65536), rng.choice((22, 80, 443))
+            frames.append(tcp_frame(a, b, sport, dport, SYN))
+            frames.append(tcp_frame(b, a, dport, sport, SYN | ACK))
+            frames.append(tcp_frame(a, b, sport, dport, ACK))
+            for _ in range(rng.randint(1, 8)):
+                frames.append(tcp_frame(a, b, sport, dport, PSH | ACK, b'x' * rng.randint(16, 1400)))
+                frames.append(tcp_frame(b, a, dport, sport, ACK))
+            frames.append(tcp_frame(a, b, sport, dport, FIN | ACK))
+            frames.append(tcp_frame(b, a, dport, sport, FIN | ACK))
+    return frames[:count]
+
+
+def syn_flood_traffic(rng, count):
+    """h3 sends SYNs to h1:80 from random source ports; 1 packet in 10 is normal traffic."""
+    background = iter(normal_traffic(rng, count // 10 + 1))
+    attacker, victim = HOSTS[2], HOSTS[0]
+    return [next(background) if i % 10 == 0 else
+            tcp_frame(attacker, victim, rng.randrange(1024, 65536), 80, SYN)
+            for i in range(count)]
+
+
+def mac_spoof_traffic(rng, count):
+    """Random source MACs and IPs behind port 3 (CAM table overflow); 1 in 10 is normal."""
+    background = iter(normal_traffic(rng, count // 10 + 1))
+    victim = HOSTS[0]
+    frames = []
+    for i in range(count):
+        if i % 10 == 0:
+            frames.append(next(background))
+            continue
+        mac = bytes([0x02]) + rng.randbytes(5)
+        ip = bytes([10, 0, rng.randrange(1, 255), rng.randrange(1, 255)])
+        frames.append(udp_frame((3, mac, ip), victim, rng.randrange(1024, 65536), 5000, b'x' * 32))
+    return frames
+
+
+TRAFFIC = {'normal': normal_traffic, 'syn_flood': syn_flood_traffic,
+           'mac_spoof': mac_spoof_traffic}
+
+
+def pcap_traffic(path, count):
+    """Ethernet frames of a pcap/pcapng file. Source MACs get switch ports in the order
+    they first appear (1, 2, ...)."""
+    ports = {}
+    frames = []
+    for _, _, data in pcap_reader.read_packets(path):
+        if len(frames) == count:
+            break
+        if len(data) < 14:
+            continue
+        port = ports.setdefault(data[6:12], len(ports) + 1)
+        frames.append((port, data))
+    if not frames:
+        raise ValueError(f"{path}: no packets")
+    return frames
+
+
+# --- EMULATED SWITCH ---
+
+def _message(msg_type, xid, body=b''):
+    return _HEADER.pack(ofp.OFP_VERSION, msg_type, _HEADER.size + len(body), xid) + body
+
+
+def _packet_in_tail(in_port, data):
+    # Match with only OXM in_port (padded to 8 bytes), 2 pad bytes, then the frame
+    oxm = struct.pack('!HHHBBI', ofp.OFPMT_OXM, 12, ofp.OFPXMC_OPENFLOW_BASIC,
+                      ofp.OFPXMT_OFB_IN_PORT << 1, 4, in_port)
+    return oxm + b'\0' * 4 + b'\0\0' + data
+
+
+class Switch(object):
+    def __init__(self, dpid, frames, rate, record):
+        self.dpid = dpid
+        # Packet-in bodies without their fixed part, built once
+        self.tails = [(len(data), _packet_in_tail(port, data)) for port, data in frames]
+        self.rate = rate
+        self.record = record            # list of rows, or None
+        self.sent_at = {}               # buffer_id -> time the packet-in was written
+        self.latencies = []
+        self.counts = {}                # message type -> messages from the controller
+        self.first_sent = None
+        self.last_received = None
+        self.recording = False
+        self.handshake_done = asyncio.Event()
+
+    async def run(self, host, port):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(_message(ofp.OFPT_HELLO, 0))
+        read_task = asyncio.ensure_future(self._read_loop(reader))
+        await self.handshake_done.wait()
+        await self._wait_idle(SETTLE)
+        self.counts = {}
+        self.recording = True
+        await self._replay()
+        await self._wait_idle(IDLE, all_answered=True)
+        read_task.cancel()
+        self.writer.close()
+
+    async def _wait_idle(self, quiet, all_answered=False):
+        self.last_received = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.05)
+            if all_answered and not self.sent_at:
+                return
+            if time.perf_counter() - self.last_received >= quiet:
+                return
+
+    async def _replay(self):
+        header = _PACKET_IN.pack
+        writer = self.writer
+        start = self.first_sent = time.perf_counter()
+        buffer_id = 0
+        tails = self.tails
+        for i in range(0, len(tails), BURST):
+            if self.rate:
+                delay = start + i / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            bufs = []
+            now = time.perf_counter()
+            for total_len, tail in tails[i:i + BURST]:
+                buffer_id = buffer_id % MAX_BUFFER_ID + 1
+                self.sent_at[buffer_id] = now
+                bufs.append(header(ofp.OFP_VERSION, ofp.OFPT_PACKET_IN,
+                                   _PACKET_IN.size + len(tail), 0, buffer_id, total_len,
+                                   ofp.OFPR_NO_MATCH, 0, 0))
+                bufs.append(tail)
+            writer.write(b''.join(bufs))
+            await writer.drain()
+
+    async def _read_loop(self, reader):
+        while True:
+            header = await reader.readexactly(_HEADER.size)
+            _, msg_type, length, xid = _HEADER.unpack(header)
+            body = await reader.readexactly(length - _HEADER.size)
+            now = self.last_received = time.perf_counter()
+            self.counts[msg_type] = self.counts.get(msg_type, 0) + 1
+            self._reply(msg_type, xid, body)
+
+            buffer_id = ofp.OFP_NO_BUFFER
+            if msg_type == ofp.OFPT_PACKET_OUT:
+                buffer_id = _PACKET_OUT_BUFFER.unpack_from(body, 0)[0]
+            elif msg_type == ofp.OFPT_FLOW_MOD:
+                buffer_id = _FLOW_MOD_BUFFER.unpack_from(body, 32 - _HEADER.size)[0]
+            sent = self.sent_at.pop(buffer_id, None)
+            if sent is not None:
+                self.latencies.append(now - sent)
+            if self.recording and self.record is not None:
+                self.record.append((now, self.dpid, TYPE_NAMES.get(msg_type, msg_type),
+                                    buffer_id, length))
+
+    def _reply(self, msg_type, xid, body):
+        write = self.writer.write
+        if msg_type == ofp.OFPT_FEATURES_REQUEST:
+            write(_message(ofp.OFPT_FEATURES_REPLY, xid,
+                           _FEATURES.pack(self.dpid, N_BUFFERS, 254, 0, 0, 0)))
+            self.handshake_done.set()
+        elif msg_type == ofp.OFPT_ECHO_REQUEST:
+            write(_message(ofp.OFPT_ECHO_REPLY, xid, body))
+        elif msg_type == ofp.OFPT_BARRIER_REQUEST:
+            write(_message(ofp.OFPT_BARRIER_REPLY, xid))
+        elif msg_type == ofp.OFPT_ROLE_REQUEST:
+            write(_message(ofp.OFPT_ROLE_REPLY, xid, body))
+        elif msg_type == ofp.OFPT_MULTIPART_REQUEST:
+            # No ports, flows or meters to report
+            mp_type = _MULTIPART.unpack_from(body, 0)[0]
+            write(_message(ofp.OFPT_MULTIPART_REPLY, xid, _MULTIPART.pack(mp_type, 0)))
+
+
+# --- CONTROLLER PROCESS ---
+
+def _proc_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def peak_rss_mb(pid):
+    """Peak RSS of pid and its children in MB (0 without /proc)."""
+    return sum(_proc_kb(p, 'VmHWM') for p in [pid] + _children(pid)) / 1024
+
+
+def start_controller(app, port, config_files, workdir):
+    cmd = [sys.executable, '-m', 'ryu.cmd.manager', '--ofp-tcp-listen-port', str(port)]
+    for path in config_files:
+        cmd += ['--config-file', os.path.abspath(path)]
+    cmd.append(os.path.join(HERE, app))
+    log = open(os.path.join(workdir, 'ryu.log'), 'w')
+    return subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def connect(switch, port, proc):
+    deadline = time.perf_counter() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return await switch.run('127.0.0.1', port)
+        except ConnectionRefusedError:
+            if proc.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError("ryu-manager did not start")
+            await asyncio.sleep(0.2)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench(app, frames, args, record):
+    workdir = tempfile.mkdtemp(prefix='bench_controller_')
+    proc = start_controller(app, args.port, args.config_file, workdir)
+    switches = [Switch(dpid, frames, args.rate, record) for dpid in range(1, args.switches + 1)]
+
+    async def run_all():
+        await asyncio.gather(*[connect(switch, args.port, proc) for switch in switches])
+
+    try:
+        asyncio.run(run_all())
+        memory = peak_rss_mb(proc.pid)
+    except (RuntimeError, ConnectionError, asyncio.IncompleteReadError) as e:
+        with open(os.path.join(workdir, 'ryu.log')) as f:
+            print(f.read()[-2000:], file=sys.stderr)
+        print(f"{app}: {e}", file=sys.stderr)
+        return None
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sent = sum(len(switch.tails) for switch in switches)
+    latencies = [lat for switch in switches for lat in switch.latencies]
+    elapsed = (max(switch.last_received for switch in switches)
+               - min(switch.first_sent for switch in switches))
+    counts = {}
+    for switch in switches:
+        for msg_type, n in switch.counts.items():
+            counts[msg_type] = counts.get(msg_type, 0) + n
+    return {'sent': sent, 'answered': len(latencies), 'rate': sent / elapsed if elapsed else 0,
+            'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99),
+            'flow_mods': counts.get(ofp.OFPT_FLOW_MOD, 0),
+            'packet_outs': counts.get(ofp.OFPT_PACKET_OUT, 0), 'memory': memory}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the apps against emulated switches')
+    parser.add_argument('apps', nargs='*', help='App files, e.g. 6_mac_learning.py')
+    parser.add_argument('--all', action='store_true', help='Every OpenFlow app from 6 to 14')
+    parser.add_argument('--traffic', choices=sorted(TRAFFIC), default='normal')
+    parser.add_argument('--pcap', help='Replay this pcap file instead of generated traffic')
+    parser.add_argument('--packets', type=int, default=20000, help='Packet-ins per switch')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Packet-ins/s per switch (0 = as fast as possible)')
+    parser.add_argument('--switches', type=int, default=1)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--config-file', action='append', default=[],
+                        help='Passed to ryu-manager (repeatable)')
+    parser.add_argument('--record', help='CSV of the messages received during the replay')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    apps = ALL_APPS if args.all else args.apps
+    if not apps:
+        parser.error('name an app or use --all')
+    if args.pcap:
+        frames = pcap_traffic(args.pcap, args.packets)
+    else:
+        frames = TRAFFIC[args.traffic](random.Random(args.seed), args.packets)
+    record = [] if args.record else None
+
+    print(f"{'app':<34}{'sent':>8}{'answered':>10}{'pkt-in/s':>10}{'p50 ms':>9}"
+          f"{'p99 ms':>9}{'FlowMods':>10}{'PktOuts':>9}{'RSS MB':>8}")
+    for app in apps:
+        result = bench(app, frames, args, record)
+        if result is None:
+            continue
+        print(f"{app:<34}{result['sent']:>8}{result['answered']:>10}{result['rate']:>10.0f}"
+              f"{result['p50'] * 1e3:>9.2f}{result['p99'] * 1e3:>9.2f}"
+              f"{result['flow_mods']:>10}{result['packet_outs']:>9}{result['memory']:>8.1f}")
+        if record is not None:
+            with open(args.record, 'a') as f:
+                for now, dpid, name, buffer_id, length in record:
+                    f.write(f"{app},{now:.6f},{dpid},{name},{buffer_id},{length}\n")
+            record.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+import flow_features
+from flow_classifier import FlowClassifier
+
+# MICROBENCHMARK: online flow classification throughput per micro-batch size
+# Usage: python bench_inference.py
+# For each batch size prints the latency of one batch and the predictions/s, for the
+# model alone and for the full path the controller runs (features of table rows +
+# column selection + prediction). Uses a random linear model over the twelve features.
+
+FLOWS = 100000
+BATCH_SIZES = [1, 16, 64, 256, 1024, 4096]
+REPEAT = 0.5        # seconds spent per measurement
+
+
+def build_table():
+    table = flow_features.FlowFeatureTable(FLOWS)
+    rng = np.random.default_rng(0)
+    now = 0.0
+    for key in range(FLOWS):
+        for side in (0, 0, 1):
+            now += rng.random() * 0.01
+            table.add_packet(key, now, int(rng.integers(60, 1500)), side, 0x02, 6)
+    return table
+
+
+def build_model():
+    rng = np.random.default_rng(1)
+    n = len(flow_features.FEATURE_HEADER)
+    return FlowClassifier(flow_features.FEATURE_HEADER, rng.random(n), rng.random(n) + 0.5,
+                          rng.standard_normal(n), 0.0)
+
+
+def measure(fn, batch):
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < REPEAT:
+        fn()
+        calls += 1
+    per_batch = (time.perf_counter() - start) / calls
+    return per_batch, batch / per_batch
+
+
+def main():
+    table = build_table()
+    model = build_model()
+    rows = table.active_rows()
+    X = np.column_stack(table.features(rows)).astype(np.float64)
+
+    def full_path(batch_rows):
+        columns = table.features(batch_rows)
+        return model.predict(np.column_stack(columns).astype(np.float64))
+
+    print(f"{'batch':>6}{'predict/batch':>16}{'predictions/s':>16}"
+          f"{'full/batch':>14}{'flows/s':>14}")
+    for batch in BATCH_SIZES:
+        x, batch_rows = X[:batch], rows[:batch]
+        latency, rate = measure(lambda: model.predict(x), batch)
+        full_latency, full_rate = measure(lambda: full_path(batch_rows), batch)
+        print(f"{batch:>6}{latency * 1e6:>13.1f} us{rate:>16,.0f}"
+              f"{full_latency * 1e6:>11.1f} us{full_rate:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+import heapq
+import json
+import socket
+import struct
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import base_app
+import metrics
+import pipeline
+import table_sync
+
+# BLOCK MANAGER
+# Owns every drop rule the IDS apps install:
+#   - a block is pushed to ALL connected switches, not only the one that saw the attack
+#   - every drop rule has a hard timeout; controller state expires at the same time
+#   - a switch that (re)connects is first asked for the drop rules it still has
+#     (table_sync.py): only the missing ones are sent, and rules the controller does
+#     not know (installed before a restart) are adopted with their remaining time
+#   - a packet-in from a blocked host means the switch lost (or never got) the rule:
+#     the rule is re-sent to that switch so the traffic stops reaching the controller
+#   - drop rules live in the ACL table of the pipeline ([pipeline] config section), so
+#     adding or deleting one never touches a forwarding entry
+#   - checkpoints (checkpoint.py): one 'blocks' section, a fixed 32-byte record per
+#     block (expiry and the match fields), so blocked hosts stay blocked across restarts
+#   - in a cluster of controllers (cluster.py) blocks and unblocks are also written to
+#     the shared state store and every instance applies the others' to the switches it
+#     is master of: a host blocked anywhere is dropped everywhere. The writes are queued
+#     and made by the shared-blocks green thread, never in a packet-in handler
+#
+#   [block]
+#   hard_timeout = 300      # seconds a block lasts (0 = forever)
+#   priority = 100
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('hard_timeout', default=300,
+               help='Seconds a block lasts before it expires (0 = never)'),
+    cfg.IntOpt('priority', default=100,
+               help='Priority of drop rules, must be above every forwarding rule'),
+], group='block')
+
+# Cookie of every drop rule installed by the block manager
+BLOCK_COOKIE = 0xB10C000000000000
+
+# Don't re-send the same rule to the same switch more than once per second
+RESEND_INTERVAL = 1.0
+
+# State store table of the shared blocks: JSON block key -> expiry (None = unblocked)
+SHARED_TABLE = 'blocks'
+
+BLOCK_EVENTS = metrics.Counter('ryu_block_events_total',
+                               'Blocks added, removed, expired and re-sent to a switch',
+                               ['event'])
+
+
+# Checkpoint record of a block: expiry, fields present (KEY_* bits), eth_src, ipv4_src,
+# ipv4_dst, L4 source / destination port, ip_proto
+BLOCK_RECORD = struct.Struct('<dIQ4s4sHHB3x')
+KEY_ETH_SRC, KEY_IPV4, KEY_IPV4_SRC, KEY_IPV4_DST, KEY_PROTO, KEY_TCP, KEY_UDP = (
+    1 << i for i in range(7))
+
+
+def mac_match(mac):
+    return (('eth_src', mac),)
+
+
+def ipv4_match(ip):
+    return (('eth_type', 0x0800), ('ipv4_src', ip))
+
+
+def pack_key(key, expiry):
+    """BLOCK_RECORD of a block key; None if the key has other fields."""
+    fields = dict(key)
+    present = 0
+    eth_src = 0
+    ip_src = ip_dst = b'\0\0\0\0'
+    src_port = dst_port = proto = 0
+    for field, value in fields.items():
+        if field == 'eth_src':
+            present |= KEY_ETH_SRC
+            eth_src = int(value.replace(':', ''), 16)
+        elif field == 'eth_type' and value == 0x0800:
+            present |= KEY_IPV4
+        elif field == 'ipv4_src' and isinstance(value, str):
+            present |= KEY_IPV4_SRC
+            ip_src = socket.inet_aton(value)
+        elif field == 'ipv4_dst' and isinstance(value, str):
+            present |= KEY_IPV4_DST
+            ip_dst = socket.inet_aton(value)
+        elif field == 'ip_proto':
+            present |= KEY_PROTO
+            proto = value
+        elif field in ('tcp_src', 'udp_src'):
+            present |= KEY_TCP if field == 'tcp_src' else KEY_UDP
+            src_port = value
+        elif field in ('tcp_dst', 'udp_dst'):
+            present |= KEY_TCP if field == 'tcp_dst' else KEY_UDP
+            dst_port = value
+        else:
+            return None
+    return BLOCK_RECORD.pack(expiry, present, eth_src, ip_src, ip_dst, src_port, dst_port, proto)
+
+
+def unpack_key(record):
+    """(key, expiry) of a BLOCK_RECORD."""
+    expiry, present, eth_src, ip_src, ip_dst, src_port, dst_port, proto = BLOCK_RECORD.unpack(record)
+    fields = {}
+    if present & KEY_ETH_SRC:
+        fields['eth_src'] = ':'.join(f'{b:02x}' for b in eth_src.to_bytes(6, 'big'))
+    if present & KEY_IPV4:
+        fields['eth_type'] = 0x0800
+    if present & KEY_IPV4_SRC:
+        fields['ipv4_src'] = socket.inet_ntoa(ip_src)
+    if present & KEY_IPV4_DST:
+        fields['ipv4_dst'] = socket.inet_ntoa(ip_dst)
+    if present & KEY_PROTO:
+        fields['ip_proto'] = proto
+    for bit, l4 in ((KEY_TCP, 'tcp'), (KEY_UDP, 'udp')):
+        if present & bit:
+            fields[l4 + '_src'], fields[l4 + '_dst'] = src_port, dst_port
+    return tuple(sorted(fields.items())), expiry
+
+
+def store_key(key):
+    return json.dumps(key)
+
+
+def from_store_key(text):
+    return tuple((field, tuple(value) if isinstance(value, list) else value)
+                 for field, value in json.loads(text))
+
+
+class BlockManager(object):
+    def __init__(self, logger, hard_timeout=None, priority=None, cluster=None):
+        self.logger = logger
+        self.hard_timeout = CONF.block.hard_timeout if hard_timeout is None else hard_timeout
+        self.priority = CONF.block.priority if priority is None else priority
+
+        self.datapaths = {}         # dpid -> datapath
+        # A block key is the match as a sorted tuple of (field, value) pairs,
+        # e.g. (('eth_src', '00:00:00:00:00:03'),)
+        self.blocks = {}            # key -> expiry time (0 = never)
+        self.expiry_heap = []       # (expiry, key), lazily cleaned
+        self.last_resend = {}       # (dpid, key) -> time of last re-send
+
+        metrics.Gauge('ryu_blocks_active', 'Hosts/flows currently blocked',
+                      fn=lambda: len(self.blocks))
+        self.expire_thread = hub.spawn(self._expire_loop)
+        # Drop rules a (re)connecting switch still has
+        self.sync = table_sync.TableSync(logger, self._synced, BLOCK_COOKIE,
+                                         0xFFFFFFFFFFFFFFFF, pipeline.table(pipeline.ACL))
+        # Blocks of the other controller instances
+        self.store = None
+        if cluster is not None and cluster.enabled:
+            self.store = cluster.store
+            self.store_version = 0
+            self.outbox = {}        # JSON block key -> expiry (None = unblocked), not written yet
+            self.sync_interval = cluster.sync_interval
+            self.shared_thread = hub.spawn(self._shared_loop)
+
+    # --- SWITCH TRACKING ---
+
+    def add_datapath(self, datapath):
+        self.datapaths[datapath.id] = datapath
+        self.sync.add_datapath(datapath)
+
+    def remove_datapath(self, datapath):
+        self.datapaths.pop(datapath.id, None)
+        self.sync.remove_datapath(datapath)
+
+    def stats_reply(self, msg):
+        """EventOFPFlowStatsReply from the app; True if it was the block sync's."""
+        return self.sync.reply(msg)
+
+    def _synced(self, datapath, stats):
+        # The switch's drop rules (None: it did not answer, assume it has none)
+        now = time.time()
+        installed = set()
+        adopted = []
+        for stat in stats or ():
+            if stat.priority != self.priority:
+                continue
+            key = tuple(sorted(stat.match.items()))
+            installed.add(key)
+            if key in self.blocks:
+                continue
+            # Installed before a restart and not in the checkpoint: keep it
+            expiry = now + stat.hard_timeout - stat.duration_sec if stat.hard_timeout else 0
+            if not expiry or expiry > now:
+                self.blocks[key] = expiry
+                if expiry:
+                    heapq.heappush(self.expiry_heap, (expiry, key))
+                adopted.append(key)
+        # Missing rules, in bursts: a switch coming back may need thousands of them
+        mods = [self._drop_mod(datapath, key, self._remaining(expiry, now))
+                for key, expiry in self.blocks.items()
+                if key not in installed and (not expiry or expiry > now)]
+        if mods:
+            base_app.send_burst(datapath, mods)
+        if adopted:
+            # Blocks go to every switch, adopted ones included
+            for other in self.datapaths.values():
+                if other.id != datapath.id:
+                    base_app.send_burst(other, [
+                        self._drop_mod(other, key, self._remaining(self.blocks[key], now))
+                        for key in adopted])
+        self.logger.info(f"[BLOCK] switch {datapath.id}: {len(installed)} drop rules kept"
+                         f" ({len(adopted)} adopted), {len(mods)} re-sent")
+
+    # --- BLOCKING ---
+
+    def block(self, key, hard_timeout=None):
+        hard_timeout = self.hard_timeout if hard_timeout is None else hard_timeout
+        expiry = time.time() + hard_timeout if hard_timeout else 0
+        self._add_block(key, expiry, hard_timeout)
+        if self.store is not None:
+            self.outbox[store_key(key)] = expiry
+
+    def _add_block(self, key, expiry, hard_timeout):
+        self.blocks[key] = expiry
+        BLOCK_EVENTS.inc(labels=('block',))
+        if expiry:
+            heapq.heappush(self.expiry_heap, (expiry, key))
+
+        # Longer blocks than the 16-bit hard_timeout are repaired from the
+        # packet-in path (check_packet_in) once the switch drops the rule
+        for datapath in self.datapaths.values():
+            self._send_drop(datapath, key, min(0xFFFF, hard_timeout))
+        self.logger.info(f"[BLOCK] {dict(key)} blocked on {len(self.datapaths)} switch(es)"
+                         f" for {hard_timeout or 'unlimited'}s")
+
+    def block_mac(self, mac, hard_timeout=None):
+        self.block(mac_match(mac), hard_timeout)
+
+    def block_ip(self, ip, hard_timeout=None):
+        self.block(ipv4_match(ip), hard_timeout)
+
+    def is_blocked(self, key):
+        expiry = self.blocks.get(key)
+        if expiry is None:
+            return False
+        if expiry and expiry <= time.time():
+            del self.blocks[key]
+            return False
+        return True
+
+    def is_ip_blocked(self, ip):
+        return self.is_blocked(ipv4_match(ip))
+
+    def check_packet_in(self, datapath, key):
+        """Call from the packet-in handler. Returns True (and repairs the switch)
+        if the packet belongs to a blocked key and must be ignored."""
+        if not self.is_blocked(key):
+            return False
+        now = time.time()
+        last = self.last_resend.get((datapath.id, key), 0)
+        if now - last >= RESEND_INTERVAL:
+            self.last_resend[(datapath.id, key)] = now
+            BLOCK_EVENTS.inc(labels=('resend',))
+            self._send_drop(datapath, key, self._remaining(self.blocks[key], now))
+        return True
+
+    def unblock(self, key):
+        if self.blocks.pop(key, None) is None:
+            return
+        BLOCK_EVENTS.inc(labels=('unblock',))
+        for datapath in self.datapaths.values():
+            self._delete_drop(datapath, key)
+        if self.store is not None:
+            self.outbox[store_key(key)] = None
+
+    # --- SHARED BLOCKS (cluster) ---
+
+    def _shared_loop(self):
+        while True:
+            hub.sleep(self.sync_interval)
+            try:
+                self._publish()
+                self.store_version, changes = self.store.changes(SHARED_TABLE, self.store_version)
+            except Exception as e:          # store busy or unreachable: try again later
+                self.logger.warning(f"[BLOCK] state store: {e}")
+                continue
+            now = time.time()
+            for text, expiry in changes:
+                key = from_store_key(text)
+                if expiry is None:
+                    if self.blocks.pop(key, None) is not None:
+                        BLOCK_EVENTS.inc(labels=('unblock',))
+                        for datapath in self.datapaths.values():
+                            self._delete_drop(datapath, key)
+                elif self.blocks.get(key) != expiry and (not expiry or expiry > now):
+                    # Our own writes come back with the expiry we already have
+                    self._add_block(key, expiry, self._remaining(expiry, now))
+
+    def _publish(self):
+        outbox, self.outbox = self.outbox, {}
+        try:
+            while outbox:
+                text, expiry = next(iter(outbox.items()))
+                self.store.set(SHARED_TABLE, text, expiry, expiry or 0)
+                del outbox[text]
+        finally:
+            # Not written (store error): next time, unless changed meanwhile
+            outbox.update(self.outbox)
+            self.outbox = outbox
+
+    # --- FLOW MODS ---
+
+    def _drop_mod(self, datapath, key, hard_timeout):
+        parser = datapath.ofproto_parser
+        return parser.OFPFlowMod(datapath=datapath,
+                                 table_id=pipeline.table(pipeline.ACL),
+                                 cookie=BLOCK_COOKIE,
+                                 priority=self.priority,
+                                 hard_timeout=hard_timeout,
+                                 match=parser.OFPMatch(**dict(key)),
+                                 instructions=[])       # No instructions = DROP
+
+    def _send_drop(self, datapath, key, hard_timeout):
+        datapath.send_msg(self._drop_mod(datapath, key, hard_timeout))
+
+    def _delete_drop(self, datapath, key):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(datapath=datapath,
+                                table_id=pipeline.table(pipeline.ACL),
+                                cookie=BLOCK_COOKIE,
+                                cookie_mask=0xFFFFFFFFFFFFFFFF,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                priority=self.priority,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                match=parser.OFPMatch(**dict(key)))
+        datapath.send_msg(mod)
+
+    # --- CHECKPOINTS ---
+
+    def checkpoint_sections(self):
+        records = (pack_key(key, expiry) for key, expiry in self.blocks.items())
+        return {'': (BLOCK_RECORD.size, b''.join(r for r in records if r is not None))}
+
+    def restore_sections(self, sections):
+        size, view = sections.get('', (0, b''))
+        if size != BLOCK_RECORD.size:
+            return
+        now = time.time()
+        for offset in range(0, len(view), size):
+            key, expiry = unpack_key(view[offset:offset + size])
+            if expiry and expiry <= now:
+                continue
+            self.blocks[key] = expiry
+            if expiry:
+                heapq.heappush(self.expiry_heap, (expiry, key))
+        self.logger.info(f"[BLOCK] {len(self.blocks)} blocks restored")
+
+    @staticmethod
+    def _remaining(expiry, now):
+        # hard_timeout is a 16-bit whole number of seconds; round up so the
+        # switch never drops the rule before the controller forgets the block
+        if not expiry:
+            return 0
+        return min(0xFFFF, max(1, int(expiry - now + 0.999)))
+
+    # --- EXPIRY ---
+
+    def _expire_loop(self):
+        while True:
+            hub.sleep(1)
+            now = time.time()
+            heap = self.expiry_heap
+            while heap and heap[0][0] <= now:
+                expiry, key = heapq.heappop(heap)
+                # Skip stale heap entries (block renewed or removed since)
+                if self.blocks.get(key) == expiry:
+                    del self.blocks[key]
+                    BLOCK_EVENTS.inc(labels=('expire',))
+                    self.logger.info(f"[BLOCK] {dict(key)} expired")
+            if self.last_resend:
+                self.last_resend = {k: t for k, t in self.last_resend.items()
+                                    if k[1] in self.blocks}
@@ -0,0 +1,313 @@
+import ipaddress
+import os
+import re
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import base_app
+import block_manager
+import metrics
+import pipeline
+
+# BLOCKLIST
+# Static drop rules from threat-intel list files, tens of thousands of entries:
+#   files        one entry per line: an IPv4 address, an IPv4 CIDR or a MAC address;
+#                '#' starts a comment. Each file is re-read only when its mtime or size
+#                changes; a file that disappears keeps its last contents
+#   aggregation  the IPv4 entries of all files are collapsed into the smallest set of
+#                prefixes covering them (adjacent and nested prefixes merge), one drop
+#                rule (match ipv4_src/mask) per prefix
+#   diff         per switch the controller knows which rules are installed: a reload
+#                only deletes the rules that left the list and adds the new ones. A
+#                (re)connecting switch is first asked for its blocklist entries (flow
+#                stats on the cookie), so rules it kept are not sent again
+#   pacing       FlowMods go out in batches of batch_size, deletes first, each batch
+#                followed by a barrier; the next batch waits for the barrier reply
+#                (or barrier_timeout), so a big list never floods the switch's queue
+# Rules are in the ACL table of the pipeline, above the block manager's dynamic blocks,
+# under their own cookie: neither list touches the other's rules.
+# The app forwards EventOFPFlowStatsReply to stats_reply() and EventOFPBarrierReply to
+# barrier_reply().
+#
+#   [blocklist]
+#   files =                     # comma-separated list files
+#   reload_interval = 5         # seconds between checks for changed files, 0 = load once
+#   batch_size = 1000           # FlowMods per barrier
+#   barrier_timeout = 5
+#   priority = 110              # above [block] priority
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.ListOpt('files', default=[],
+                help='Blocklist files: IPv4 addresses, IPv4 CIDRs and MACs, one per line'),
+    cfg.FloatOpt('reload_interval', default=5.0,
+                 help='Seconds between two checks for changed files (0 = load once)'),
+    cfg.IntOpt('batch_size', default=1000,
+               help='FlowMods sent to a switch before waiting for a barrier reply'),
+    cfg.FloatOpt('barrier_timeout', default=5.0,
+                 help='Seconds to wait for a barrier reply before the next batch'),
+    cfg.IntOpt('priority', default=110,
+               help='Priority of blocklist drop rules'),
+], group='blocklist')
+
+# Cookie of every blocklist drop rule
+BLOCKLIST_COOKIE = 0xB1C0000000000000
+
+TICK = 0.05                 # pacing resolution (seconds)
+SYNC_TIMEOUT = 10.0         # seconds to wait for a switch's installed rules
+PARSE_YIELD = 2000          # lines parsed between two yields to the other threads
+
+_MAC = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){5}$')
+
+
+def parse_file(path):
+    """(set of MACs, list of IPv4Network) from a blocklist file."""
+    macs = set()
+    networks = []
+    bad = 0
+    with open(path) as f:
+        for n, line in enumerate(f):
+            if n % PARSE_YIELD == 0:
+                hub.sleep(0)
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            if _MAC.match(entry.lower()):
+                macs.add(entry.lower())
+                continue
+            try:
+                networks.append(ipaddress.IPv4Network(entry, strict=False))
+            except ValueError:
+                bad += 1
+    return macs, networks, bad
+
+
+def rule_key(network):
+    """block_manager-style key of the drop rule for an IPv4Network."""
+    if network.prefixlen == 32:
+        return block_manager.ipv4_match(str(network.network_address))
+    return block_manager.ipv4_match((str(network.network_address), str(network.netmask)))
+
+
+def match_key(match):
+    """Key of an installed rule from the match a switch reports."""
+    fields = dict(match.items())
+    ip = fields.get('ipv4_src')
+    if isinstance(ip, tuple) and ip[1] == '255.255.255.255':
+        fields['ipv4_src'] = ip[0]
+    return tuple(sorted(fields.items()))
+
+
+class _SwitchState(object):
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.installed = None       # keys of the rules on the switch, None until synced
+        self.adds = []              # keys still to add / delete
+        self.deletes = []
+        self.sync_xid = None        # outstanding flow stats request
+        self.sync_parts = []
+        self.barrier_xid = None     # outstanding barrier after a batch
+        self.sent_at = 0
+
+
+class Blocklist(object):
+    def __init__(self, logger, files=None):
+        conf = CONF.blocklist
+        self.logger = logger
+        self.paths = files if files is not None else conf.files
+        self.reload_interval = conf.reload_interval
+        self.batch_size = conf.batch_size
+        self.barrier_timeout = conf.barrier_timeout
+        self.priority = conf.priority
+
+        self.loaded = {}            # path -> ((mtime, size), macs, networks)
+        self.rules = set()          # keys of the drop rules every switch should have
+        self.switches = {}          # dpid -> _SwitchState
+        self.reloads = 0
+        self.flow_mods = 0
+
+        metrics.Gauge('ryu_blocklist_rules', 'Drop rules in the aggregated blocklist',
+                      fn=lambda: len(self.rules))
+        metrics.Gauge('ryu_blocklist_pending', 'Blocklist FlowMods not sent yet',
+                      fn=lambda: sum(len(s.adds) + len(s.deletes)
+                                     for s in self.switches.values()))
+        metrics.Counter('ryu_blocklist_reloads_total', 'Blocklist changes loaded',
+                        fn=lambda: self.reloads)
+        metrics.Counter('ryu_blocklist_flow_mods_total', 'Blocklist FlowMods sent',
+                        fn=lambda: self.flow_mods)
+
+        self.reload()
+        self.send_thread = hub.spawn(self._send_loop)
+        if self.reload_interval:
+            self.reload_thread = hub.spawn(self._reload_loop)
+
+    # --- LOADING ---
+
+    def reload(self):
+        """Re-read the files that changed; True if the rule set changed."""
+        changed = False
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                old = self.loaded.get(path)
+                if old is None or old[0] is not None:       # warn once
+                    self.logger.warning(f"[BLOCKLIST] {path}: {e}, keeping its last contents")
+                    self.loaded[path] = (None,) + (old[1:] if old else (set(), []))
+                continue
+            signature = (st.st_mtime_ns, st.st_size)
+            if path in self.loaded and self.loaded[path][0] == signature:
+                continue
+            try:
+                macs, networks, bad = parse_file(path)
+            except (OSError, UnicodeDecodeError) as e:
+                self.logger.warning(f"[BLOCKLIST] {path}: {e}, keeping its last contents")
+                continue
+            if bad:
+                self.logger.warning(f"[BLOCKLIST] {path}: {bad} unusable line(s) skipped")
+            self.loaded[path] = (signature, macs, networks)
+            changed = True
+        if not changed:
+            return False
+
+        macs = set()
+        networks = []
+        for _, file_macs, file_networks in self.loaded.values():
+            macs |= file_macs
+            networks.extend(file_networks)
+        rules = {block_manager.mac_match(mac) for mac in macs}
+        rules.update(rule_key(network) for network in ipaddress.collapse_addresses(networks))
+        if rules == self.rules:
+            return False
+        added = len(rules - self.rules)
+        removed = len(self.rules - rules)
+        self.rules = rules
+        self.reloads += 1
+        self.logger.info(f"[BLOCKLIST] {len(macs) + len(networks)} entries -> {len(rules)}"
+                         f" rules (+{added} -{removed})")
+        for state in self.switches.values():
+            self._plan(state)
+        return True
+
+    def _reload_loop(self):
+        while True:
+            hub.sleep(self.reload_interval)
+            self.reload()
+
+    # --- SWITCH TRACKING ---
+
+    def add_datapath(self, datapath):
+        """Ask the switch which blocklist rules it still has; the diff is sent once
+        it answers (or after SYNC_TIMEOUT, as if it had none)."""
+        state = self.switches[datapath.id] = _SwitchState(datapath)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        req = parser.OFPFlowStatsRequest(datapath, 0, pipeline.table(pipeline.ACL),
+                                         ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                         BLOCKLIST_COOKIE, 0xFFFFFFFFFFFFFFFF,
+                                         parser.OFPMatch())
+        if datapath.send_msg(req):
+            state.sync_xid = req.xid
+            state.sent_at = time.time()
+        else:
+            self._synced(state, set())
+
+    def remove_datapath(self, datapath):
+        self.switches.pop(datapath.id, None)
+
+    def stats_reply(self, msg):
+        state = self.switches.get(msg.datapath.id)
+        if state is None or msg.xid != state.sync_xid:
+            return
+        state.sync_parts.extend(match_key(stat.match) for stat in msg.body
+                                if stat.priority == self.priority)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return
+        self._synced(state, set(state.sync_parts))
+
+    def _synced(self, state, installed):
+        state.sync_xid = None
+        state.sync_parts = []
+        state.installed = installed
+        self._plan(state)
+        self.logger.info(f"[BLOCKLIST] switch {state.datapath.id}: {len(installed)} rules"
+                         f" installed, {len(state.adds)} to add, {len(state.deletes)} to delete")
+
+    def _plan(self, state):
+        if state.installed is None:
+            return                  # not synced yet, planned once it is
+        state.adds = list(self.rules - state.installed)
+        state.deletes = list(state.installed - self.rules)
+
+    # --- PACED SENDING ---
+
+    def barrier_reply(self, msg):
+        state = self.switches.get(msg.datapath.id)
+        if state is not None and msg.xid == state.barrier_xid:
+            state.barrier_xid = None
+            if state.adds or state.deletes:
+                self._send_batch(state, time.time())    # no need to wait for the tick
+
+    def _send_loop(self):
+        while True:
+            hub.sleep(TICK)
+            now = time.time()
+            for state in list(self.switches.values()):
+                if state.sync_xid is not None:
+                    if now - state.sent_at > SYNC_TIMEOUT:
+                        self.logger.warning(f"[BLOCKLIST] switch {state.datapath.id}: no flow"
+                                            f" stats after {SYNC_TIMEOUT}s, sending all rules")
+                        self._synced(state, set())
+                    continue
+                if state.barrier_xid is not None:
+                    if now - state.sent_at < self.barrier_timeout:
+                        continue
+                    self.logger.warning(f"[BLOCKLIST] switch {state.datapath.id}: no barrier"
+                                        f" reply after {self.barrier_timeout}s")
+                    state.barrier_xid = None
+                if state.adds or state.deletes:
+                    self._send_batch(state, now)
+
+    def _send_batch(self, state, now):
+        datapath = state.datapath
+        mods = []
+        while state.deletes and len(mods) < self.batch_size:
+            key = state.deletes.pop()
+            state.installed.discard(key)
+            mods.append(self._delete_mod(datapath, key))
+        while state.adds and len(mods) < self.batch_size:
+            key = state.adds.pop()
+            state.installed.add(key)
+            mods.append(self._drop_mod(datapath, key))
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        mods.append(barrier)
+        base_app.send_burst(datapath, mods)     # Sets barrier.xid
+        state.barrier_xid = barrier.xid
+        state.sent_at = now
+        self.flow_mods += len(mods) - 1
+
+    # --- FLOW MODS ---
+
+    def _drop_mod(self, datapath, key):
+        parser = datapath.ofproto_parser
+        return parser.OFPFlowMod(datapath=datapath,
+                                 table_id=pipeline.table(pipeline.ACL),
+                                 cookie=BLOCKLIST_COOKIE,
+                                 priority=self.priority,
+                                 match=parser.OFPMatch(**dict(key)),
+                                 instructions=[])       # No instructions = DROP
+
+    def _delete_mod(self, datapath, key):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        return parser.OFPFlowMod(datapath=datapath,
+                                 table_id=pipeline.table(pipeline.ACL),
+                                 cookie=BLOCKLIST_COOKIE,
+                                 cookie_mask=0xFFFFFFFFFFFFFFFF,
+                                 command=ofproto.OFPFC_DELETE_STRICT,
+                                 priority=self.priority,
+                                 out_port=ofproto.OFPP_ANY,
+                                 out_group=ofproto.OFPG_ANY,
+                                 match=parser.OFPMatch(**dict(key)))
@@ -0,0 +1,235 @@
+from array import array
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+try:
+    from eventlet import patcher, tpool     # real OS threads for the file writes
+    _threading = patcher.original('threading')
+except ImportError:
+    tpool = None
+    _threading = threading
+
+from ryu import cfg
+from ryu.lib import hub
+
+import metrics
+
+# CHECKPOINTS
+# Detection and learning state survives a controller restart:
+#   sections     each stateful component (MAC table, block manager, rate detectors, flow
+#                table, ...) hands out its state as named sections of fixed-size
+#                little-endian records: checkpoint_sections() -> {suffix: (record size,
+#                bytes)}, and takes them back with restore_sections({suffix: (record
+#                size, memoryview)})
+#   files        one file per section, <directory>/<app>.<component>[.<suffix>].ckpt:
+#                a 24-byte header (magic, version, record size, record count, time
+#                written), then the records back to back. Loading mmaps the file and
+#                the component reads the records in place (np.frombuffer, array)
+#   incremental  every interval seconds each section is serialized and compared (CRC32)
+#                with what was last written; only changed sections are rewritten, each
+#                through a temp file + rename (a crash never leaves half a section).
+#                Sections that are gone (e.g. a forgotten switch) are deleted
+#   off the hub  serializing is a copy of the components' state, taken on the hub so it
+#                is consistent; the CRCs, writes, fsyncs and renames run in a real OS
+#                thread (eventlet tpool), so a big flow table never stalls packet-ins
+#   warm start   restore() once at app start, before the first switch connects:
+#                checkpoints older than max_age are ignored. Switches keep their flow
+#                tables; the components that own entries reconcile them with flow
+#                stats (table_sync.py) instead of re-sending everything
+#
+#   [checkpoint]
+#   directory =                 # empty = no checkpoints
+#   interval = 10
+#   max_age = 3600              # seconds
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('directory', default='',
+               help='Directory of the state checkpoints (empty = no checkpoints)'),
+    cfg.FloatOpt('interval', default=10.0,
+                 help='Seconds between two checkpoints'),
+    cfg.FloatOpt('max_age', default=3600.0,
+                 help='Checkpoints older than this many seconds are not restored'),
+], group='checkpoint')
+
+MAGIC = b'RCKP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQd')       # magic, version, record size, count, time written
+SUFFIX = '.ckpt'
+
+
+def u64_bytes(values):
+    """Little-endian uint64 records from an iterable of ints."""
+    records = array('Q', values)
+    if sys.byteorder == 'big':
+        records.byteswap()
+    return records.tobytes()
+
+
+def u64_array(view):
+    """array('Q') from little-endian uint64 records."""
+    records = array('Q')
+    records.frombytes(view)
+    if sys.byteorder == 'big':
+        records.byteswap()
+    return records
+
+
+class Checkpoint(object):
+    def __init__(self, logger, app, components):
+        """components: {name: object with checkpoint_sections() / restore_sections()},
+        restored in that order."""
+        conf = CONF.checkpoint
+        self.logger = logger
+        self.app = app
+        self.components = components
+        self.directory = conf.directory
+        self.interval = conf.interval
+        self.max_age = conf.max_age
+
+        self.written = {}               # file name -> CRC32 of the records last written
+        self.lock = _threading.Lock()   # one writer at a time (loop, close)
+        self.thread = None
+        self.writes = 0
+        self.bytes = 0
+        self.enabled = bool(self.directory)
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        metrics.Counter('ryu_checkpoint_sections_written_total',
+                        'Checkpoint sections rewritten because they changed',
+                        fn=lambda: self.writes)
+        metrics.Counter('ryu_checkpoint_bytes_written_total', 'Checkpoint bytes written',
+                        fn=lambda: self.bytes)
+
+    def start(self):
+        """restore(), then checkpoint every interval seconds."""
+        if not self.enabled:
+            return
+        self.restore()
+        self.thread = hub.spawn(self._loop)
+
+    def close(self):
+        """Last checkpoint, on shutdown."""
+        if not self.enabled:
+            return
+        if self.thread is not None:
+            hub.kill(self.thread)       # a write in flight finishes first (lock)
+            self.thread = None
+        self.save()
+
+    # --- WRITING ---
+
+    def _loop(self):
+        while True:
+            hub.sleep(self.interval)
+            try:
+                self.save()
+            except OSError as e:
+                self.logger.error(f"[CHECKPOINT] {e}")
+
+    def save(self):
+        now = time.time()
+        sections = {}                   # file name -> (record size, bytes)
+        for name, component in self.components.items():
+            for suffix, section in component.checkpoint_sections().items():
+                sections[self._file_name(name, suffix)] = section
+        if tpool is not None:
+            tpool.execute(self._write_changed, sections, now)
+        else:
+            self._write_changed(sections, now)
+
+    def _write_changed(self, sections, now):
+        with self.lock:
+            for file_name, (size, data) in sections.items():
+                crc = zlib.crc32(data)
+                if self.written.get(file_name) == crc:
+                    continue
+                self._write(file_name, size, data, now)
+                self.written[file_name] = crc
+            for file_name in [f for f in self.written if f not in sections]:
+                del self.written[file_name]
+                try:
+                    os.unlink(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+
+    def _write(self, file_name, size, data, now):
+        path = os.path.join(self.directory, file_name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, size, len(data) // size if size else 0, now))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.writes += 1
+        self.bytes += HEADER.size + len(data)
+
+    def _file_name(self, name, suffix):
+        return f"{self.app}.{name}.{suffix}{SUFFIX}" if suffix else f"{self.app}.{name}{SUFFIX}"
+
+    # --- WARM START ---
+
+    def restore(self):
+        start = time.time()
+        prefix = self.app + '.'
+        found = {}                      # component name -> {suffix: file name}
+        for file_name in sorted(os.listdir(self.directory)):
+            if not (file_name.startswith(prefix) and file_name.endswith(SUFFIX)):
+                continue
+            name, _, suffix = file_name[len(prefix):-len(SUFFIX)].partition('.')
+            if name in self.components:
+                found.setdefault(name, {})[suffix] = file_name
+        if not found:
+            self.logger.info(f"[CHECKPOINT] nothing to restore in {self.directory}, cold start")
+            return
+
+        restored = 0
+        for name, component in self.components.items():
+            maps = []
+            sections = {}
+            for suffix, file_name in found.get(name, {}).items():
+                loaded = self._map(file_name, start)
+                if loaded is None:
+                    continue
+                maps.append(loaded[0])
+                sections[suffix] = loaded[1:]
+                # Unchanged sections are not rewritten by the first save()
+                self.written[file_name] = zlib.crc32(loaded[2])
+            if not sections:
+                continue
+            try:
+                component.restore_sections(sections)
+                restored += len(sections)
+            finally:
+                for view in sections.values():
+                    view[1].release()
+                for mapped in maps:
+                    mapped.close()
+        self.logger.info(f"[CHECKPOINT] warm start: {restored} section(s) restored in"
+                         f" {time.time() - start:.2f}s")
+
+    def _map(self, file_name, now):
+        path = os.path.join(self.directory, file_name)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                self.logger.warning(f"[CHECKPOINT] {file_name}: truncated, skipped")
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, count, written = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION or HEADER.size + size * count != len(mapped):
+            self.logger.warning(f"[CHECKPOINT] {file_name}: not a version {VERSION}"
+                                f" checkpoint or truncated, skipped")
+            mapped.close()
+            return None
+        if now - written > self.max_age:
+            self.logger.info(f"[CHECKPOINT] {file_name}: {now - written:.0f}s old, skipped")
+            mapped.close()
+            return None
+        return mapped, size, memoryview(mapped)[HEADER.size:]
@@ -0,0 +1,230 @@
+import time
+import zlib
+
+from ryu import cfg
+from ryu.lib import hub
+
+import detectors
+import metrics
+import state_store
+
+# CONTROLLER CLUSTER
+# Several controller instances run the same app; every switch connects to all of them
+# (ovs-vsctl set-controller br0 tcp:ctl1:6653 tcp:ctl2:6653 ...):
+#   membership   each instance writes a heartbeat into the shared state store
+#                (state_store.py) every heartbeat seconds; an instance silent for
+#                dead_after seconds is gone
+#   roles        each switch has one master among the live instances, the others are
+#                slaves (OFPRoleRequest). A slave gets no packet-ins and cannot modify
+#                the switch, so packet-in handling is split across the instances
+#                  shard    switches spread over all live instances (rendezvous hashing
+#                           on instance name and dpid: an instance leaving or joining
+#                           only moves its own share)
+#                  standby  every switch on the first live instance (name order); the
+#                           others take over when it stops
+#                Master claims carry a generation id from the store, so a switch never
+#                goes back to an instance that lost it
+#   failover     membership is re-checked every heartbeat: the switches of a dead
+#                instance get a new master, which installs its table-miss and blocks
+#                (BaseApp.add_datapath) and reconciles the switch's entries
+#                (table_sync.py) instead of wiping them
+#   shared state blocks (block_manager.py) and detector counts (detectors.SharedDetector)
+#                go through the store, so a host blocked by one instance is dropped on
+#                every switch and a host's rate is its total over the instances
+# With no instance name this is a single controller: every switch that connects is
+# managed (no role requests) and nothing is shared, as before.
+# Not shared: MAC tables, flow tables and the collectors' datasets (each instance
+# writes the flows of its own switches). Topology discovery (15) needs packet-outs on
+# every switch: use mode = standby. Each instance that runs Snort mitigation (12) needs
+# its own [snort] socket_path; the alerts of all of them block everywhere.
+#
+#   [cluster]
+#   instance =                  # this controller's name, unique; empty = single controller
+#   mode = shard                # shard or standby
+#   store = memory              # memory[:name] or sqlite:<path> (state_store.py)
+#   heartbeat = 1.0
+#   dead_after = 3.0
+#   sync_interval = 0.5         # seconds between two reads of the shared state
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('instance', default='',
+               help='Name of this controller instance (empty = single controller)'),
+    cfg.StrOpt('mode', default='shard',
+               help='shard (switches spread over the instances) or standby (all on one)'),
+    cfg.StrOpt('store', default='memory',
+               help='Shared state store: memory[:name] or sqlite:<path>'),
+    cfg.FloatOpt('heartbeat', default=1.0,
+                 help='Seconds between two heartbeats of this instance'),
+    cfg.FloatOpt('dead_after', default=3.0,
+                 help='An instance without heartbeat for this many seconds is gone'),
+    cfg.FloatOpt('sync_interval', default=0.5,
+                 help='Seconds between two reads of the shared blocks and counts'),
+], group='cluster')
+
+INSTANCES = 'instances'         # store table: instance name -> last heartbeat
+GENERATIONS = 'generation'      # store table: dpid -> role generation id
+ROLE_RETRY = 2.0                # seconds before an unanswered role request is sent again
+
+
+class Cluster(object):
+    def __init__(self, logger, on_role):
+        """on_role(datapath, master) whenever this instance starts (True) or stops
+        (False) managing a switch."""
+        conf = CONF.cluster
+        self.logger = logger
+        self.on_role = on_role
+        self.instance = conf.instance
+        self.mode = conf.mode
+        self.heartbeat = conf.heartbeat
+        self.dead_after = conf.dead_after
+        self.sync_interval = conf.sync_interval
+
+        self.datapaths = {}         # dpid -> connected datapath
+        self.roles = {}             # dpid -> True (master) / False (slave), as confirmed
+        self.pending = {}           # dpid -> (xid, master, sent at) of the role request
+        self.live = [self.instance]
+        self.role_changes = 0
+        self.enabled = bool(self.instance)
+        if not self.enabled:
+            self.store = None
+            return
+        if self.mode not in ('shard', 'standby'):
+            raise ValueError(f"Unknown cluster mode: {self.mode}")
+        self.store = state_store.open_store(conf.store)
+
+        metrics.Gauge('ryu_cluster_instances', 'Live controller instances',
+                      fn=lambda: len(self.live))
+        metrics.Gauge('ryu_cluster_master_switches', 'Switches this instance is master of',
+                      fn=lambda: sum(self.roles.values()))
+        metrics.Counter('ryu_cluster_role_changes_total', 'Master/slave changes of this instance',
+                        fn=lambda: self.role_changes)
+        self._beat()
+        self.logger.info(f"[CLUSTER] instance {self.instance} ({self.mode}),"
+                         f" live: {', '.join(self.live)}")
+        self.thread = hub.spawn(self._heartbeat_loop)
+
+    def close(self):
+        """Stop the heartbeat and leave: the others take over without waiting dead_after."""
+        if not self.enabled:
+            return
+        hub.kill(self.thread)
+        try:
+            self.store.set(INSTANCES, self.instance, None)
+        except Exception as e:          # store busy or unreachable: we time out instead
+            self.logger.warning(f"[CLUSTER] state store: {e}")
+
+    def share(self, detector, name):
+        """`detector` with its counts summed over the instances (unchanged when single)."""
+        if not self.enabled:
+            return detector
+        return detectors.SharedDetector(detector, self.store, name, self.instance,
+                                        self.sync_interval, self.logger)
+
+    # --- SWITCHES ---
+
+    def add_datapath(self, datapath):
+        if not self.enabled:
+            self.on_role(datapath, True)
+            return
+        self.datapaths[datapath.id] = datapath
+        # Off the event loop: the role request waits for the store
+        hub.spawn(self._assign, datapath, time.time())
+
+    def remove_datapath(self, datapath):
+        if not self.enabled:
+            self.on_role(datapath, False)
+            return
+        self.datapaths.pop(datapath.id, None)
+        self.pending.pop(datapath.id, None)
+        if self.roles.pop(datapath.id, False):
+            self.on_role(datapath, False)
+
+    def owner(self, dpid):
+        """Instance that should be the master of `dpid`."""
+        if self.mode == 'standby':
+            return self.live[0]
+        return max(self.live, key=lambda name: zlib.crc32(f'{name}/{dpid}'.encode()))
+
+    def _assign(self, datapath, now):
+        master = self.owner(datapath.id) == self.instance
+        pending = self.pending.get(datapath.id)
+        if pending is not None:
+            if pending[1] == master and now - pending[2] < ROLE_RETRY:
+                return              # asked already, waiting for the reply
+        elif self.roles.get(datapath.id) == master:
+            return
+        ofproto = datapath.ofproto
+        # Claimed before the store call, which may wait: a concurrent _assign backs off
+        self.pending[datapath.id] = (None, master, now)
+        try:
+            # Becoming master takes a new generation, a slave just quotes the current one
+            generation = self.store.incr(GENERATIONS, str(datapath.id), 1 if master else 0)
+        except Exception as e:          # store busy or unreachable: retried after ROLE_RETRY
+            self.logger.warning(f"[CLUSTER] state store: {e}")
+            return
+        if self.datapaths.get(datapath.id) is not datapath:
+            return                  # disconnected meanwhile
+        req = datapath.ofproto_parser.OFPRoleRequest(
+            datapath, ofproto.OFPCR_ROLE_MASTER if master else ofproto.OFPCR_ROLE_SLAVE,
+            generation)
+        if datapath.send_msg(req):
+            self.pending[datapath.id] = (req.xid, master, now)
+
+    def role_reply(self, msg):
+        """EventOFPRoleReply from the app."""
+        datapath = msg.datapath
+        pending = self.pending.get(datapath.id)
+        if pending is None or msg.xid != pending[0]:
+            return
+        del self.pending[datapath.id]
+        master = msg.role == datapath.ofproto.OFPCR_ROLE_MASTER
+        was_master = self.roles.get(datapath.id, False)
+        self.roles[datapath.id] = master
+        self.logger.info(f"[CLUSTER] switch {datapath.id}: {self.instance} is"
+                         f" {'master' if master else 'slave'} (generation {msg.generation_id})")
+        if master != was_master:
+            self.role_changes += 1
+            self.on_role(datapath, master)
+
+    def error(self, msg):
+        """EventOFPErrorMsg from the app: a refused role request (stale generation)
+        is sent again at the next heartbeat."""
+        datapath = msg.datapath
+        pending = self.pending.get(datapath.id)
+        if (pending is not None and msg.xid == pending[0]
+                and msg.type == datapath.ofproto.OFPET_ROLE_REQUEST_FAILED):
+            del self.pending[datapath.id]
+            self.logger.warning(f"[CLUSTER] switch {datapath.id}: role request refused"
+                                f" (code {msg.code})")
+
+    # --- MEMBERSHIP ---
+
+    def _beat(self):
+        now = time.time()
+        self.store.set(INSTANCES, self.instance, now, expiry=now + self.dead_after)
+        live = sorted(self.store.items(INSTANCES))
+        if live != self.live:
+            joined = set(live) - set(self.live)
+            left = set(self.live) - set(live)
+            self.live = live
+            return joined, left
+        return None
+
+    def _heartbeat_loop(self):
+        while True:
+            hub.sleep(self.heartbeat)
+            try:
+                changed = self._beat()
+                self.store.purge()
+            except Exception as e:      # store busy or unreachable: roles stay as they are
+                self.logger.warning(f"[CLUSTER] state store: {e}")
+                continue
+            if changed:
+                joined, left = changed
+                change = [f"{what}: {', '.join(sorted(names))}"
+                          for what, names in (('joined', joined), ('left', left)) if names]
+                self.logger.info(f"[CLUSTER] live: {', '.join(self.live)} ({'; '.join(change)})")
+            now = time.time()
+            for datapath in list(self.datapaths.values()):
+                self._assign(datapath, now)
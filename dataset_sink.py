@@ -0,0 +1,204 @@
+from collections import deque
+import csv
+import os
+import re
+import threading
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+try:
+    from eventlet import patcher, tpool     # real OS threads for blocking file I/O
+    _threading = patcher.original('threading')
+except ImportError:
+    tpool = None
+    _threading = threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# DATASET SINK
+# Shared writer for the collectors' datasets.
+#   write()/write_many()  only append to an in-memory ring buffer: no file I/O in the
+#                         packet-in / stats-reply handlers
+#   flusher green thread  every flush_interval seconds hands the buffered rows to a
+#                         real OS thread (eventlet tpool) that does the actual writing,
+#                         so slow disks never stall the hub loop
+#   rotation              the active file is renamed to <name>-<timestamp>.<ext> once it
+#                         exceeds rotate_bytes or is older than rotate_seconds
+#   columnar output       each flushed batch can also be written as a NumPy .npy chunk
+#                         and/or a Parquet chunk next to the CSV (<name>-000001.npy, ...;
+#                         numbering continues after the chunks already there)
+# If the ring buffer fills up before a flush, the oldest rows are dropped and counted.
+# A batch that fails to write (e.g. disk full) is logged and retried with the next flush;
+# the retried rows are bounded by buffer_rows as well.
+#
+#   [dataset]
+#   flush_interval = 5
+#   buffer_rows = 1000000
+#   rotate_bytes = 0            # 0 = never
+#   rotate_seconds = 0          # 0 = never
+#   formats = csv,npy
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.FloatOpt('flush_interval', default=5.0,
+                 help='Seconds between two flushes of the buffered rows'),
+    cfg.IntOpt('buffer_rows', default=1000000,
+               help='Ring buffer size; oldest rows are dropped when it is full'),
+    cfg.IntOpt('rotate_bytes', default=0,
+               help='Rotate the CSV file once it is this big (0 = never)'),
+    cfg.IntOpt('rotate_seconds', default=0,
+               help='Rotate the CSV file once it is this old (0 = never)'),
+    cfg.ListOpt('formats', default=['csv'],
+                help='Any of csv, npy, parquet'),
+], group='dataset')
+
+
+class DatasetSink(object):
+    def __init__(self, path, header=None, truncate=False, formats=None,
+                 flush_interval=None, buffer_rows=None, rotate_bytes=None, rotate_seconds=None,
+                 logger=None):
+        conf = CONF.dataset
+        self.path = path
+        self.logger = logger
+        self.header = header
+        self.formats = formats or conf.formats
+        self.flush_interval = flush_interval or conf.flush_interval
+        self.rotate_bytes = conf.rotate_bytes if rotate_bytes is None else rotate_bytes
+        self.rotate_seconds = conf.rotate_seconds if rotate_seconds is None else rotate_seconds
+
+        if 'npy' in self.formats and np is None:
+            raise ImportError("numpy is required for the npy dataset format")
+        if 'parquet' in self.formats and pyarrow is None:
+            raise ImportError("pyarrow is required for the parquet dataset format")
+        if 'parquet' in self.formats and not header:
+            raise ValueError("parquet output needs a header for the column names")
+
+        self.stem, self.ext = os.path.splitext(path)
+        self.buffer = deque(maxlen=buffer_rows or conf.buffer_rows)
+        self.retry = []                 # rows of a batch that failed to write
+        self.lock = _threading.Lock()   # one writer at a time (flusher, close)
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.chunk = self._last_chunk() if 'npy' in self.formats or 'parquet' in self.formats else 0
+
+        self.file = None
+        self.writer = None
+        self.opened_at = 0
+        if 'csv' in self.formats:
+            self._open(truncate)
+
+        self.flush_thread = hub.spawn(self._flush_loop)
+
+    # --- PRODUCER SIDE (hub thread, no I/O) ---
+
+    def write(self, row):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.rows_dropped += 1
+        self.buffer.append(row)
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    # --- FLUSHING ---
+
+    def _take(self):
+        rows = self.retry + list(self.buffer)
+        self.retry = []
+        self.buffer.clear()
+        return rows
+
+    def _flush_loop(self):
+        while True:
+            hub.sleep(self.flush_interval)
+            rows = self._take()
+            if not rows:
+                continue
+            try:
+                if tpool is not None:
+                    tpool.execute(self._write_rows, rows)
+                else:
+                    self._write_rows(rows)
+            except Exception as e:      # e.g. disk full: keep the rows for the next flush
+                excess = len(rows) - self.buffer.maxlen
+                if excess > 0:
+                    self.rows_dropped += excess
+                    rows = rows[excess:]
+                self.retry = rows
+                if self.logger is not None:
+                    self.logger.error(f"[DATASET] {self.path}: {e}, {len(rows)} rows kept")
+
+    def close(self):
+        """Write whatever is still buffered and close the file (call from RyuApp.close)."""
+        # A write in flight in its OS thread finishes first: _write_rows takes the lock
+        hub.kill(self.flush_thread)
+        rows = self._take()
+        if rows:
+            self._write_rows(rows)
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    # --- WRITER SIDE (OS thread) ---
+
+    def _open(self, truncate):
+        new_file = truncate or not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, 'w' if truncate else 'a', newline='')
+        self.writer = csv.writer(self.file)
+        self.opened_at = time.time()
+        if new_file and self.header:
+            self.writer.writerow(self.header)
+            self.file.flush()
+
+    def _last_chunk(self):
+        # Highest chunk number of an earlier run, so a restart never overwrites its chunks
+        folder, name = os.path.split(self.stem)
+        pattern = re.compile(re.escape(name) + r'-(\d{6,})\.(npy|parquet)$')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(folder or '.')) if m]
+        return max(numbers, default=0)
+
+    def _rotate(self):
+        self.file.close()
+        rotated = f"{self.stem}-{time.strftime('%Y%m%d-%H%M%S')}{self.ext}"
+        n = 1
+        while os.path.exists(rotated):
+            rotated = f"{self.stem}-{time.strftime('%Y%m%d-%H%M%S')}.{n}{self.ext}"
+            n += 1
+        os.rename(self.path, rotated)
+        self._open(truncate=True)
+
+    def _write_rows(self, rows):
+        with self.lock:
+            self._write_locked(rows)
+
+    def _write_locked(self, rows):
+        if 'csv' in self.formats:
+            self.writer.writerows(rows)
+            self.file.flush()
+            if ((self.rotate_bytes and self.file.tell() >= self.rotate_bytes) or
+                    (self.rotate_seconds and time.time() - self.opened_at >= self.rotate_seconds)):
+                self._rotate()
+
+        if 'npy' in self.formats or 'parquet' in self.formats:
+            self.chunk += 1
+            chunk_stem = f"{self.stem}-{self.chunk:06d}"
+            if 'npy' in self.formats:
+                np.save(chunk_stem + '.npy', np.asarray(rows, dtype=np.float64))
+            if 'parquet' in self.formats:
+                columns = list(zip(*rows))
+                table = pyarrow.table({name: list(col) for name, col in zip(self.header, columns)})
+                pyarrow.parquet.write_table(table, chunk_stem + '.parquet')
+
+        self.rows_written += len(rows)
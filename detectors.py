@@ -0,0 +1,395 @@
+from array import array
+from collections import OrderedDict
+import struct
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+# RATE DETECTORS
+# Replace the ever-growing {mac: count} dicts of the IDS apps.
+# Every detector answers one question per packet: "is this key over its rate?"
+#   window        sliding window counter (two fixed windows, weighted), per key
+#   token_bucket  token bucket refilled at threshold/window per second, per key
+#   sketch        count-min sketch over a sliding window, no per-key state at all
+# Per-key detectors keep at most max_keys keys (least recently seen is evicted),
+# so memory stays flat no matter how many source MACs an attacker spoofs.
+# All of them are O(1) per packet.
+# The per-key detectors can be checkpointed (checkpoint.py): one record per key (a MAC
+# address as uint64, then its state as doubles), least recently seen first. The sketch
+# cannot: hash() is salted per process, its cells mean nothing after a restart.
+# In a cluster of controllers (cluster.py) a SharedDetector adds the other instances'
+# counts for the same key, so a host spread over switches of several instances is
+# judged on its total rate.
+#
+# Settings come from the [detector] section of the ryu config file, e.g.
+#   ryu-manager --config-file ids.conf 9_syn_flood_detection.py
+#
+# Thresholds count events per window, not per host lifetime. App 8 floods without
+# installing flows, so every packet of an ordinary transfer is a packet-in: the defaults
+# leave room for normal traffic and short bursts of connections.
+#
+#   [detector]
+#   algorithm = token_bucket
+#   window = 1.0
+#   packet_threshold = 1000     # packet-ins per window
+#   syn_threshold = 100         # TCP SYNs per window
+#   max_keys = 100000
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('algorithm', default='window',
+               help='window, token_bucket or sketch'),
+    cfg.FloatOpt('window', default=1.0,
+                 help='Length of the rate window in seconds'),
+    cfg.IntOpt('packet_threshold', default=1000,
+               help='Packets from one host per window (see window) before it is blocked'),
+    cfg.IntOpt('syn_threshold', default=100,
+               help='TCP SYNs from one host per window (see window) before it is blocked'),
+    cfg.IntOpt('max_keys', default=65536,
+               help='Maximum number of tracked keys per detector'),
+    cfg.IntOpt('sketch_width', default=4096,
+               help='Counters per row of the count-min sketch'),
+    cfg.IntOpt('sketch_depth', default=4,
+               help='Rows (hash functions) of the count-min sketch'),
+], group='detector')
+
+
+class LRUTable(object):
+    """Key -> state map holding at most max_keys entries; the least recently
+    seen key is evicted when a new one arrives."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        state = self.entries.get(key)
+        if state is not None:
+            self.entries.move_to_end(key)
+        return state
+
+    def put(self, key, state):
+        self.entries[key] = state
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def pop(self, key, default=None):
+        return self.entries.pop(key, default)
+
+    # --- CHECKPOINTS ---
+
+    def checkpoint_sections(self, state_size):
+        record = struct.Struct(f'<Q{state_size}d')
+        data = []
+        for key, state in self.entries.items():
+            try:
+                data.append(record.pack(int(key.replace(':', ''), 16), *state))
+            except (AttributeError, ValueError):
+                continue            # only MAC address keys are checkpointed
+        return {'': (record.size, b''.join(data))}
+
+    def restore_sections(self, sections, state_size):
+        record = struct.Struct(f'<Q{state_size}d')
+        size, view = sections.get('', (0, b''))
+        if size != record.size:
+            return
+        for mac, *state in record.iter_unpack(view):
+            self.put(':'.join(f'{b:02x}' for b in mac.to_bytes(6, 'big')), state)
+
+
+class SlidingWindowDetector(object):
+    # state per key: [current window start, previous window count, current window count]
+
+    def __init__(self, threshold, window=1.0, max_keys=65536):
+        self.threshold = threshold
+        self.window = window
+        self.keys = LRUTable(max_keys)
+
+    def _roll(self, state, now):
+        elapsed = now - state[0]
+        if elapsed >= self.window:
+            # Previous window only counts if it is the one right before now
+            state[1] = state[2] if elapsed < 2 * self.window else 0
+            state[2] = 0
+            state[0] += self.window * int(elapsed // self.window)
+        return now - state[0]
+
+    def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        state = self.keys.get(key)
+        if state is None:
+            state = [now, 0, 0]
+            self.keys.put(key, state)
+        elapsed = self._roll(state, now)
+        state[2] += 1
+        return self._estimate(state, elapsed) > self.threshold
+
+    def _estimate(self, state, elapsed):
+        # Weight the previous window by how much of it still overlaps the sliding window
+        return state[1] * (1.0 - elapsed / self.window) + state[2]
+
+    def rate(self, key, now=None):
+        """Events in the last window (estimate)."""
+        now = time.time() if now is None else now
+        state = self.keys.entries.get(key)
+        if state is None:
+            return 0.0
+        return self._estimate(state, self._roll(state, now))
+
+    def forget(self, key):
+        self.keys.pop(key)
+
+    def checkpoint_sections(self):
+        return self.keys.checkpoint_sections(3)
+
+    def restore_sections(self, sections):
+        self.keys.restore_sections(sections, 3)
+
+
+class TokenBucketDetector(object):
+    # state per key: [tokens, last refill time]
+    # Bucket size = threshold, refill = threshold per window: a host may burst up to
+    # the threshold but is flagged once it keeps sending faster than that on average.
+
+    def __init__(self, threshold, window=1.0, max_keys=65536):
+        self.threshold = threshold
+        self.window = window
+        self.fill_rate = threshold / window
+        self.keys = LRUTable(max_keys)
+
+    def _refill(self, state, now):
+        state[0] = min(self.threshold, state[0] + (now - state[1]) * self.fill_rate)
+        state[1] = now
+
+    def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        state = self.keys.get(key)
+        if state is None:
+            state = [float(self.threshold), now]
+            self.keys.put(key, state)
+        self._refill(state, now)
+        state[0] -= 1
+        return state[0] < 0
+
+    def rate(self, key, now=None):
+        """Tokens used out of the bucket, in events per window."""
+        now = time.time() if now is None else now
+        state = self.keys.entries.get(key)
+        if state is None:
+            return 0.0
+        self._refill(state, now)
+        return self.threshold - state[0]
+
+    def forget(self, key):
+        self.keys.pop(key)
+
+    def checkpoint_sections(self):
+        return self.keys.checkpoint_sections(2)
+
+    def restore_sections(self, sections):
+        self.keys.restore_sections(sections, 2)
+
+
+class CountMinSketch(object):
+    """Fixed-size frequency table: width*depth counters whatever the number of keys.
+    Estimates never undercount; they may overcount on hash collisions."""
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    def _cells(self, key):
+        # One hash per row; hash() is stable for the lifetime of the process
+        width = self.width
+        return [hash((i, key)) % width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        cells = self._cells(key)
+        estimate = None
+        for row, cell in zip(self.rows, cells):
+            row[cell] += count
+            if estimate is None or row[cell] < estimate:
+                estimate = row[cell]
+        return estimate
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(key)))
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = array('I', bytes(4 * self.width))
+
+
+class SketchDetector(object):
+    # Two sketches: the current and the previous window, weighted like SlidingWindowDetector.
+    # Memory is 2 * width * depth counters in total, independent of the number of keys.
+
+    def __init__(self, threshold, window=1.0, width=4096, depth=4):
+        self.threshold = threshold
+        self.window = window
+        self.current = CountMinSketch(width, depth)
+        self.previous = CountMinSketch(width, depth)
+        self.window_start = None
+
+    def _roll(self, now):
+        if self.window_start is None:
+            self.window_start = now
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.previous, self.current = self.current, self.previous
+            if elapsed >= 2 * self.window:
+                self.previous.clear()
+            self.current.clear()
+            self.window_start += self.window * int(elapsed // self.window)
+        return now - self.window_start
+
+    def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        elapsed = self._roll(now)
+        count = self.current.add(key)
+        return self.previous.estimate(key) * (1.0 - elapsed / self.window) + count > self.threshold
+
+    def rate(self, key, now=None):
+        now = time.time() if now is None else now
+        elapsed = self._roll(now)
+        return (self.previous.estimate(key) * (1.0 - elapsed / self.window)
+                + self.current.estimate(key))
+
+    def forget(self, key):
+        # Keys cannot be removed from a sketch; they age out with the window
+        pass
+
+    def checkpoint_sections(self):
+        return {}
+
+    def restore_sections(self, sections):
+        pass
+
+
+class SharedDetector(object):
+    """Wraps a detector: its hits are published to the cluster's state store
+    (state_store.py) as per-window counts every sync_interval, and the other instances'
+    counts of the current and previous window come back the same way. A key is over
+    its rate if the local detector says so, or if local + remote rate is over the
+    threshold. Remote counts lag by up to sync_interval.
+    Unpublished counts are kept for at most max_keys keys per window (least recently
+    seen is dropped), so a spoofed-source flood cannot grow them or the store writes."""
+
+    def __init__(self, detector, store, name, instance, sync_interval, logger, max_keys=None):
+        self.detector = detector
+        self.logger = logger
+        self.threshold = detector.threshold
+        self.window = detector.window
+        self.store = store
+        self.table = 'detector.' + name
+        self.instance = instance
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys or CONF.detector.max_keys
+
+        self.pending = {}           # window number -> LRUTable of key -> hits not published yet
+        self.remote_window = None   # window number of remote[1]
+        self.remote = ({}, {})      # other instances' counts: previous, current window
+        self.sync_thread = hub.spawn(self._sync_loop)
+
+    def _remote_rate(self, key, now):
+        window, elapsed = divmod(now, self.window)
+        previous, current = self.remote
+        if window == self.remote_window + 1:
+            previous, current = current, {}     # not synced since the window rolled
+        elif window != self.remote_window:
+            return 0.0
+        # Same weighting as the sliding window
+        return previous.get(key, 0) * (1.0 - elapsed / self.window) + current.get(key, 0)
+
+    def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        window = int(now // self.window)
+        counts = self.pending.get(window)
+        if counts is None:
+            counts = self.pending[window] = LRUTable(self.max_keys)
+        counts.put(key, (counts.get(key) or 0) + 1)
+        if self.detector.hit(key, now):
+            return True
+        if self.remote_window is None:
+            return False
+        remote = self._remote_rate(key, now)
+        return bool(remote) and self.detector.rate(key, now) + remote > self.threshold
+
+    def rate(self, key, now=None):
+        now = time.time() if now is None else now
+        if self.remote_window is None:
+            return self.detector.rate(key, now)
+        return self.detector.rate(key, now) + self._remote_rate(key, now)
+
+    def forget(self, key):
+        self.detector.forget(key)
+        for counts in self.remote:
+            counts.pop(key, None)
+
+    def checkpoint_sections(self):
+        return self.detector.checkpoint_sections()
+
+    def restore_sections(self, sections):
+        self.detector.restore_sections(sections)
+
+    def _sync_loop(self):
+        while True:
+            hub.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:          # store busy or unreachable: local counts only
+                self.logger.warning(f"[CLUSTER] {self.table}: {e}")
+
+    def sync(self):
+        pending, self.pending = self.pending, {}
+        window = int(time.time() // self.window)
+        # Windows before the previous one no longer count anywhere
+        unsent = sorted(w for w in pending if w >= window - 1)
+        try:
+            while unsent:
+                self.store.add_counts(self.table, unsent[0], self.instance,
+                                      dict(pending[unsent[0]].entries))
+                unsent.pop(0)
+        finally:
+            # Store failed: the counts not written go out with the next sync
+            for w in unsent:
+                self._unsent(w, pending[w])
+        self.remote = (self.store.window_counts(self.table, window - 1, self.instance),
+                       self.store.window_counts(self.table, window, self.instance))
+        self.remote_window = window
+        self.store.drop_counts(self.table, window - 1)
+
+    def _unsent(self, window, counts):
+        # Hits that came in meanwhile are the more recent ones
+        newer = self.pending.get(window)
+        if newer is not None:
+            for key, n in newer.entries.items():
+                counts.put(key, (counts.entries.get(key) or 0) + n)
+        self.pending[window] = counts
+
+
+def create(threshold, algorithm=None, window=None, max_keys=None):
+    """Build a detector for `threshold` events per window, the rest from the [detector] config."""
+    conf = CONF.detector
+    algorithm = algorithm or conf.algorithm
+    window = window or conf.window
+    max_keys = max_keys or conf.max_keys
+
+    if algorithm == 'window':
+        return SlidingWindowDetector(threshold, window, max_keys)
+    if algorithm == 'token_bucket':
+        return TokenBucketDetector(threshold, window, max_keys)
+    if algorithm == 'sketch':
+        return SketchDetector(threshold, window, conf.sketch_width, conf.sketch_depth)
+    raise ValueError(f"Unknown detector algorithm: {algorithm}")
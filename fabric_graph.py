@@ -0,0 +1,138 @@
+# FABRIC GRAPH
+# Switch-level topology for 15_shortest_path_forwarding.py: switches, the inter-switch
+# links found by LLDP (ryu.topology, --observe-links) and, precomputed for every
+# destination switch, the port each switch forwards on to get one hop closer to it
+# (a BFS tree over the reversed links; all links cost 1).
+#   lookups      next_port() and path() only read the precomputed trees: O(1) per hop
+#   incremental  a link event recomputes only the trees it changes:
+#                  link up    destinations the new link brings closer to its source
+#                             switch (tree edges elsewhere stay shortest)
+#                  link down  destinations whose tree used that link
+#                  switch     its own tree, plus its links as above
+# Links are directed, as LLDP reports them (one event per direction).
+# Destination-based trees are what make per-destination FlowMods (match eth_dst)
+# loop-free: every switch on the way forwards to a neighbour strictly closer to the
+# destination switch.
+
+
+class FabricGraph(object):
+    def __init__(self):
+        self.switches = set()
+        self.links = {}             # dpid -> {neighbour dpid: local port}
+        self.rlinks = {}            # dpid -> {dpid with a link to it: that switch's port}
+        self.link_ports = set()     # (dpid, port) of every inter-switch link end
+        self.toward = {}            # destination dpid -> {dpid: (port, hops, next dpid)}
+        self.recomputed = 0         # trees rebuilt since start
+
+    def __len__(self):
+        return len(self.switches)
+
+    # --- LOOKUPS ---
+
+    def is_link_port(self, dpid, port):
+        return (dpid, port) in self.link_ports
+
+    def link_count(self):
+        return len(self.link_ports)
+
+    def next_port(self, dpid, dst):
+        """Port on switch dpid toward switch dst; None if unreachable or dpid == dst."""
+        hop = self.toward.get(dst, {}).get(dpid)
+        return None if hop is None else hop[0]
+
+    def path(self, src, dst):
+        """[(dpid, out port), ...] from src up to, not including, dst; [] if src == dst,
+        None if dst cannot be reached."""
+        tree = self.toward.get(dst)
+        if tree is None or src not in tree:
+            return None
+        hops = []
+        dpid = src
+        while dpid != dst:
+            port, _, next_dpid = tree[dpid]
+            hops.append((dpid, port))
+            dpid = next_dpid
+        return hops
+
+    # --- TOPOLOGY EVENTS (each returns the destinations whose tree changed) ---
+
+    def add_switch(self, dpid):
+        if dpid in self.switches:
+            return []
+        self.switches.add(dpid)
+        self.links.setdefault(dpid, {})
+        self.rlinks.setdefault(dpid, {})
+        self._compute(dpid)
+        return [dpid]
+
+    def remove_switch(self, dpid):
+        if dpid not in self.switches:
+            return []
+        changed = set()
+        for neighbour in list(self.links.get(dpid, {})):
+            changed.update(self.remove_link(dpid, neighbour))
+        for neighbour in list(self.rlinks.get(dpid, {})):
+            changed.update(self.remove_link(neighbour, dpid))
+        self.switches.discard(dpid)
+        self.links.pop(dpid, None)
+        self.rlinks.pop(dpid, None)
+        self.toward.pop(dpid, None)
+        changed.discard(dpid)
+        return sorted(changed)
+
+    def add_link(self, src, src_port, dst):
+        """Link from switch src (leaving on src_port) to switch dst."""
+        self.add_switch(src)
+        self.add_switch(dst)
+        old_port = self.links[src].get(dst)
+        if old_port == src_port:
+            return []
+        changed = set()
+        if old_port is not None:
+            changed.update(self.remove_link(src, dst))
+        self.links[src][dst] = src_port
+        self.rlinks[dst][src] = src_port
+        self.link_ports.add((src, src_port))
+        # Only trees where src gets strictly closer through dst change
+        closer = []
+        for dest, tree in self.toward.items():
+            via = tree.get(dst)
+            if via is None:
+                continue
+            current = tree.get(src)
+            if current is None or current[1] > via[1] + 1:
+                closer.append(dest)
+        for dest in closer:
+            self._compute(dest)
+        return sorted(changed.union(closer))
+
+    def remove_link(self, src, dst, src_port=None):
+        port = self.links.get(src, {}).get(dst)
+        if port is None or (src_port is not None and port != src_port):
+            return []
+        del self.links[src][dst]
+        del self.rlinks[dst][src]
+        self.link_ports.discard((src, port))
+        # Only trees that used this link change
+        changed = [dest for dest, tree in self.toward.items()
+                   if dest != src and tree.get(src, (None,))[0] == port]
+        for dest in changed:
+            self._compute(dest)
+        return changed
+
+    def _compute(self, dst):
+        # BFS from dst over the reversed links
+        tree = {dst: (None, 0, None)}
+        frontier = [dst]
+        hops = 0
+        while frontier:
+            hops += 1
+            next_frontier = []
+            for dpid in frontier:
+                for upstream, port in self.rlinks.get(dpid, {}).items():
+                    if upstream not in tree:
+                        tree[upstream] = (port, hops, dpid)
+                        next_frontier.append(upstream)
+            frontier = next_frontier
+        self.toward[dst] = tree
+        self.recomputed += 1
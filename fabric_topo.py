@@ -0,0 +1,33 @@
+from mininet.topo import Topo
+from mininet.net import Mininet
+from mininet.node import RemoteController, OVSSwitch
+from mininet.cli import CLI
+
+# Four switches in a ring plus the s1-s3 diagonal (so there are loops and two
+# equal-length paths), two hosts per switch. For 15_shortest_path_forwarding.py:
+#   ryu-manager 15_shortest_path_forwarding.py
+#   sudo python fabric_topo.py
+#   mininet> pingall
+#   mininet> link s1 s2 down        (traffic moves to the other paths)
+
+class FabricTopo(Topo):
+    def build(self):
+        switches = [self.addSwitch(f's{i}', protocols='OpenFlow13') for i in range(1, 5)]
+        for i, s in enumerate(switches):
+            for j in (1, 2):
+                n = i * 2 + j
+                h = self.addHost(f'h{n}', ip=f'10.0.0.{n}', mac=f'00:00:00:00:00:{n:02x}')
+                self.addLink(h, s)
+
+        self.addLink(switches[0], switches[1])
+        self.addLink(switches[1], switches[2])
+        self.addLink(switches[2], switches[3])
+        self.addLink(switches[3], switches[0])
+        self.addLink(switches[0], switches[2])
+
+if __name__ == '__main__':
+    topo = FabricTopo()
+    net = Mininet(topo=topo, controller=RemoteController, switch=OVSSwitch)
+    net.start()
+    CLI(net)
+    net.stop()
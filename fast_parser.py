@@ -0,0 +1,156 @@
+from collections import namedtuple
+import socket
+import struct
+
+from ryu.lib.packet import packet, ethernet, vlan, ipv4, tcp, udp
+from ryu.lib.packet import ether_types
+
+# FAST-PATH HEADER PARSER
+# packet.Packet(msg.data) builds a Python object for every layer of the frame,
+# but the packet-in handlers only ever look at a handful of fields:
+# MACs, ethertype, the IPv4 5-tuple and the TCP flags.
+# parse() reads exactly those fields straight out of the raw bytes with
+# precompiled struct formats (unpack_from reads in place, no slicing/copying)
+# and returns them as one flat, fixed-field record.
+# Frames the fast path does not understand fall back to the full Ryu parser.
+
+Headers = namedtuple('Headers', [
+    'eth_dst',      # "aa:bb:cc:dd:ee:ff", same text format as ethernet.ethernet.dst
+    'eth_src',
+    'ethertype',    # inner ethertype (after a single 802.1Q tag, if any)
+    'vlan_id',      # 0 when untagged
+    'ip_src',       # "10.0.0.1" or None for non-IPv4 frames
+    'ip_dst',
+    'ip_proto',     # 6 = TCP, 17 = UDP, 0 for non-IPv4 frames
+    'src_port',     # 0 when there is no TCP/UDP header
+    'dst_port',
+    'tcp_flags',    # same bits as tcp.tcp.bits: URG ... FIN (tcp.TCP_SYN, tcp.TCP_ACK, ...)
+])
+
+_ETH = struct.Struct('!6s6sH')              # dst, src, ethertype
+_VLAN = struct.Struct('!HH')                # TCI, inner ethertype
+_IPV4 = struct.Struct('!B8xB2x4s4s')        # version/IHL, proto, src, dst
+_IPV4_FRAG = struct.Struct('!6xH')          # flags + fragment offset
+_PORTS = struct.Struct('!HH')               # src_port, dst_port (TCP and UDP)
+_IPV4_ADDRS = struct.Struct('!12x4s4s')     # src, dst (raw bytes)
+
+_ETH_LEN = 14
+_VLAN_LEN = 4
+_IPV4_MIN_LEN = 20
+_TCP_MIN_LEN = 20
+_UDP_LEN = 8
+
+_ETH_TYPE_8021Q = ether_types.ETH_TYPE_8021Q
+_ETH_TYPE_IP = ether_types.ETH_TYPE_IP
+_IPPROTO_TCP = 6
+_IPPROTO_UDP = 17
+_IP_FRAG_OFFSET_MASK = 0x1fff
+
+_inet_ntoa = socket.inet_ntoa
+
+
+def parse(data):
+    """Extract the header fields used by the apps. Returns None if the frame is
+    not even a complete Ethernet header."""
+    size = len(data)
+    if size < _ETH_LEN:
+        return None
+
+    dst, src, ethertype = _ETH.unpack_from(data, 0)
+    offset = _ETH_LEN
+    vlan_id = 0
+
+    if ethertype == _ETH_TYPE_8021Q:
+        if size < offset + _VLAN_LEN:
+            return _slow_parse(data)
+        tci, ethertype = _VLAN.unpack_from(data, offset)
+        if ethertype == _ETH_TYPE_8021Q:       # QinQ: let the full parser deal with it
+            return _slow_parse(data)
+        vlan_id = tci & 0x0fff
+        offset += _VLAN_LEN
+
+    if ethertype != _ETH_TYPE_IP:
+        return Headers(dst.hex(':'), src.hex(':'), ethertype, vlan_id,
+                       None, None, 0, 0, 0, 0)
+
+    if size < offset + _IPV4_MIN_LEN:
+        return _slow_parse(data)
+    ver_ihl, proto, ip_src, ip_dst = _IPV4.unpack_from(data, offset)
+    ihl = (ver_ihl & 0x0f) * 4
+    if ver_ihl >> 4 != 4 or ihl < _IPV4_MIN_LEN:
+        return _slow_parse(data)
+
+    src_port = dst_port = tcp_flags = 0
+    l4 = offset + ihl
+    # Only the first fragment carries the TCP/UDP header
+    first_fragment = not (_IPV4_FRAG.unpack_from(data, offset)[0] & _IP_FRAG_OFFSET_MASK)
+
+    if first_fragment and proto == _IPPROTO_TCP:
+        if size >= l4 + _TCP_MIN_LEN:
+            src_port, dst_port = _PORTS.unpack_from(data, l4)
+            # Byte 13, masked like ryu's tcp parser: URG ... FIN (no NS/CWR/ECE)
+            tcp_flags = data[l4 + 13] & 0x3F
+    elif first_fragment and proto == _IPPROTO_UDP:
+        if size >= l4 + _UDP_LEN:
+            src_port, dst_port = _PORTS.unpack_from(data, l4)
+
+    return Headers(dst.hex(':'), src.hex(':'), ethertype, vlan_id,
+                   _inet_ntoa(ip_src), _inet_ntoa(ip_dst), proto,
+                   src_port, dst_port, tcp_flags)
+
+
+def parse_link(data):
+    """Cheaper than parse() for handlers that pass the frame on to a worker process:
+    (eth_dst, eth_src, ethertype, host_pair), host_pair being the two IPv4 addresses as
+    raw bytes in a fixed order (the same for both directions of a connection), or None
+    for non-IPv4 frames. Returns None if the frame is not a complete Ethernet header."""
+    size = len(data)
+    if size < _ETH_LEN:
+        return None
+    dst, src, ethertype = _ETH.unpack_from(data, 0)
+    offset = _ETH_LEN
+    if ethertype == _ETH_TYPE_8021Q and size >= offset + _VLAN_LEN:
+        ethertype = _VLAN.unpack_from(data, offset)[1]
+        offset += _VLAN_LEN
+    pair = None
+    if ethertype == _ETH_TYPE_IP and size >= offset + _IPV4_MIN_LEN:
+        ip_a, ip_b = _IPV4_ADDRS.unpack_from(data, offset)
+        pair = ip_a + ip_b if ip_a <= ip_b else ip_b + ip_a
+    return dst.hex(':'), src.hex(':'), ethertype, pair
+
+
+def _slow_parse(data):
+    # Fallback for odd frames (truncated headers, QinQ, bad IHL ...):
+    # use the full Ryu parser and squeeze the result into the same record
+    try:
+        pkt = packet.Packet(data)
+    except Exception:
+        return None
+
+    eth = pkt.get_protocol(ethernet.ethernet)
+    if eth is None:
+        return None
+
+    ethertype = eth.ethertype
+    vlan_id = 0
+    vlans = pkt.get_protocols(vlan.vlan)
+    if vlans:
+        vlan_id = vlans[0].vid
+        ethertype = vlans[-1].ethertype
+
+    ip_pkt = pkt.get_protocol(ipv4.ipv4)
+    if ip_pkt is None:
+        return Headers(eth.dst, eth.src, ethertype, vlan_id,
+                       None, None, 0, 0, 0, 0)
+
+    src_port = dst_port = tcp_flags = 0
+    tcp_pkt = pkt.get_protocol(tcp.tcp)
+    udp_pkt = pkt.get_protocol(udp.udp)
+    if tcp_pkt:
+        src_port, dst_port, tcp_flags = tcp_pkt.src_port, tcp_pkt.dst_port, tcp_pkt.bits
+    elif udp_pkt:
+        src_port, dst_port = udp_pkt.src_port, udp_pkt.dst_port
+
+    return Headers(eth.dst, eth.src, ethertype, vlan_id,
+                   ip_pkt.src, ip_pkt.dst, ip_pkt.proto,
+                   src_port, dst_port, tcp_flags)
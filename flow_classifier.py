@@ -0,0 +1,159 @@
+import time
+
+import numpy as np
+
+from ryu import cfg
+from ryu.lib import hub
+
+import metrics
+
+# ONLINE FLOW CLASSIFIER
+# Consumes the same features the collector writes to 14_dataset.csv, inside the app.
+#
+#   FlowClassifier   linear model (standardize -> weights -> sigmoid) trained offline by
+#                    train_classifier.py and stored as a .npz file; predict() works on a
+#                    whole (n_flows x n_features) matrix at once
+#   InferenceStage   collects flows to classify into micro-batches. A batch is closed
+#                    when it is full or max_delay has passed, classified in one call and
+#                    every positive is handed to on_attack(). Flows whose features are
+#                    already computed (e.g. at export) are queued as whole matrices with
+#                    submit_many(). If a batch takes longer than
+#                    the latency budget the batch size is halved; if it is well under,
+#                    the batch size grows back, so the per-batch latency stays bounded.
+#
+#   [inference]
+#   model_path = flow_model.npz
+#   threshold = 0.5
+#   classify_after = 5
+#   max_batch = 1024
+#   max_delay = 0.05
+#   latency_budget = 0.01
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('model_path', default='flow_model.npz',
+               help='Model written by train_classifier.py'),
+    cfg.FloatOpt('threshold', default=0.5,
+                 help='Attack probability above which a flow is blocked'),
+    cfg.IntOpt('classify_after', default=5,
+               help='Classify a flow once it has this many packets'),
+    cfg.IntOpt('max_batch', default=1024,
+               help='Largest micro-batch'),
+    cfg.FloatOpt('max_delay', default=0.05,
+                 help='Longest time a flow waits for its batch (seconds)'),
+    cfg.FloatOpt('latency_budget', default=0.01,
+                 help='Target time to classify one batch (seconds)'),
+], group='inference')
+
+MIN_BATCH = 16
+
+
+class FlowClassifier(object):
+    def __init__(self, feature_names, mean, scale, weights, bias, threshold=0.5):
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path, threshold=0.5):
+        with np.load(path) as model:
+            return cls([str(name) for name in model['feature_names']],
+                       model['mean'], model['scale'], model['weights'],
+                       model['bias'], threshold)
+
+    def save(self, path):
+        np.savez(path, feature_names=np.array(self.feature_names),
+                 mean=self.mean, scale=self.scale,
+                 weights=self.weights, bias=np.array(self.bias))
+
+    def predict_proba(self, X):
+        z = ((X - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -50, 50)))
+
+    def predict(self, X):
+        return self.predict_proba(X) > self.threshold
+
+
+class InferenceStage(object):
+    def __init__(self, classifier, features, on_attack, logger,
+                 max_batch=None, max_delay=None, latency_budget=None):
+        """features(items) -> (one value per still valid item, their n x n_features
+        matrix); on_attack(value) is called for every positive."""
+        conf = CONF.inference
+        self.classifier = classifier
+        self.features = features
+        self.on_attack = on_attack
+        self.logger = logger
+        self.max_batch_cap = max_batch or conf.max_batch
+        self.max_batch = self.max_batch_cap
+        self.max_delay = max_delay or conf.max_delay
+        self.latency_budget = latency_budget or conf.latency_budget
+
+        self.queue = []
+        self.ready = []             # (values, X) submitted with their features
+        self.batches = 0
+        self.classified = 0
+        self.positives = 0
+        self.overruns = 0           # batches that took longer than the budget
+
+        metrics.Counter('ryu_inference_flows_total', 'Flows classified',
+                        fn=lambda: self.classified)
+        metrics.Counter('ryu_inference_attacks_total', 'Flows classified as attacks',
+                        fn=lambda: self.positives)
+        metrics.Counter('ryu_inference_batches_total', 'Micro-batches classified',
+                        fn=lambda: self.batches)
+        metrics.Counter('ryu_inference_overruns_total', 'Micro-batches over the latency budget',
+                        fn=lambda: self.overruns)
+        metrics.Gauge('ryu_inference_max_batch', 'Current micro-batch size limit',
+                      fn=lambda: self.max_batch)
+
+        self.thread = hub.spawn(self._loop)
+
+    def submit(self, item):
+        self.queue.append(item)
+
+    def submit_many(self, values, X):
+        if len(values):
+            self.ready.append((values, X))
+
+    def _loop(self):
+        while True:
+            hub.sleep(self.max_delay)
+            while self.ready:
+                values, X = self.ready.pop()
+                i = 0
+                while i < len(values):
+                    n = self.max_batch
+                    self._run_batch(time.perf_counter(), values[i:i + n], X[i:i + n])
+                    i += n
+                    hub.sleep(0)    # let packet-ins through between batches
+            while self.queue:
+                batch = self.queue[:self.max_batch]
+                del self.queue[:self.max_batch]
+                start = time.perf_counter()
+                self._run_batch(start, *self.features(batch))
+                hub.sleep(0)
+
+    def _run_batch(self, start, values, X):
+        # `start` is taken before the features were computed: they count against the budget
+        if not len(values):
+            return
+        positive = self.classifier.predict(X)
+        elapsed = time.perf_counter() - start
+
+        self.batches += 1
+        self.classified += len(values)
+        # Adapt the batch size to the latency budget
+        if elapsed > self.latency_budget:
+            self.overruns += 1
+            self.max_batch = max(MIN_BATCH, self.max_batch // 2)
+        elif elapsed < self.latency_budget / 4 and len(values) >= self.max_batch:
+            self.max_batch = min(self.max_batch_cap, self.max_batch * 2)
+
+        for item, attack in zip(values, positive.tolist()):
+            if attack:
+                self.positives += 1
+                self.on_attack(item)
@@ -0,0 +1,54 @@
+# FLOW COUNTER DELTAS
+# Switch flow counters are cumulative since the entry was installed. FlowDeltas keeps
+# the last-seen (packets, bytes, duration) per flow entry and turns each new reading
+# into what happened since the previous one:
+#   - first reading of an entry      -> everything since install
+#   - counters or duration went down -> the entry was re-installed (reset), same as first
+#   - entry removed (FlowRemoved)    -> final delta, entry forgotten
+#   - entry missing from a full dump -> forgotten (removed without a FlowRemoved)
+# State is kept per switch; an entry is identified by (priority, cookie, match fields).
+
+
+def entry_key(stat):
+    """Key of an OFPFlowStats / OFPFlowRemoved entry on its switch."""
+    return (stat.priority, stat.cookie, tuple(stat.match.items()))
+
+
+class FlowDeltas(object):
+    def __init__(self):
+        self.last = {}              # dpid -> {key: (packet_count, byte_count, duration)}
+        self.resets = 0
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.last.values())
+
+    def update(self, dpid, key, packet_count, byte_count, duration):
+        """New cumulative reading -> (packets, bytes, seconds) since the previous one."""
+        entries = self.last.setdefault(dpid, {})
+        prev = entries.get(key)
+        entries[key] = (packet_count, byte_count, duration)
+        if prev is None:
+            return packet_count, byte_count, duration
+        if packet_count < prev[0] or byte_count < prev[1] or duration < prev[2]:
+            self.resets += 1
+            return packet_count, byte_count, duration
+        return packet_count - prev[0], byte_count - prev[1], duration - prev[2]
+
+    def remove(self, dpid, key, packet_count, byte_count, duration):
+        """Final reading of a removed entry -> its last delta; the entry is forgotten."""
+        delta = self.update(dpid, key, packet_count, byte_count, duration)
+        del self.last[dpid][key]
+        return delta
+
+    def sweep(self, dpid, seen):
+        """Forget entries of `dpid` that are not in `seen` (keys of a complete dump)."""
+        entries = self.last.get(dpid)
+        if not entries or len(entries) == len(seen):
+            return 0
+        stale = [key for key in entries if key not in seen]
+        for key in stale:
+            del entries[key]
+        return len(stale)
+
+    def forget_switch(self, dpid):
+        self.last.pop(dpid, None)
@@ -0,0 +1,62 @@
+import fast_parser
+import flow_features
+import flow_table
+
+# FLOW FEATURE EXTRACTOR
+# The twelve-feature engine of 14_collector_twelve_features.py without the controller
+# around it: raw frames go in, dataset rows of finished flows come out. The collector
+# (inline), its worker processes (packet_workers.FlowFeatureWorker) and the offline
+# pcap tool (pcap_features.py) all run this, so live and offline datasets have the
+# same columns and the same values for the same packets.
+#   add(now, length, data)   parse a frame and account it to its bidirectional flow;
+#                            `now` is the packet's time (wall clock live, capture
+#                            timestamp offline), `length` its original length
+#                            (add_headers() if the caller parsed it already)
+#   expire(now)              rows of the flows finished at `now` (idle/active timeout,
+#                            or removed from the switch when offloaded)
+#   finish()                 rows of every flow still in the table (end of a capture)
+# classify(rows, columns), if given, sees each exported batch before its table rows are
+# freed (e.g. to classify flows that ended short); with classify_extended its columns
+# include the extended features even when the dataset does not.
+
+
+class FlowExtractor(object):
+    def __init__(self, idle_timeout, active_timeout, label=0, extended=False,
+                 classify=None, classify_extended=False):
+        self.table = flow_table.FlowTable(idle_timeout=idle_timeout,
+                                          active_timeout=active_timeout)
+        self.label = label
+        self.extended = extended
+        self.classify = classify
+        self.classify_extended = classify_extended
+
+    def add(self, now, length, data):
+        """Account one frame. Returns (row, side), or None for non-IPv4 frames."""
+        hdr = fast_parser.parse(data)
+        if hdr is None or hdr.ip_src is None:
+            return None
+        return self.table.add(hdr, now, length)
+
+    def add_headers(self, hdr, now, length):
+        """add() for a frame already parsed into IPv4 fast_parser.Headers."""
+        return self.table.add(hdr, now, length)
+
+    def expire(self, now):
+        return self.export(self.table.expired_rows(now))
+
+    def finish(self):
+        return self.export(self.table.active_rows())
+
+    def export(self, rows):
+        """Dataset rows of table `rows`, which are freed."""
+        if not len(rows):
+            return []
+        # All finished flows' features are computed in one vectorized pass
+        extended = self.extended or (self.classify is not None and self.classify_extended)
+        columns = self.table.features(rows, extended=extended)
+        if self.classify is not None:
+            self.classify(rows, columns)
+        self.table.remove(rows)
+        if extended and not self.extended:
+            columns = columns[:len(flow_features.FEATURE_HEADER)]
+        return flow_features.to_rows(columns, self.label)
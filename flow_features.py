@@ -0,0 +1,276 @@
+from itertools import repeat
+
+import numpy as np
+
+from ryu.lib.packet import tcp
+
+# FLOW FEATURE TABLE
+# Struct-of-arrays flow state for the twelve-feature collector.
+# Each flow is one row index into a set of NumPy columns ("flow id"), looked up
+# through a dict key -> row. Per-packet updates touch a handful of array cells;
+# the features of all exported flows are then computed in one vectorized pass.
+#
+# Packet length and inter-arrival time (IAT) statistics are kept with Welford's
+# online algorithm (running mean + sum of squared deviations), so std/min/max
+# come for free without storing individual packets.
+#
+# Rows of exported flows go on a free list and are reused by new flows.
+#
+# Direction: the caller says which endpoint ("side" 0 or 1) sent each packet.
+# The side of the first packet is the flow's initiator; its packets are "fwd",
+# the other side's packets are "bwd" (CICFlowMeter convention).
+#
+# Checkpoints (checkpoint.py): the active rows as one NumPy structured array, the
+# flow key split in two uint64 then every column, read back with np.frombuffer.
+
+FEATURE_HEADER = [
+    "Flow Duration", "Tot Fwd Pkts", "Tot Bwd Pkts", "Flow Byts/s",
+    "SYN Flag Cnt", "ACK Flag Cnt", "PSH Flag Cnt", "RST Flag Cnt",
+    "Flow Pkts/s", "Pkt Len Mean", "Flow IAT Mean", "Protocol",
+]
+
+# CICFlowMeter-style extras, appended after the twelve base features when enabled
+EXTENDED_HEADER = [
+    "Flow IAT Std", "Flow IAT Max", "Pkt Len Min", "Pkt Len Max", "Pkt Len Std",
+]
+
+_FLOAT_COLUMNS = (
+    'start', 'last', 'bytes',
+    'iat_mean', 'iat_m2', 'iat_max',            # Welford state of the IATs
+    'len_mean', 'len_m2', 'len_min', 'len_max', # Welford state of the packet lengths
+    'offload_time', 'sw_duration',              # sample-then-offload bookkeeping
+)
+_INT_COLUMNS = (
+    'fwd', 'bwd', 'syn', 'ack', 'psh', 'rst', 'proto',
+    'in_use', 'initiator',                      # row holds a flow, side that sent the first packet
+    'sw_fwd_pkts', 'sw_bwd_pkts', 'sw_fwd_bytes', 'sw_bwd_bytes',
+    'offloaded', 'sw_entries',                  # offloaded to a switch, switch entries still alive
+)
+
+_CHECKPOINT_DTYPE = np.dtype([('key_hi', '<u8'), ('key_lo', '<u8')] +
+                             [(name, '<f8') for name in _FLOAT_COLUMNS] +
+                             [(name, '<i8') for name in _INT_COLUMNS])
+_KEY_LO_MASK = (1 << 64) - 1
+
+
+class FlowFeatureTable(object):
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.index = {}                 # flow key -> row
+        self.keys = [None] * capacity   # row -> flow key
+        self.free = []                  # rows of exported flows, reused first
+        self.high_water = 0             # rows [0, high_water) have been handed out
+
+        for name in _FLOAT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        for name in _INT_COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def _grow(self):
+        new_capacity = self.capacity * 2
+        for name in _FLOAT_COLUMNS + _INT_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.keys.extend([None] * (new_capacity - self.capacity))
+        self.capacity = new_capacity
+
+    def _new_row(self, key):
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.high_water == self.capacity:
+                self._grow()
+            row = self.high_water
+            self.high_water += 1
+        self.index[key] = row
+        self.keys[row] = key
+        self.in_use[row] = 1
+        return row
+
+    # --- PER-PACKET UPDATE ---
+
+    def add_packet(self, key, now, length, side, tcp_flags, proto):
+        """Account one packet sent by endpoint `side` (0/1) to its flow, creating the
+        flow if needed. Returns the row."""
+        syn = 1 if tcp_flags & tcp.TCP_SYN else 0
+        ack = 1 if tcp_flags & tcp.TCP_ACK else 0
+        psh = 1 if tcp_flags & tcp.TCP_PSH else 0
+        rst = 1 if tcp_flags & tcp.TCP_RST else 0
+
+        row = self.index.get(key)
+        if row is None:
+            row = self._new_row(key)
+            self.initiator[row] = side
+            self.start[row] = self.last[row] = now
+            self.fwd[row] = 1
+            self.bwd[row] = 0
+            self.bytes[row] = length
+            self.syn[row], self.ack[row], self.psh[row], self.rst[row] = syn, ack, psh, rst
+            self.proto[row] = proto
+            self.iat_mean[row] = self.iat_m2[row] = self.iat_max[row] = 0.0
+            self.len_mean[row] = self.len_min[row] = self.len_max[row] = length
+            self.len_m2[row] = 0.0
+            self.sw_fwd_pkts[row] = self.sw_bwd_pkts[row] = 0
+            self.sw_fwd_bytes[row] = self.sw_bwd_bytes[row] = 0
+            self.offloaded[row] = self.sw_entries[row] = 0
+            self.offload_time[row] = self.sw_duration[row] = 0.0
+            return row
+
+        # n = packets seen before this one = IAT samples after this one
+        n = int(self.fwd[row] + self.bwd[row])
+        if side == self.initiator[row]:
+            self.fwd[row] += 1
+        else:
+            self.bwd[row] += 1
+        self.bytes[row] += length
+        self.syn[row] += syn
+        self.ack[row] += ack
+        self.psh[row] += psh
+        self.rst[row] += rst
+
+        # Welford update of the IAT statistics (n IAT samples after this packet)
+        iat = now - self.last[row]
+        self.last[row] = now
+        delta = iat - self.iat_mean[row]
+        self.iat_mean[row] += delta / n
+        self.iat_m2[row] += delta * (iat - self.iat_mean[row])
+        if iat > self.iat_max[row]:
+            self.iat_max[row] = iat
+
+        # Welford update of the packet length statistics (n + 1 samples)
+        delta = length - self.len_mean[row]
+        self.len_mean[row] += delta / (n + 1)
+        self.len_m2[row] += delta * (length - self.len_mean[row])
+        if length < self.len_min[row]:
+            self.len_min[row] = length
+        if length > self.len_max[row]:
+            self.len_max[row] = length
+        return row
+
+    def packet_count(self, row):
+        return int(self.fwd[row] + self.bwd[row])
+
+    # --- SAMPLE-THEN-OFFLOAD ---
+
+    def is_fwd(self, row, side):
+        return side == self.initiator[row]
+
+    def mark_offloaded(self, row, now, entries):
+        """The flow now lives in `entries` switch flow entries (one per direction)."""
+        self.offloaded[row] = 1
+        self.sw_entries[row] = entries
+        self.offload_time[row] = now
+
+    def set_switch_counters(self, row, is_fwd, packet_count, byte_count, duration):
+        # Counters of a switch entry are cumulative since install: replace, don't add
+        if is_fwd:
+            self.sw_fwd_pkts[row] = packet_count
+            self.sw_fwd_bytes[row] = byte_count
+        else:
+            self.sw_bwd_pkts[row] = packet_count
+            self.sw_bwd_bytes[row] = byte_count
+        if duration > self.sw_duration[row]:
+            self.sw_duration[row] = duration
+
+    def switch_entry_removed(self, row):
+        self.sw_entries[row] -= 1
+
+    # --- EXPORT ---
+
+    def active_rows(self):
+        return np.flatnonzero(self.in_use[:self.high_water])
+
+    def remove(self, rows):
+        for row in rows.tolist():
+            del self.index[self.keys[row]]
+            self.keys[row] = None
+            self.free.append(row)
+        self.in_use[rows] = 0
+
+    # --- CHECKPOINTS ---
+
+    def checkpoint_sections(self):
+        rows = self.active_rows()
+        keys = [self.keys[row] for row in rows.tolist()]
+        records = np.empty(len(rows), dtype=_CHECKPOINT_DTYPE)
+        records['key_hi'] = [key >> 64 for key in keys]
+        records['key_lo'] = [key & _KEY_LO_MASK for key in keys]
+        for name in _FLOAT_COLUMNS + _INT_COLUMNS:
+            records[name] = getattr(self, name)[rows]
+        return {'': (_CHECKPOINT_DTYPE.itemsize, records.tobytes())}
+
+    def restore_sections(self, sections):
+        size, view = sections.get('', (0, b''))
+        if size != _CHECKPOINT_DTYPE.itemsize:
+            return
+        records = np.frombuffer(view, dtype=_CHECKPOINT_DTYPE)
+        keys = zip(records['key_hi'].tolist(), records['key_lo'].tolist())
+        rows = [self._new_row((hi << 64) | lo) for hi, lo in keys]
+        for name in _FLOAT_COLUMNS + _INT_COLUMNS:
+            getattr(self, name)[rows] = records[name]
+
+    def features(self, rows, extended=False):
+        """Vectorized feature computation for the given rows.
+        Returns a list of columns (NumPy arrays), in FEATURE_HEADER (+ EXTENDED_HEADER) order."""
+        offloaded = self.offloaded[rows] == 1
+
+        # Add what the switch forwarded after the offload (zero for flows never offloaded)
+        fwd = self.fwd[rows] + self.sw_fwd_pkts[rows]
+        bwd = self.bwd[rows] + self.sw_bwd_pkts[rows]
+        byts = self.bytes[rows] + self.sw_fwd_bytes[rows] + self.sw_bwd_bytes[rows]
+
+        start = self.start[rows]
+        duration = self.last[rows] - start
+        duration = np.where(offloaded,
+                            np.maximum(duration, self.offload_time[rows] - start + self.sw_duration[rows]),
+                            duration)
+        # IATs add up to the flow duration, offloaded part included
+        iat_sum = duration.copy()
+        duration[duration == 0] = 0.001     # Avoid div by zero
+
+        tot_pkts = fwd + bwd
+        columns = [
+            np.round(duration, 4),                                  # Flow Duration
+            fwd,                                                    # Tot Fwd Pkts
+            bwd,                                                    # Tot Bwd Pkts
+            np.round(byts / duration, 2),                           # Flow Byts/s
+            self.syn[rows],                                         # SYN Flag Cnt
+            self.ack[rows],                                         # ACK Flag Cnt
+            self.psh[rows],                                         # PSH Flag Cnt
+            self.rst[rows],                                         # RST Flag Cnt
+            np.round(tot_pkts / duration, 2),                       # Flow Pkts/s
+            np.round(byts / tot_pkts, 2),                           # Pkt Len Mean
+            np.where(tot_pkts > 1, np.round(iat_sum / tot_pkts, 4), 0),  # IAT Mean
+            self.proto[rows],                                       # Protocol
+        ]
+
+        if extended:
+            # Sample variance from the Welford sums (sampled packets only)
+            n_iat = self.fwd[rows] + self.bwd[rows] - 1
+            n_len = n_iat + 1
+            iat_std = np.sqrt(np.divide(self.iat_m2[rows], n_iat - 1,
+                                        out=np.zeros(len(rows)), where=n_iat > 1))
+            len_std = np.sqrt(np.divide(self.len_m2[rows], n_len - 1,
+                                        out=np.zeros(len(rows)), where=n_len > 1))
+            columns += [
+                np.round(iat_std, 4),                               # Flow IAT Std
+                np.round(self.iat_max[rows], 4),                    # Flow IAT Max
+                self.len_min[rows].astype(np.int64),                # Pkt Len Min
+                self.len_max[rows].astype(np.int64),                # Pkt Len Max
+                np.round(len_std, 2),                               # Pkt Len Std
+            ]
+        return columns
+
+
+def to_rows(columns, *extra):
+    """Columns -> list of CSV rows (tuples of plain Python numbers), with `extra`
+    constant values (e.g. the label) appended to every row."""
+    return list(zip(*[col.tolist() for col in columns], *[repeat(value) for value in extra]))
@@ -0,0 +1,69 @@
+from ryu.lib.packet import ether_types
+
+# FLOW INSTALL POLICY
+# Decides what a learned flow looks like once it is pushed to the switch:
+#   granularity        'l2'     -> match (in_port, eth_dst), one entry per destination
+#                      '5tuple' -> match (in_port, ipv4 src/dst, ip_proto, L4 ports),
+#                                  one entry per connection direction (non-IPv4 falls back to l2)
+#   idle_timeout       seconds without traffic before the switch removes the entry (0 = never)
+#   hard_timeout       seconds after install before the switch removes the entry (0 = never)
+#   send_flow_removed  ask the switch for an EventOFPFlowRemoved (final counters) on removal
+#   table_id           the table of the app's pipeline stage (pipeline.table())
+
+L2 = 'l2'
+FIVE_TUPLE = '5tuple'
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+class FlowPolicy(object):
+    def __init__(self, granularity=L2, idle_timeout=0, hard_timeout=0,
+                 send_flow_removed=False, priority=1, table_id=0):
+        if granularity not in (L2, FIVE_TUPLE):
+            raise ValueError(f"Unknown flow granularity: {granularity}")
+        self.granularity = granularity
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.send_flow_removed = send_flow_removed
+        self.priority = priority
+        self.table_id = table_id
+
+    def match(self, parser, in_port, hdr):
+        # hdr is a fast_parser.Headers record of the packet that triggered the install
+        if self.granularity == FIVE_TUPLE and hdr.ip_src is not None:
+            return parser.OFPMatch(in_port=in_port, **dict(five_tuple_match(hdr)))
+        return parser.OFPMatch(in_port=in_port, eth_dst=hdr.eth_dst)
+
+    def flow_mod(self, datapath, match, actions, cookie=0, instructions=None):
+        # instructions: prebuilt apply-actions for `actions` (base_app.output_instructions)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        inst = instructions
+        if inst is None:
+            inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        flags = ofproto.OFPFF_SEND_FLOW_REM if self.send_flow_removed else 0
+
+        return parser.OFPFlowMod(datapath=datapath,
+                                 table_id=self.table_id,
+                                 cookie=cookie,
+                                 priority=self.priority,
+                                 idle_timeout=self.idle_timeout,
+                                 hard_timeout=self.hard_timeout,
+                                 flags=flags,
+                                 match=match,
+                                 instructions=inst)
+
+
+def five_tuple_match(hdr):
+    """One direction of a connection, from a fast_parser.Headers record, as sorted
+    (field, value) pairs: hashable (block_manager keys) and OFPMatch(**dict(key)) ready.
+    Ryu orders the OXM fields itself, so the OpenFlow prerequisites hold."""
+    fields = {'eth_type': ether_types.ETH_TYPE_IP, 'ip_proto': hdr.ip_proto,
+              'ipv4_src': hdr.ip_src, 'ipv4_dst': hdr.ip_dst}
+    if hdr.ip_proto == IPPROTO_TCP:
+        fields['tcp_src'], fields['tcp_dst'] = hdr.src_port, hdr.dst_port
+    elif hdr.ip_proto == IPPROTO_UDP:
+        fields['udp_src'], fields['udp_dst'] = hdr.src_port, hdr.dst_port
+    return tuple(sorted(fields.items()))
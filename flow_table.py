@@ -0,0 +1,68 @@
+import socket
+
+from flow_features import FlowFeatureTable
+
+# BIDIRECTIONAL FLOW TABLE
+# One entry per connection, whichever direction a packet travels in.
+#
+# Key: the two endpoints (ip, port) are put in a canonical order (lower one first)
+# and packed together with the protocol into a single Python int:
+#
+#   | ip_a (32) | ip_b (32) | port_a (16) | port_b (16) | proto (8) |
+#
+# so A:1234 -> B:80 and B:80 -> A:1234 give the same key, and the "side" (0 = sent
+# by endpoint a, 1 = sent by endpoint b) tells the direction. The side of a flow's
+# first packet is its initiator (see FlowFeatureTable): its packets count as fwd.
+#
+# Timeouts (CICFlowMeter style), checked by expired_rows():
+#   idle_timeout    no packet for this long -> flow finished
+#   active_timeout  flow older than this -> exported and restarted on the next packet,
+#                   so long-lived flows still produce rows
+# Flows offloaded to a switch are finished when all their switch entries are removed.
+
+_inet_aton = socket.inet_aton
+_from_bytes = int.from_bytes
+
+
+def ip_to_int(ip):
+    return _from_bytes(_inet_aton(ip), 'big')
+
+
+def flow_key(hdr):
+    """Canonical bidirectional key of an IPv4 packet (fast_parser.Headers) -> (key, side)."""
+    src = (ip_to_int(hdr.ip_src), hdr.src_port)
+    dst = (ip_to_int(hdr.ip_dst), hdr.dst_port)
+    if src <= dst:
+        a, b, side = src, dst, 0
+    else:
+        a, b, side = dst, src, 1
+    key = (a[0] << 72) | (b[0] << 40) | (a[1] << 24) | (b[1] << 8) | hdr.ip_proto
+    return key, side
+
+
+def unpack_key(key):
+    """Packed key -> (ip_a, ip_b, proto, port_a, port_b), IPs as dotted strings."""
+    ip_a = socket.inet_ntoa(((key >> 72) & 0xFFFFFFFF).to_bytes(4, 'big'))
+    ip_b = socket.inet_ntoa(((key >> 40) & 0xFFFFFFFF).to_bytes(4, 'big'))
+    return ip_a, ip_b, key & 0xFF, (key >> 24) & 0xFFFF, (key >> 8) & 0xFFFF
+
+
+class FlowTable(FlowFeatureTable):
+    def __init__(self, idle_timeout=10.0, active_timeout=120.0, capacity=1024):
+        super(FlowTable, self).__init__(capacity)
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+
+    def add(self, hdr, now, length):
+        """Account an IPv4 packet to its flow. Returns (row, side)."""
+        key, side = flow_key(hdr)
+        return self.add_packet(key, now, length, side, hdr.tcp_flags, hdr.ip_proto), side
+
+    def expired_rows(self, now):
+        """Finished flows, ready to be exported (vectorized over all active rows)."""
+        rows = self.active_rows()
+        on_controller = self.offloaded[rows] == 0
+        timed_out = ((now - self.last[rows] > self.idle_timeout) |
+                     (now - self.start[rows] > self.active_timeout))
+        switch_done = ~on_controller & (self.sw_entries[rows] <= 0)
+        return rows[(on_controller & timed_out) | switch_done]
@@ -0,0 +1,212 @@
+import time
+from itertools import chain, islice
+
+from ryu import cfg
+
+import checkpoint
+import metrics
+
+# MAC LEARNING TABLE
+# Replaces the unbounded mac_to_port = {dpid: {mac: port}} of the L2 apps.
+#   storage      per switch one dict: MAC packed into an int -> (last seen second << 32)
+#                | port, also an int; no per-entry objects. The dict is kept in
+#                last-seen order (an entry is re-inserted when its second changes, not
+#                on every packet), so the oldest entries are always at its head
+#   aging        an entry not seen for aging_time seconds is gone: lookups treat it
+#                as unknown, and learning new MACs drops expired entries from the head
+#   capacity     at most max_entries MACs per switch; when full (and nothing has
+#                expired) new MACs are not learned and their traffic is flooded, so a
+#                CAM overflow attack cannot push out the hosts already known
+#   rate limit   with learn_rate, each (switch, port) learns (or moves) at most
+#                learn_rate MACs/s, token bucket with learn_burst
+#   moves        a MAC seen on another port moves there once; the switch's flows
+#                still sending it to the old port are deleted (eth_dst = MAC, out_port
+#                = old port). Moving again within move_hold seconds is a flap (loop or
+#                spoofing): ignored and counted, the MAC stays where it is
+# Multicast/broadcast source MACs are never learned.
+# Checkpoints (checkpoint.py): one section per switch, mac.<dpid>, of (MAC, value)
+# uint64 pairs in last-seen order, so a restarted controller does not relearn.
+#
+#   [mac_table]
+#   max_entries = 8192          # per switch
+#   aging_time = 300            # 0 = never
+#   learn_rate = 0              # new MACs/s per port, 0 = no limit
+#   learn_burst = 0             # 0 = learn_rate
+#   move_hold = 1.0
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('max_entries', default=8192,
+               help='MAC addresses learned per switch'),
+    cfg.IntOpt('aging_time', default=300,
+               help='Seconds an unseen MAC address is kept (0 = forever)'),
+    cfg.IntOpt('learn_rate', default=0,
+               help='New MAC addresses learned per second per port (0 = no limit)'),
+    cfg.IntOpt('learn_burst', default=0,
+               help='Burst of new MAC addresses per port (0 = learn_rate)'),
+    cfg.FloatOpt('move_hold', default=1.0,
+                 help='Seconds a moved MAC address stays on its new port'),
+], group='mac_table')
+
+_PORT_MASK = 0xFFFFFFFF
+_EXPIRE_PER_LEARN = 2           # expired entries dropped each time a new MAC is learned
+
+
+def mac_to_int(mac):
+    """"aa:bb:cc:dd:ee:ff" -> 48-bit int."""
+    return int(mac.replace(':', ''), 16)
+
+
+class MacTable(object):
+    def __init__(self, logger):
+        conf = CONF.mac_table
+        self.logger = logger
+        self.max_entries = conf.max_entries
+        self.aging_time = conf.aging_time
+        self.learn_rate = conf.learn_rate
+        self.learn_burst = conf.learn_burst or conf.learn_rate
+        self.move_hold = conf.move_hold
+
+        self.tables = {}            # dpid -> {mac int: seen << 32 | port}
+        self.moved = {}             # dpid -> {mac int: time of its last move}
+        self.ports = {}             # (dpid, port) -> [tokens, last refill]
+        self.events = {'learned': 0, 'moved': 0, 'flapping': 0, 'full': 0,
+                       'rate_limited': 0, 'aged': 0}
+
+        events = self.events
+        metrics.Gauge('ryu_mac_entries', 'MAC addresses in the learning tables',
+                      fn=lambda: sum(len(table) for table in self.tables.values()))
+        metrics.Counter('ryu_mac_events_total', 'MAC learning table events', ['event'],
+                        fn=lambda: {(event,): n for event, n in events.items()})
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def forward(self, datapath, in_port, src, dst):
+        """Learn src on in_port, then the port for dst (OFPP_FLOOD if unknown)."""
+        now = time.time()
+        self.learn(datapath, in_port, src, now)
+        port = self.lookup(datapath.id, dst, now)
+        return datapath.ofproto.OFPP_FLOOD if port is None else port
+
+    def learn(self, datapath, in_port, src, now):
+        mac = mac_to_int(src)
+        if mac & (1 << 40):
+            return                  # group address
+        dpid = datapath.id
+        table = self.tables.get(dpid)
+        if table is None:
+            table = self.tables[dpid] = {}
+        seen = int(now)
+        value = table.get(mac)
+        if value is None:
+            self._add(table, dpid, mac, in_port, now)
+            return
+        port = value & _PORT_MASK
+        if port != in_port:
+            self._move(datapath, table, mac, src, port, in_port, now)
+        elif value >> 32 != seen:
+            del table[mac]          # back to the tail: last-seen order
+            table[mac] = (seen << 32) | in_port
+
+    def lookup(self, dpid, dst, now):
+        """Port of dst on switch dpid, or None."""
+        table = self.tables.get(dpid)
+        if table is None:
+            return None
+        mac = mac_to_int(dst)
+        value = table.get(mac)
+        if value is None:
+            return None
+        if self.aging_time and int(now) - (value >> 32) > self.aging_time:
+            del table[mac]
+            self.events['aged'] += 1
+            return None
+        return value & _PORT_MASK
+
+    def forget_switch(self, dpid):
+        self.tables.pop(dpid, None)
+        self.moved.pop(dpid, None)
+        for key in [key for key in self.ports if key[0] == dpid]:
+            del self.ports[key]
+
+    # --- CHECKPOINTS ---
+
+    def checkpoint_sections(self):
+        return {f'mac.{dpid}': (16, checkpoint.u64_bytes(chain.from_iterable(table.items())))
+                for dpid, table in self.tables.items()}
+
+    def restore_sections(self, sections):
+        for suffix, (size, view) in sections.items():
+            if not suffix.startswith('mac.') or size != 16:
+                continue
+            records = checkpoint.u64_array(view)
+            self.tables[int(suffix[4:])] = dict(zip(records[0::2], records[1::2]))
+        self.logger.info(f"[MAC] {len(self)} MAC addresses restored on"
+                         f" {len(self.tables)} switch(es)")
+
+    def _add(self, table, dpid, mac, in_port, now):
+        if self.aging_time:
+            self._expire(table, now, _EXPIRE_PER_LEARN)
+        if len(table) >= self.max_entries:
+            self.events['full'] += 1
+            return
+        if not self._admit(dpid, in_port, now):
+            return
+        table[mac] = (int(now) << 32) | in_port
+        self.events['learned'] += 1
+
+    def _move(self, datapath, table, mac, src, old_port, in_port, now):
+        dpid = datapath.id
+        moved = self.moved.get(dpid)
+        if moved is None:
+            moved = self.moved[dpid] = {}
+        last = moved.get(mac)
+        if last is not None and now - last < self.move_hold:
+            self.events['flapping'] += 1
+            return
+        if not self._admit(dpid, in_port, now):
+            return
+        del table[mac]
+        table[mac] = (int(now) << 32) | in_port
+        if len(moved) >= self.max_entries:
+            for key in [key for key, t in moved.items() if now - t >= self.move_hold]:
+                del moved[key]
+        moved[mac] = now
+        self.events['moved'] += 1
+        self.logger.debug("MAC %s moved from port %s to %s on switch %s",
+                          src, old_port, in_port, dpid)
+        self._delete_flows(datapath, src, old_port)
+
+    def _expire(self, table, now, limit):
+        cutoff = int(now) - self.aging_time
+        for mac in list(islice(table, limit)):
+            if table[mac] >> 32 >= cutoff:
+                break
+            del table[mac]
+            self.events['aged'] += 1
+
+    def _admit(self, dpid, port, now):
+        # Token bucket per (switch, port) for new and moved MACs
+        if not self.learn_rate:
+            return True
+        key = (dpid, port)
+        state = self.ports.get(key)
+        if state is None:
+            state = self.ports[key] = [float(self.learn_burst), now]
+        tokens = min(self.learn_burst, state[0] + (now - state[1]) * self.learn_rate)
+        state[1] = now
+        if tokens < 1:
+            state[0] = tokens
+            self.events['rate_limited'] += 1
+            return False
+        state[0] = tokens - 1
+        return True
+
+    def _delete_flows(self, datapath, mac, port):
+        # Flows of any app and table still forwarding `mac` to the port it left
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPFlowMod(
+            datapath=datapath, command=ofproto.OFPFC_DELETE, table_id=ofproto.OFPTT_ALL,
+            out_port=port, out_group=ofproto.OFPG_ANY, match=parser.OFPMatch(eth_dst=mac)))
@@ -0,0 +1,237 @@
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import metrics
+import pipeline
+
+# METER MANAGER
+# Rate limiting as the first response instead of an all-or-nothing drop rule:
+#   - a suspicious host gets an OpenFlow 1.3 meter (same meter id on every switch) and
+#     a rule at `priority` that sends its traffic through the meter, then floods it like
+#     the apps' normal forwarding: the switch polices it, the controller is out of the path.
+#     The rule sits next to the drop rules, in the pipeline's ACL table
+#   - band_type drop discards packets above the rate, dscp_remark only lowers their
+#     drop precedence (prec_level) so congested links shed them first
+#   - meter stats are polled every poll_interval; if the host keeps sending at more than
+#     escalate_factor x its allowed rate, it moves to the next (lower) entry of `rates`,
+#     and after the last one it is handed to the block manager for a full drop
+#   - policing ends after hard_timeout seconds (meter and its rules are deleted)
+# The app forwards EventOFPMeterStatsReply to stats_reply().
+#
+#   [meter]
+#   enabled = false             # true: detectors rate limit first, false: drop right away
+#   rates = 1000,100            # packets/s, one escalation step per entry
+#   burst = 50
+#   band_type = drop            # or dscp_remark
+#   prec_level = 1
+#   escalate_factor = 2.0
+#   poll_interval = 5
+#   hard_timeout = 300
+#   priority = 90               # below [block] priority, so a drop always wins
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.BoolOpt('enabled', default=False,
+                help='Rate limit suspicious hosts with meters before dropping them'),
+    cfg.ListOpt('rates', default=['1000', '100'],
+                help='Allowed packets/s for each escalation step'),
+    cfg.IntOpt('burst', default=50,
+               help='Meter burst size (packets)'),
+    cfg.StrOpt('band_type', default='drop', choices=['drop', 'dscp_remark'],
+               help='What the meter does above the rate'),
+    cfg.IntOpt('prec_level', default=1,
+               help='Drop precedence added by a dscp_remark band'),
+    cfg.FloatOpt('escalate_factor', default=2.0,
+                 help='Escalate when the offered rate exceeds this times the allowed rate'),
+    cfg.FloatOpt('poll_interval', default=5.0,
+                 help='Seconds between two meter stats requests'),
+    cfg.IntOpt('hard_timeout', default=300,
+               help='Seconds a host stays rate limited (0 = never)'),
+    cfg.IntOpt('priority', default=90,
+               help='Priority of metered rules, must be below the block priority'),
+], group='meter')
+
+# Cookie of every metered rule installed by the meter manager
+METER_COOKIE = 0x3E7E000000000000
+
+RESEND_INTERVAL = 1.0
+
+ESCALATIONS = metrics.Counter('ryu_meter_escalations_total',
+                              'Policed hosts moved to a lower rate or to a drop')
+
+
+class MeterManager(object):
+    def __init__(self, logger, blocks):
+        conf = CONF.meter
+        self.logger = logger
+        self.blocks = blocks            # block_manager.BlockManager for the final step
+        self.enabled = conf.enabled
+        self.rates = [int(rate) for rate in conf.rates]
+        self.burst = conf.burst
+        self.band_type = conf.band_type
+        self.prec_level = conf.prec_level
+        self.escalate_factor = conf.escalate_factor
+        self.poll_interval = conf.poll_interval
+        self.hard_timeout = conf.hard_timeout
+        self.priority = conf.priority
+
+        self.datapaths = {}             # dpid -> datapath
+        # Keys are block-manager style matches: sorted tuples of (field, value) pairs
+        self.policed = {}               # key -> [meter_id, step, expiry (0 = never)]
+        self.by_meter = {}              # meter_id -> key
+        self.free_ids = []
+        self.next_id = 1
+        self.counters = {}              # (dpid, meter_id) -> (packet_in_count, duration)
+        self.last_resend = {}           # (dpid, key) -> time of last re-send
+
+        metrics.Gauge('ryu_meters_policed', 'Hosts currently rate limited by a meter',
+                      fn=lambda: len(self.policed))
+        self.poll_thread = hub.spawn(self._poll_loop)
+
+    # --- SWITCH TRACKING ---
+
+    def add_datapath(self, datapath):
+        self.datapaths[datapath.id] = datapath
+        for key, (meter_id, step, _) in self.policed.items():
+            self._install(datapath, key, meter_id, self.rates[step], datapath.ofproto.OFPMC_ADD)
+
+    def remove_datapath(self, datapath):
+        self.datapaths.pop(datapath.id, None)
+
+    # --- POLICING ---
+
+    def police(self, key):
+        """Start rate limiting `key` at the first step (no-op if already policed)."""
+        if key in self.policed:
+            return
+        if self.free_ids:
+            meter_id = self.free_ids.pop()
+        else:
+            meter_id = self.next_id
+            self.next_id += 1
+        expiry = time.time() + self.hard_timeout if self.hard_timeout else 0
+        self.policed[key] = [meter_id, 0, expiry]
+        self.by_meter[meter_id] = key
+        for datapath in self.datapaths.values():
+            self._install(datapath, key, meter_id, self.rates[0], datapath.ofproto.OFPMC_ADD)
+        self.logger.info(f"[METER] {dict(key)} rate limited to {self.rates[0]} pkt/s"
+                         f" on {len(self.datapaths)} switch(es)")
+
+    def is_policed(self, key):
+        return key in self.policed
+
+    def check_packet_in(self, datapath, key):
+        """Call from the packet-in handler. A policed host's packet reaching the
+        controller means the switch lost the metered rule: re-send it, drop the packet."""
+        state = self.policed.get(key)
+        if state is None:
+            return False
+        now = time.time()
+        if now - self.last_resend.get((datapath.id, key), 0) >= RESEND_INTERVAL:
+            self.last_resend[(datapath.id, key)] = now
+            # The meter itself is still there (it is only deleted by release())
+            self._send_rule(datapath, key, state[0])
+        return True
+
+    def release(self, key):
+        state = self.policed.pop(key, None)
+        if state is None:
+            return
+        meter_id = state[0]
+        del self.by_meter[meter_id]
+        self.free_ids.append(meter_id)
+        for datapath in self.datapaths.values():
+            self._delete(datapath, meter_id)
+            self.counters.pop((datapath.id, meter_id), None)
+        self.last_resend = {k: t for k, t in self.last_resend.items() if k[1] != key}
+
+    def _escalate(self, key, offered):
+        meter_id, step, _ = self.policed[key]
+        ESCALATIONS.inc()
+        if step + 1 < len(self.rates):
+            self.policed[key][1] = step + 1
+            for datapath in self.datapaths.values():
+                self._send_meter(datapath, meter_id, self.rates[step + 1],
+                                 datapath.ofproto.OFPMC_MODIFY)
+            self.logger.info(f"[METER] {dict(key)} still sending {offered:.0f} pkt/s,"
+                             f" limited to {self.rates[step + 1]} pkt/s")
+        else:
+            self.logger.info(f"[METER] {dict(key)} still sending {offered:.0f} pkt/s, dropping")
+            self.release(key)
+            self.blocks.block(key)
+
+    # --- METER STATS ---
+
+    def stats_reply(self, msg):
+        dpid = msg.datapath.id
+        for stat in msg.body:
+            key = self.by_meter.get(stat.meter_id)
+            if key is None:
+                continue
+            duration = stat.duration_sec + stat.duration_nsec / 1e9
+            last = self.counters.get((dpid, stat.meter_id))
+            self.counters[(dpid, stat.meter_id)] = (stat.packet_in_count, duration)
+            if last is None or duration <= last[1]:
+                continue
+            offered = (stat.packet_in_count - last[0]) / (duration - last[1])
+            step = self.policed[key][1]
+            if offered > self.escalate_factor * self.rates[step]:
+                self._escalate(key, offered)
+
+    def _poll_loop(self):
+        while True:
+            hub.sleep(self.poll_interval)
+            now = time.time()
+            for key, (_, _, expiry) in list(self.policed.items()):
+                if expiry and expiry <= now:
+                    self.logger.info(f"[METER] {dict(key)} rate limit expired")
+                    self.release(key)
+            if not self.policed:
+                continue
+            for datapath in self.datapaths.values():
+                parser = datapath.ofproto_parser
+                datapath.send_msg(parser.OFPMeterStatsRequest(datapath, 0,
+                                                              datapath.ofproto.OFPM_ALL))
+
+    # --- METER / FLOW MODS ---
+
+    def _install(self, datapath, key, meter_id, rate, command):
+        self._send_meter(datapath, meter_id, rate, command)
+        if command == datapath.ofproto.OFPMC_ADD:
+            # The meter must exist before a rule can point at it
+            datapath.send_msg(datapath.ofproto_parser.OFPBarrierRequest(datapath))
+            self._send_rule(datapath, key, meter_id)
+
+    def _send_meter(self, datapath, meter_id, rate, command):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if self.band_type == 'dscp_remark':
+            band = parser.OFPMeterBandDscpRemark(rate=rate, burst_size=self.burst,
+                                                 prec_level=self.prec_level)
+        else:
+            band = parser.OFPMeterBandDrop(rate=rate, burst_size=self.burst)
+        flags = ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST | ofproto.OFPMF_STATS
+        datapath.send_msg(parser.OFPMeterMod(datapath, command=command, flags=flags,
+                                             meter_id=meter_id, bands=[band]))
+
+    def _send_rule(self, datapath, key, meter_id):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        inst = [parser.OFPInstructionMeter(meter_id, ofproto.OFPIT_METER),
+                parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                             [parser.OFPActionOutput(ofproto.OFPP_FLOOD)])]
+        datapath.send_msg(parser.OFPFlowMod(datapath=datapath,
+                                            table_id=pipeline.table(pipeline.ACL),
+                                            cookie=METER_COOKIE | meter_id,
+                                            priority=self.priority,
+                                            match=parser.OFPMatch(**dict(key)),
+                                            instructions=inst))
+
+    def _delete(self, datapath, meter_id):
+        # Deleting a meter also removes every flow entry that uses it
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPMeterMod(datapath, command=ofproto.OFPMC_DELETE,
+                                             meter_id=meter_id))
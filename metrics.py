@@ -0,0 +1,188 @@
+import bisect
+import functools
+import logging
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+# METRICS
+# Counters, gauges and latency histograms for the apps, served in the Prometheus text
+# format on http://<host>:<port>/metrics (a WSGI server on the hub, only with port set).
+#   Counter / Gauge  a value per label set; with fn, the value is read from fn() at scrape
+#                    time instead (fn returns a number, or {label values: number}), so
+#                    counters the helpers keep anyway cost nothing on the hot path
+#   Histogram        observe(seconds) into fixed buckets (cumulative on export)
+# Metrics register themselves by name; registering a name that is already taken raises
+# ValueError instead of replacing the first one's values (a second helper object with
+# fn= metrics in one process would otherwise hide the first one's).
+#
+# PacketLog replaces per-packet print(): 1 in log_sample packet lines is logged at
+# debug level, the others are not even formatted. timed() wraps a handler into a
+# latency histogram.
+#
+#   [metrics]
+#   port = 0                    # 0 = no HTTP endpoint
+#   host = 127.0.0.1
+#   log_sample = 1000           # 0 = no per-packet lines
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('port', default=0,
+               help='Port of the /metrics endpoint (0 = disabled)'),
+    cfg.StrOpt('host', default='127.0.0.1',
+               help='Address of the /metrics endpoint'),
+    cfg.IntOpt('log_sample', default=1000,
+               help='Log one in this many per-packet lines at debug level (0 = none)'),
+], group='metrics')
+
+# 10us .. 1s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_registry = {}              # name -> metric, in registration order
+_server = None
+
+
+def _register(metric):
+    if metric.name in _registry:
+        raise ValueError(f'metric {metric.name} is already registered')
+    _registry[metric.name] = metric
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        self.values = {}            # label values -> number
+        _register(self)
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        values = self.values
+        if self.fn is not None:
+            values = self.fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+        for labels, value in values.items():
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last one: above every bucket
+        self.sum = 0.0
+        _register(self)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{bound}"}}', total
+        total += self.counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}}', total
+        yield f'{self.name}_sum', self.sum
+        yield f'{self.name}_count', total
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, value in metric.samples():
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- HTTP ENDPOINT ---
+
+def _wsgi_app(environ, start_response):
+    if environ.get('PATH_INFO') != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'not found\n']
+    body = render().encode()
+    start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def serve(logger):
+    """Start the endpoint if [metrics] port is set; safe to call from every app."""
+    global _server
+    conf = CONF.metrics
+    if _server is not None or not conf.port:
+        return
+    _server = hub.WSGIServer((conf.host, conf.port), _wsgi_app)
+    hub.spawn(_server.serve_forever)
+    logger.info(f"[METRICS] serving http://{conf.host}:{conf.port}/metrics")
+
+
+# --- SAMPLED PER-PACKET LOGGING ---
+
+class PacketLog(object):
+    def __init__(self, logger, every=None):
+        self.logger = logger
+        self.every = CONF.metrics.log_sample if every is None else every
+        self.count = 0
+
+    def due(self):
+        """True for one call in `every` while debug logging is on; wrap lines whose
+        arguments cost something to compute in `if log.due():`."""
+        if not self.every or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        self.count += 1
+        if self.count < self.every:
+            return False
+        self.count = 0
+        return True
+
+    def debug(self, fmt, *args):
+        """Like logger.debug(fmt, *args), for one call in `every`."""
+        if self.due():
+            self.logger.debug(fmt, *args)
+
+
+def timed(histogram):
+    """Decorator: observe how long each call takes (e.g. a packet-in handler; put it
+    below @set_ev_cls)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
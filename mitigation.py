@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import time
+
+from ryu import cfg
+
+import block_manager
+import flow_policy
+
+# ALERT MITIGATION
+# Turns IDS alerts (snort_alerts.Alert) into rules on every switch. `action` picks them:
+#   drop        a drop rule through the block manager
+#   rate_limit  a meter through the meter manager (meter_manager.py, [meter] config
+#               section), which escalates to a drop if the offender keeps sending
+# What the rule matches depends on `granularity`:
+#   src_mac   the offending packet's source MAC
+#   src_ip    its source IPv4 address (falls back to the MAC for non-IPv4 packets)
+#   5tuple    only that connection direction (ip src/dst, proto, L4 ports)
+# The first alert for an offender is acted on immediately. Further alerts for the same
+# key within coalesce_window seconds are only counted. With drop, an alert after the
+# window while the block is still active blocks the key again (new hard timeout, the
+# drop rule re-sent to every switch), so an alert storm costs one FlowMod per switch per
+# window. With rate_limit, alerts for a key that is already policed or blocked are only
+# counted: the meter manager escalates on the measured rate, not on alerts.
+#
+#   [mitigation]
+#   action = drop               # or rate_limit
+#   granularity = src_ip
+#   coalesce_window = 5
+#   max_priority = 3            # ignore alerts with a priority number above this
+
+DROP = 'drop'
+RATE_LIMIT = 'rate_limit'
+
+SRC_MAC = 'src_mac'
+SRC_IP = 'src_ip'
+FIVE_TUPLE = '5tuple'
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('action', default=DROP, choices=[DROP, RATE_LIMIT],
+               help='What an alert installs: drop or rate_limit (meter, then drop)'),
+    cfg.StrOpt('granularity', default=SRC_IP,
+               choices=[SRC_MAC, SRC_IP, FIVE_TUPLE],
+               help='What an alert blocks: src_mac, src_ip or 5tuple'),
+    cfg.FloatOpt('coalesce_window', default=5.0,
+                 help='Seconds during which repeated alerts for one offender are merged'),
+    cfg.IntOpt('max_priority', default=3,
+               help='Only act on alerts with this Snort priority or more urgent (1 = highest)'),
+], group='mitigation')
+
+
+class AlertMitigator(object):
+    def __init__(self, blocks, logger, meters=None, action=None, granularity=None,
+                 coalesce_window=None, max_priority=None):
+        conf = CONF.mitigation
+        self.blocks = blocks
+        self.meters = meters            # meter_manager.MeterManager, needed for rate_limit
+        self.logger = logger
+        self.action = action or conf.action
+        if self.action == RATE_LIMIT and meters is None:
+            raise ValueError("rate_limit mitigation needs a meter manager")
+        self.granularity = granularity or conf.granularity
+        self.coalesce_window = conf.coalesce_window if coalesce_window is None else coalesce_window
+        self.max_priority = max_priority or conf.max_priority
+
+        # key -> time the key was last (re)blocked, oldest first
+        self.last_action = OrderedDict()
+        self.mitigated = 0
+        self.coalesced = 0
+        self.ignored = 0            # low priority or no usable packet
+
+    def key(self, hdr):
+        """Block key for a packet (fast_parser.Headers) at the configured granularity."""
+        if hdr.ip_src is None or self.granularity == SRC_MAC:
+            return block_manager.mac_match(hdr.eth_src)
+        if self.granularity == FIVE_TUPLE:
+            return flow_policy.five_tuple_match(hdr)
+        return block_manager.ipv4_match(hdr.ip_src)
+
+    def handle(self, alert):
+        if alert.hdr is None or alert.priority > self.max_priority:
+            self.ignored += 1
+            return False
+
+        key = self.key(alert.hdr)
+        now = time.time()
+        if self.action == RATE_LIMIT:
+            if self.meters.is_policed(key) or self.blocks.is_blocked(key):
+                self.coalesced += 1
+                return False
+            self.meters.police(key)
+            self.mitigated += 1
+            self.logger.info(f"[MITIGATE] {alert.msg}: rate limited {dict(key)}")
+            return True
+
+        last = self.last_action.get(key)
+        if last is not None and now - last < self.coalesce_window and self.blocks.is_blocked(key):
+            self.coalesced += 1
+            return False
+
+        self.last_action[key] = now
+        self.last_action.move_to_end(key)
+        self.blocks.block(key)
+        self.mitigated += 1
+        self.logger.info(f"[MITIGATE] {alert.msg}: blocked {dict(key)}")
+        self._prune(now)
+        return True
+
+    def check_packet_in(self, datapath, hdr):
+        """Packet-in from a mitigated offender: repair the switch, ignore the packet."""
+        key = self.key(hdr)
+        if self.blocks.check_packet_in(datapath, key):
+            return True
+        return self.meters is not None and self.meters.check_packet_in(datapath, key)
+
+    def _prune(self, now):
+        # Forget offenders whose window has passed, oldest first: O(1) per alert
+        # however many offenders are inside the window
+        last_action = self.last_action
+        while last_action and now - next(iter(last_action.values())) >= self.coalesce_window:
+            last_action.popitem(last=False)
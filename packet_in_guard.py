@@ -0,0 +1,161 @@
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import pipeline
+
+# PACKET-IN GUARD
+# Control-plane protection in front of the packet-in handlers, three independent layers:
+#   switch meter     the table-miss entry goes through a meter: packet-ins above
+#                    meter_rate per second are dropped by the switch itself and never
+#                    reach the controller (needs meter support on the switch)
+#   truncation       with miss_max_len the switch buffers the packet and only sends the
+#                    first miss_max_len bytes (headers); the app releases the buffer with
+#                    buffer_id in its PacketOut. Switches without buffers get whole packets.
+#   port quotas      per (switch, in_port) token bucket in the controller: a port over
+#                    port_quota packet-ins/s has the excess shed before any parsing, so
+#                    one flooding port cannot starve the others
+# Shed counts (controller quotas and switch meter drops, read from meter stats) are
+# logged every report_interval seconds. The app forwards EventOFPMeterStatsReply to
+# stats_reply().
+#
+#   [packet_in]
+#   meter_rate = 0              # packet-ins/s per switch, 0 = no meter
+#   meter_burst = 100
+#   miss_max_len = 0            # bytes sent up per packet-in, 0 = whole packet
+#   port_quota = 0              # packet-ins/s per port, 0 = no quota
+#   port_burst = 0              # 0 = port_quota
+#   report_interval = 10
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('meter_rate', default=0,
+               help='Table-miss meter rate in packet-ins/s per switch (0 = no meter)'),
+    cfg.IntOpt('meter_burst', default=100,
+               help='Table-miss meter burst size (packets)'),
+    cfg.IntOpt('miss_max_len', default=0,
+               help='Bytes of a table-miss packet sent to the controller (0 = all)'),
+    cfg.IntOpt('port_quota', default=0,
+               help='Packet-ins/s accepted per switch port (0 = no quota)'),
+    cfg.IntOpt('port_burst', default=0,
+               help='Burst of packet-ins accepted per port (0 = port_quota)'),
+    cfg.FloatOpt('report_interval', default=10.0,
+                 help='Seconds between two shed reports (0 = never)'),
+], group='packet_in')
+
+# Meter id of the table-miss meter, kept apart from the ids meter_manager hands out
+TABLE_MISS_METER_ID = 0xFFFF
+
+
+class PacketInGuard(object):
+    def __init__(self, logger):
+        conf = CONF.packet_in
+        self.logger = logger
+        self.meter_rate = conf.meter_rate
+        self.meter_burst = conf.meter_burst
+        self.miss_max_len = conf.miss_max_len
+        self.port_quota = conf.port_quota
+        self.port_burst = conf.port_burst or conf.port_quota
+        self.report_interval = conf.report_interval
+
+        self.datapaths = {}         # dpid -> datapath (for meter stats)
+        self.ports = {}             # (dpid, in_port) -> [tokens, last refill]
+        self.admitted = 0
+        self.shed = 0
+        self.shed_ports = {}        # (dpid, in_port) -> packet-ins shed since the last report
+        self.meter_drops = {}       # dpid -> packet-ins dropped by the switch meter
+
+        self.report_thread = None
+        if self.report_interval:
+            self.report_thread = hub.spawn(self._report_loop)
+
+    def close(self):
+        if self.report_thread is not None:
+            hub.kill(self.report_thread)
+            self.report_thread = None
+
+    # --- TABLE-MISS ---
+
+    def install_table_miss(self, features):
+        """Install the table-miss entry from an EventOFPSwitchFeatures message."""
+        datapath = features.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.datapaths[datapath.id] = datapath
+
+        max_len = ofproto.OFPCML_NO_BUFFER
+        if self.miss_max_len:
+            if features.n_buffers:
+                max_len = self.miss_max_len
+            else:
+                self.logger.info(f"[PACKET-IN] switch {datapath.id} has no packet buffers,"
+                                 f" sending whole packets")
+
+        inst = []
+        if self.meter_rate:
+            band = parser.OFPMeterBandDrop(rate=self.meter_rate, burst_size=self.meter_burst)
+            datapath.send_msg(parser.OFPMeterMod(
+                datapath, command=ofproto.OFPMC_ADD,
+                flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST | ofproto.OFPMF_STATS,
+                meter_id=TABLE_MISS_METER_ID, bands=[band]))
+            datapath.send_msg(parser.OFPBarrierRequest(datapath))
+            inst.append(parser.OFPInstructionMeter(TABLE_MISS_METER_ID, ofproto.OFPIT_METER))
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, max_len)]
+        inst.append(parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions))
+        # In the last table of the pipeline: a packet-in means nothing forwarded it
+        datapath.send_msg(parser.OFPFlowMod(datapath=datapath,
+                                            table_id=pipeline.table(pipeline.FORWARD),
+                                            priority=0, match=parser.OFPMatch(),
+                                            instructions=inst))
+
+    # --- PER-PORT QUOTAS ---
+
+    def admit(self, msg):
+        """Call first thing in the packet-in handler; False = shed this packet-in."""
+        if not self.port_quota:
+            self.admitted += 1
+            return True
+        key = (msg.datapath.id, msg.match['in_port'])
+        now = time.time()
+        state = self.ports.get(key)
+        if state is None:
+            state = self.ports[key] = [float(self.port_burst), now]
+        tokens = min(self.port_burst, state[0] + (now - state[1]) * self.port_quota)
+        state[1] = now
+        if tokens < 1:
+            state[0] = tokens
+            self.shed += 1
+            self.shed_ports[key] = self.shed_ports.get(key, 0) + 1
+            return False
+        state[0] = tokens - 1
+        self.admitted += 1
+        return True
+
+    # --- REPORTING ---
+
+    def stats_reply(self, msg):
+        for stat in msg.body:
+            if stat.meter_id == TABLE_MISS_METER_ID and stat.band_stats:
+                self.meter_drops[msg.datapath.id] = stat.band_stats[0].packet_band_count
+
+    def _report_loop(self):
+        last_shed = last_meter = 0
+        while True:
+            hub.sleep(self.report_interval)
+            if self.meter_rate:
+                for datapath in self.datapaths.values():
+                    if not datapath.is_active:
+                        continue
+                    datapath.send_msg(datapath.ofproto_parser.OFPMeterStatsRequest(
+                        datapath, 0, TABLE_MISS_METER_ID))
+            meter = sum(self.meter_drops.values())
+            if self.shed == last_shed and meter == last_meter:
+                continue
+            top = sorted(self.shed_ports.items(), key=lambda item: -item[1])[:3]
+            ports = ", ".join(f"s{dpid}:{port}={n}" for (dpid, port), n in top)
+            self.logger.info(f"[PACKET-IN] {self.admitted} admitted, {self.shed} shed by port"
+                             f" quotas ({self.shed - last_shed} new{': ' + ports if ports else ''}),"
+                             f" {meter} dropped by switch meters")
+            last_shed, last_meter = self.shed, meter
+            self.shed_ports = {}
@@ -0,0 +1,128 @@
+import logging
+
+import numpy as np
+
+from ryu import cfg
+from ryu.lib.packet import tcp
+
+import detectors
+import fast_parser
+import flow_classifier
+import flow_extractor
+import flow_features
+import flow_table
+import metrics
+
+# PACKET-IN WORKER HANDLERS
+# The per-packet halves of the IDS apps, run inside worker_pool processes. The hub keeps
+# forwarding (MAC learning, PacketOut) and everything that sends to switches; the
+# workers get the raw frames of their shard and return what the hub has to act on.
+#
+#   SynFloodWorker     9_syn_flood_detection.py: packet and SYN rates per source MAC,
+#                      sharded by source MAC. Returns the MACs that crossed the SYN
+#                      threshold.
+#   FlowFeatureWorker  14_collector_twelve_features.py: flow_extractor.FlowExtractor
+#                      and (with a model) classification, sharded by host pair so both
+#                      directions of a flow land in the same worker. Returns
+#                      ('rows', dataset rows) and ('attack', initiator ip).
+
+CONF = cfg.CONF
+
+
+class SynFloodWorker(object):
+    def __init__(self):
+        # Thresholds/window/algorithm from the hub's [detector] config section
+        self.packet_rate = detectors.create(CONF.detector.packet_threshold)
+        self.syn_rate = detectors.create(CONF.detector.syn_threshold)
+        self.logger = logging.getLogger(__name__)
+        self.packet_log = metrics.PacketLog(self.logger)
+
+    def process(self, data):
+        hdr = fast_parser.parse(data)
+        if hdr is None:
+            return None
+        src_mac = hdr.eth_src
+
+        self.packet_rate.hit(src_mac)
+        is_syn = (hdr.ip_proto == 6 and (hdr.tcp_flags & tcp.TCP_SYN)
+                  and not (hdr.tcp_flags & tcp.TCP_ACK))
+        syn_flood = is_syn and self.syn_rate.hit(src_mac)
+        # One sampling slot per packet, both rates on one line
+        if self.packet_log.due():
+            if is_syn:
+                self.logger.debug("SYN from %s, rate = %.1f/window, SYN rate = %.1f/window", src_mac,
+                                  self.packet_rate.rate(src_mac), self.syn_rate.rate(src_mac))
+            else:
+                self.logger.debug("Packet from %s, rate = %.1f/window", src_mac,
+                                  self.packet_rate.rate(src_mac))
+        if syn_flood:
+            print(f"[ALERT] SYN Flood detected from {src_mac}")
+            self.packet_rate.forget(src_mac)
+            self.syn_rate.forget(src_mac)
+            return [src_mac]
+        return None
+
+
+class FlowFeatureWorker(object):
+    def __init__(self, idle_timeout, active_timeout, label, extended, model_columns=None):
+        """model_columns: indices of the model's features among the feature columns,
+        None = no classification."""
+        self.model = None
+        classify = None
+        model_extended = False
+        if model_columns is not None:
+            conf = CONF.inference
+            self.model = flow_classifier.FlowClassifier.load(conf.model_path, conf.threshold)
+            self.model_columns = model_columns
+            model_extended = max(model_columns) >= len(flow_features.FEATURE_HEADER)
+            self.classify_after = conf.classify_after
+            classify = self._classify_exported
+        self.extractor = flow_extractor.FlowExtractor(idle_timeout, active_timeout, label,
+                                                      extended, classify, model_extended)
+        self.table = self.extractor.table
+        self.to_classify = []
+        self.attacks = []
+
+    def process(self, item):
+        now, length, data = item
+        added = self.extractor.add(now, length, data)
+        if added is None:
+            return None
+        row = added[0]
+        if self.model is not None and self.table.packet_count(row) == self.classify_after:
+            self.to_classify.append(row)
+        return None
+
+    def flush(self):
+        # Flows that reached classify_after in this batch are classified together
+        if not self.to_classify:
+            return None
+        rows = np.array(self.to_classify)
+        self.to_classify = []
+        return self._attacks(rows, self.table.features(
+            rows, extended=self.extractor.classify_extended))
+
+    def tick(self, now):
+        rows = self.extractor.expire(now)
+        if not rows:
+            return None
+        results, self.attacks = self.attacks, []
+        results.append(('rows', rows))
+        return results
+
+    def _classify_exported(self, rows, columns):
+        # Flows that ended before reaching classify_after were never classified
+        short = np.flatnonzero(self.table.fwd[rows] + self.table.bwd[rows]
+                               < self.classify_after)
+        if len(short):
+            self.attacks += self._attacks(rows[short], [column[short] for column in columns])
+
+    def _attacks(self, rows, columns):
+        X = np.column_stack([columns[i] for i in self.model_columns]).astype(np.float64)
+        keys = self.table.keys
+        initiator = self.table.initiator
+        results = []
+        for row in rows[self.model.predict(X)].tolist():
+            ip_a, ip_b = flow_table.unpack_key(keys[row])[:2]
+            results.append(('attack', ip_b if initiator[row] else ip_a))
+        return results
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import flow_extractor
+import flow_features
+import pcap_reader
+
+# OFFLINE FEATURE EXTRACTION
+# Builds the twelve-feature dataset straight from capture files instead of live
+# packet-ins: every pcap/pcapng file is streamed (pcap_reader, mmap'd) through the same
+# flow_extractor.FlowExtractor as 14_collector_twelve_features.py, driven by the capture
+# timestamps, so the CSV has the collector's columns and can go to train_classifier.py.
+# Files are independent (each starts with an empty flow table and exports every flow
+# left at its end), so they are processed in parallel, one per process; their rows are
+# then concatenated in the order the files were given.
+#
+# Usage:
+#   python pcap_features.py normal.pcap -o normal.csv
+#   python pcap_features.py attack-*.pcapng --label 1 -o attack.csv --jobs 8
+#   python pcap_features.py capture.pcap --extended --idle-timeout 10 --active-timeout 120
+
+# Capture seconds between two checks for finished flows, as the collector's EXPORT_INTERVAL
+EXPIRE_INTERVAL = 1.0
+
+
+def extract(path, part, idle_timeout, active_timeout, label, extended):
+    """Rows of one capture file -> CSV `part` (no header). Returns (packets, flows)."""
+    extractor = flow_extractor.FlowExtractor(idle_timeout, active_timeout, label, extended)
+    add = extractor.add
+    packets = flows = 0
+    next_expire = None
+    with open(part, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for now, length, data in pcap_reader.read_packets(path):
+            packets += 1
+            add(now, length, data)
+            if next_expire is None:
+                next_expire = now + EXPIRE_INTERVAL
+            elif now >= next_expire:
+                rows = extractor.expire(now)
+                writer.writerows(rows)
+                flows += len(rows)
+                next_expire = now + EXPIRE_INTERVAL
+        rows = extractor.finish()
+        writer.writerows(rows)
+        flows += len(rows)
+    return packets, flows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Twelve-feature dataset from pcap/pcapng files")
+    parser.add_argument('captures', nargs='+', help="pcap or pcapng files (Ethernet)")
+    parser.add_argument('-o', '--output', default='14_dataset.csv')
+    parser.add_argument('--label', type=int, default=0, help="0 = normal, 1 = attack")
+    parser.add_argument('--extended', action='store_true',
+                        help="Add the extended CICFlowMeter-style columns")
+    parser.add_argument('--idle-timeout', type=float, default=10.0)
+    parser.add_argument('--active-timeout', type=float, default=120.0)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="Files processed in parallel")
+    args = parser.parse_args()
+
+    header = flow_features.FEATURE_HEADER[:]
+    if args.extended:
+        header += flow_features.EXTENDED_HEADER
+    parts = [f'{args.output}.part{i}' for i in range(len(args.captures))]
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(args.captures)))) as pool:
+            futures = [pool.submit(extract, path, part, args.idle_timeout, args.active_timeout,
+                                   args.label, args.extended)
+                       for path, part in zip(args.captures, parts)]
+            results = [future.result() for future in futures]
+
+        with open(args.output, 'w', newline='') as out:
+            csv.writer(out).writerow(header + ["Label"])
+            for part in parts:
+                with open(part, newline='') as f:
+                    shutil.copyfileobj(f, out)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+    elapsed = time.perf_counter() - start
+    for path, (packets, flows) in zip(args.captures, results):
+        print(f"{path}: {packets} packets, {flows} flows")
+    packets = sum(packets for packets, _ in results)
+    flows = sum(flows for _, flows in results)
+    print(f"{flows} flows written to {args.output} in {elapsed:.1f}s"
+          f" ({packets / elapsed if elapsed else 0:.0f} packets/s)")
+
+
+if __name__ == '__main__':
+    main()
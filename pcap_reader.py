@@ -0,0 +1,138 @@
+import mmap
+import os
+import struct
+
+# PCAP / PCAPNG READER
+# Streams the Ethernet frames of a capture file without loading it: the file is mmap'd
+# (read sequentially, the kernel pages it in and out as needed) and records are decoded
+# in place with precompiled struct formats, one frame copied out at a time.
+#   pcap     both byte orders, microsecond and nanosecond timestamps
+#   pcapng   Enhanced, Simple and (obsolete) Packet blocks, several sections and
+#            interfaces, if_tsresol; frames of non-Ethernet interfaces are skipped
+# read_packets(path) yields (timestamp in seconds, original length, frame bytes);
+# the original length is what the switch would report as total_len.
+
+LINKTYPE_ETHERNET = 1
+
+_PCAP_MAGIC_US = 0xA1B2C3D4
+_PCAP_MAGIC_NS = 0xA1B23C4D
+_PCAP_HEADER_LEN = 24
+
+_SHB = 0x0A0D0D0A           # section header (same in both byte orders)
+_IDB = 0x00000001           # interface description
+_PB = 0x00000002            # packet (obsolete)
+_SPB = 0x00000003           # simple packet
+_EPB = 0x00000006           # enhanced packet
+_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_OPT_IF_TSRESOL = 9
+
+_STRUCTS = {}
+
+
+def _struct(order, fmt):
+    s = _STRUCTS.get((order, fmt))
+    if s is None:
+        s = _STRUCTS[(order, fmt)] = struct.Struct(order + fmt)
+    return s
+
+
+def read_packets(path):
+    """(timestamp, orig_len, frame) for every Ethernet frame of a pcap/pcapng file."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 4:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if _struct('<', 'I').unpack_from(mm, 0)[0] == _SHB:
+                yield from _read_pcapng(mm, path)
+            else:
+                yield from _read_pcap(mm, path)
+
+
+def _read_pcap(mm, path):
+    for order in '<>':
+        magic = _struct(order, 'I').unpack_from(mm, 0)[0]
+        if magic in (_PCAP_MAGIC_US, _PCAP_MAGIC_NS):
+            break
+    else:
+        raise ValueError(f"{path}: not a pcap or pcapng file")
+    if len(mm) < _PCAP_HEADER_LEN:
+        return
+    scale = 1e-6 if magic == _PCAP_MAGIC_US else 1e-9
+    linktype = _struct(order, 'I').unpack_from(mm, 20)[0] & 0xFFFF     # upper bits: FCS info
+    if linktype != LINKTYPE_ETHERNET:
+        raise ValueError(f"{path}: link type {linktype}, only Ethernet is supported")
+
+    record = _struct(order, 'IIII')         # ts_sec, ts_frac, caplen, orig_len
+    offset = _PCAP_HEADER_LEN
+    end = len(mm)
+    while offset + record.size <= end:
+        sec, frac, caplen, orig_len = record.unpack_from(mm, offset)
+        offset += record.size
+        if offset + caplen > end:
+            return                          # truncated last record
+        yield sec + frac * scale, orig_len, mm[offset:offset + caplen]
+        offset += caplen
+
+
+def _tsresol(mm, offset, end, order):
+    """Seconds per timestamp unit from the options of an interface description block."""
+    option = _struct(order, 'HH')
+    while offset + option.size <= end:
+        code, length = option.unpack_from(mm, offset)
+        if code == 0:
+            break
+        if code == _OPT_IF_TSRESOL and length >= 1:
+            value = mm[offset + option.size]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += option.size + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def _read_pcapng(mm, path):
+    end = len(mm)
+    offset = 0
+    order = '<'
+    interfaces = []                         # per section: (linktype, snaplen, resolution)
+    last_ts = 0.0
+    while offset + 12 <= end:
+        if _struct('<', 'I').unpack_from(mm, offset)[0] == _SHB:
+            magic = _struct('<', 'I').unpack_from(mm, offset + 8)[0]
+            order = '<' if magic == _BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+        block_type, length = _struct(order, 'II').unpack_from(mm, offset)
+        if length < 12 or offset + length > end:
+            return                          # truncated or corrupt: stop at the last good block
+        body = offset + 8
+
+        frame = None
+        if block_type == _IDB:
+            linktype, _, snaplen = _struct(order, 'HHI').unpack_from(mm, body)
+            interfaces.append((linktype, snaplen, _tsresol(mm, body + 8, offset + length - 4, order)))
+        elif block_type == _EPB:
+            iface, ts_high, ts_low, caplen, orig_len = _struct(order, 'IIIII').unpack_from(mm, body)
+            frame = body + 20
+        elif block_type == _PB:
+            iface, _, ts_high, ts_low, caplen, orig_len = _struct(order, 'HHIIII').unpack_from(mm, body)
+            frame = body + 20
+        elif block_type == _SPB:
+            # No timestamp: the previous packet's is reused
+            orig_len = _struct(order, 'I').unpack_from(mm, body)[0]
+            iface = 0
+            snaplen = interfaces[0][1] if interfaces else 0
+            caplen = min(orig_len, snaplen) if snaplen else orig_len
+            caplen = min(caplen, offset + length - 4 - (body + 4))
+            frame = body + 4
+        offset += length
+
+        if frame is None:
+            continue
+        if iface >= len(interfaces):
+            raise ValueError(f"{path}: packet of undeclared interface {iface}")
+        linktype, _, resolution = interfaces[iface]
+        if linktype != LINKTYPE_ETHERNET:
+            continue
+        if block_type != _SPB:
+            last_ts = ((ts_high << 32) | ts_low) * resolution
+        yield last_ts, orig_len, mm[frame:frame + caplen]
@@ -0,0 +1,71 @@
+from ryu import cfg
+
+# FLOW TABLE PIPELINE
+# Instead of every rule of every app competing by priority in table 0, each kind of
+# rule has its own table and a packet walks through them in order:
+#   table 0  ACL        drop rules (block_manager, blocklist), metered rules (meter_manager);
+#                       miss -> goto table 1
+#   table 1  MONITOR    per-flow entries whose counters the collectors read back
+#                       (13/14); they forward the packet themselves; miss -> goto table 2
+#   table 2  FORWARD    learned L2 / path entries (6, 15); miss -> controller (the
+#                       packet-in guard's table-miss entry)
+# A block update only ever touches table 0, flow-stats requests of the collectors ask
+# for table 1 alone, and a lookup only compares priorities within one table.
+# With multi_table = false every stage is table 0 (one table, priorities as before),
+# for switches without a multi-table pipeline.
+#
+#   [pipeline]
+#   multi_table = true
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.BoolOpt('multi_table', default=True,
+                help='ACL, monitoring and forwarding rules in tables 0, 1 and 2 '
+                     '(false = all in table 0)'),
+], group='pipeline')
+
+ACL = 'acl'
+MONITOR = 'monitor'
+FORWARD = 'forward'
+STAGES = (ACL, MONITOR, FORWARD)
+
+_tables = None
+
+
+def table(stage):
+    """Table id of `stage` (ACL, MONITOR or FORWARD)."""
+    global _tables
+    if _tables is None:
+        if CONF.pipeline.multi_table:
+            _tables = {name: table_id for table_id, name in enumerate(STAGES)}
+        else:
+            _tables = dict.fromkeys(STAGES, 0)
+    return _tables[stage]
+
+
+def goto_instructions(datapath, stage):
+    """[OFPInstructionGotoTable] to the table after `stage`; [] if there is none
+    (the last stage, or a single table)."""
+    next_stage = STAGES.index(stage) + 1
+    if next_stage == len(STAGES) or table(STAGES[next_stage]) == table(stage):
+        return []
+    return [datapath.ofproto_parser.OFPInstructionGotoTable(table(STAGES[next_stage]))]
+
+
+def miss_mods(features, logger):
+    """Goto-next-table miss entries of every table but the last one, from an
+    EventOFPSwitchFeatures message. The last table's miss entry is the packet-in
+    guard's."""
+    datapath = features.datapath
+    parser = datapath.ofproto_parser
+    mods = []
+    for stage in STAGES[:-1]:
+        inst = goto_instructions(datapath, stage)
+        if inst:
+            mods.append(parser.OFPFlowMod(datapath=datapath, table_id=table(stage),
+                                          priority=0, match=parser.OFPMatch(),
+                                          instructions=inst))
+    if mods and features.n_tables < len(STAGES):
+        logger.warning(f"[PIPELINE] switch {datapath.id} has {features.n_tables} flow tables,"
+                       f" {len(STAGES)} needed: set [pipeline] multi_table = false")
+    return mods
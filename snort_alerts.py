@@ -0,0 +1,243 @@
+from collections import deque, namedtuple
+import errno
+import os
+import struct
+import time
+
+from eventlet import patcher
+from eventlet.hubs import trampoline
+
+from ryu import cfg
+from ryu.lib import hub
+
+import fast_parser
+import metrics
+
+# SNORT ALERT INGESTION
+# Receives the Alertpkt datagrams Snort writes to a unix socket (snort -A unsock).
+#   receiver thread   waits until the socket is readable, then drains it with
+#                     recv_into() into one preallocated buffer until it would block
+#                     (or drain_batch alerts were read), so a burst costs one wakeup
+#   decoder           one precompiled struct for the fixed Alertpkt header, the
+#                     packet inside goes through fast_parser
+#   bounded queue     decoded alerts wait here for the handler thread; when it is
+#                     full new alerts are dropped and counted (Snort keeps writing)
+#   handler thread    calls handler(alert) for every queued alert
+#   one receiver      a socket another controller instance is still receiving on is
+#                     never taken over: each instance needs its own socket_path
+#   logging           LogLimiter keeps per-alert logging to log_rate lines/s, the
+#                     counters are reported every stats_interval seconds
+#
+# Alertpkt offsets (as observed with this Snort build):
+#   0    alertmsg[256]    NUL padded rule message
+#   256  event id         ("val")
+#   264  priority
+#   284  the packet that raised the alert, starting at the Ethernet header
+#
+#   [snort]
+#   socket_path = /tmp/snort_alert
+#   queue_size = 10000
+#   drain_batch = 256
+#   rcvbuf = 4194304
+#   log_rate = 10
+#   stats_interval = 10
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt('socket_path', default='/tmp/snort_alert',
+               help='Unix datagram socket Snort writes its alerts to'),
+    cfg.IntOpt('queue_size', default=10000,
+               help='Decoded alerts waiting for the handler; more are dropped'),
+    cfg.IntOpt('drain_batch', default=256,
+               help='Most datagrams read per wakeup before yielding'),
+    cfg.IntOpt('rcvbuf', default=4194304,
+               help='Socket receive buffer (bytes), absorbs bursts'),
+    cfg.IntOpt('log_rate', default=10,
+               help='Most per-alert log lines per second'),
+    cfg.FloatOpt('stats_interval', default=10.0,
+                 help='Seconds between two counter reports (0 = never)'),
+], group='snort')
+
+# Real (non-green) socket module: the receiver polls with its own non-blocking loop
+_socket = patcher.original('socket')
+
+ALERT_HEADER = struct.Struct('=256sI4xI16x')   # alertmsg, event id, priority
+ALERT_HEADER_LEN = ALERT_HEADER.size             # 284, the packet starts here
+MAX_DATAGRAM = 65536 + ALERT_HEADER_LEN
+
+Alert = namedtuple('Alert', [
+    'msg',          # rule message, e.g. "ICMP flood"
+    'event_id',
+    'priority',
+    'pkt',          # raw packet bytes
+    'hdr',          # fast_parser.Headers of pkt, None if not Ethernet
+])
+
+
+def decode(data, length=None):
+    """Alertpkt bytes (or a buffer + datagram length) -> Alert, None if too short."""
+    if length is None:
+        length = len(data)
+    if length < ALERT_HEADER_LEN:
+        return None
+    msg, event_id, priority = ALERT_HEADER.unpack_from(data)
+    msg = msg.split(b'\x00', 1)[0].decode(errors='ignore')
+    pkt = bytes(data[ALERT_HEADER_LEN:length])
+    return Alert(msg, event_id, priority, pkt, fast_parser.parse(pkt))
+
+
+class LogLimiter(object):
+    """At most `rate` lines per second; the rest are counted and reported once."""
+
+    def __init__(self, logger, rate):
+        self.logger = logger
+        self.rate = rate
+        self.second = 0
+        self.lines = 0
+        self.suppressed = 0
+
+    def info(self, msg, *args):
+        now = int(time.time())
+        if now != self.second:
+            if self.suppressed:
+                self.logger.info(f"... {self.suppressed} similar lines suppressed")
+            self.second = now
+            self.lines = 0
+            self.suppressed = 0
+        if self.lines < self.rate:
+            self.lines += 1
+            self.logger.info(msg, *args)
+        else:
+            self.suppressed += 1
+
+
+def _in_use(path):
+    """True if some process is bound to the unix datagram socket at `path`."""
+    probe = _socket.socket(_socket.AF_UNIX, _socket.SOCK_DGRAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False                                    # ECONNREFUSED: nobody reads it
+    finally:
+        probe.close()
+
+
+class AlertReceiver(object):
+    def __init__(self, logger, handler, socket_path=None, queue_size=None,
+                 drain_batch=None, rcvbuf=None, stats_interval=None):
+        conf = CONF.snort
+        self.logger = logger
+        self.handler = handler
+        self.socket_path = socket_path or conf.socket_path
+        self.drain_batch = drain_batch or conf.drain_batch
+        self.rcvbuf = rcvbuf or conf.rcvbuf
+        self.stats_interval = conf.stats_interval if stats_interval is None else stats_interval
+
+        self.queue = deque()
+        self.queue_size = queue_size or conf.queue_size
+        self.wakeup = hub.Event()
+
+        self.received = 0
+        self.malformed = 0
+        self.dropped = 0            # queue full
+        self.handled = 0
+        self.max_queued = 0
+
+        metrics.Counter('snort_alerts_received_total', 'Alert datagrams read from the socket',
+                        fn=lambda: self.received)
+        metrics.Counter('snort_alerts_dropped_total', 'Alerts dropped because the queue was full',
+                        fn=lambda: self.dropped)
+        metrics.Counter('snort_alerts_malformed_total', 'Datagrams that were not a Snort alert',
+                        fn=lambda: self.malformed)
+        metrics.Counter('snort_alerts_handled_total', 'Alerts handed to the app',
+                        fn=lambda: self.handled)
+        metrics.Gauge('snort_alerts_backlog', 'Alerts waiting in the queue',
+                      fn=lambda: len(self.queue))
+        metrics.Gauge('snort_alerts_backlog_max', 'Largest backlog seen',
+                      fn=lambda: self.max_queued)
+
+        self.sock = self._bind()
+        self.threads = [hub.spawn(self._receive_loop), hub.spawn(self._handle_loop)]
+        if self.stats_interval:
+            self.threads.append(hub.spawn(self._stats_loop))
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if _in_use(self.socket_path):
+                raise OSError(errno.EADDRINUSE, f"{self.socket_path} is in use by another"
+                              f" controller instance, set its own [snort] socket_path")
+            os.unlink(self.socket_path)                 # Stale socket of a previous run
+        sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_RCVBUF, self.rcvbuf)
+        except OSError:
+            pass                                        # Keep the system default
+        sock.bind(self.socket_path)
+        sock.setblocking(False)
+        os.chmod(self.socket_path, 0o777)               # Snort (running as root) must be able to write
+        self.logger.info(f"Waiting for Snort alerts on {self.socket_path}")
+        return sock
+
+    def close(self):
+        for thread in self.threads:
+            hub.kill(thread)
+        self.sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    # --- RECEIVER: drain the socket, decode, queue ---
+
+    def _receive_loop(self):
+        buf = bytearray(MAX_DATAGRAM)
+        recv_into = self.sock.recv_into
+        queue = self.queue
+        while True:
+            trampoline(self.sock, read=True)            # Green wait until readable
+            for _ in range(self.drain_batch):
+                try:
+                    length = recv_into(buf)
+                except (BlockingIOError, InterruptedError):
+                    break
+                self.received += 1
+                if len(queue) >= self.queue_size:
+                    self.dropped += 1
+                    continue
+                alert = decode(buf, length)
+                if alert is None:
+                    self.malformed += 1
+                    continue
+                queue.append(alert)
+            if len(queue) > self.max_queued:
+                self.max_queued = len(queue)
+            self.wakeup.set()
+            hub.sleep(0)                                # Let the handler and packet-ins run
+
+    # --- HANDLER: one alert at a time, outside the receive loop ---
+
+    def _handle_loop(self):
+        queue = self.queue
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while queue:
+                for _ in range(min(self.drain_batch, len(queue))):
+                    alert = queue.popleft()
+                    try:
+                        self.handler(alert)
+                    except Exception:
+                        self.logger.exception("Snort alert handler failed")
+                    self.handled += 1
+                hub.sleep(0)
+
+    def _stats_loop(self):
+        last = 0
+        while True:
+            hub.sleep(self.stats_interval)
+            if self.received == last:
+                continue
+            rate = (self.received - last) / self.stats_interval
+            last = self.received
+            self.logger.info(f"[SNORT] {self.received} alerts received ({rate:.0f}/s),"
+                             f" {self.handled} handled, {self.dropped} dropped (queue full),"
+                             f" {self.malformed} malformed, peak queue {self.max_queued}")
@@ -0,0 +1,79 @@
+import argparse
+import socket
+import time
+
+from ryu.lib.packet import packet, ethernet, ipv4, tcp
+from ryu.lib.packet import ether_types
+
+import snort_alerts
+
+# STAND-IN SNORT: sends Alertpkt datagrams to the controller's alert socket
+# Usage:
+#   python snort_sender.py                      # 100000 alerts as fast as possible
+#   python snort_sender.py -n 50000 --rate 5000 # paced
+#   python snort_sender.py --nonblocking        # like Snort: drop when the socket is full
+#   python snort_sender.py --decode             # decode-only benchmark, no socket
+# Start 11_snort.py or 12_snort_sdn.py first; their "[SNORT] ... received" lines
+# show how many alerts the controller took in.
+
+
+def build_alert(msg="TCP SYN flood", event_id=1, priority=2):
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(dst='00:00:00:00:00:01', src='00:00:00:00:00:03',
+                                       ethertype=ether_types.ETH_TYPE_IP))
+    pkt.add_protocol(ipv4.ipv4(src='10.0.0.3', dst='10.0.0.1', proto=6))
+    pkt.add_protocol(tcp.tcp(src_port=40000, dst_port=80, bits=tcp.TCP_SYN))
+    pkt.serialize()
+    return snort_alerts.ALERT_HEADER.pack(msg.encode(), event_id, priority) + bytes(pkt.data)
+
+
+def send(path, count, rate, nonblocking):
+    alert = build_alert()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.connect(path)
+    sock.setblocking(not nonblocking)
+    interval = 1.0 / rate if rate else 0
+    sent = refused = 0
+    start = time.perf_counter()
+    for i in range(count):
+        if interval:
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            sock.send(alert)
+            sent += 1
+        except (BlockingIOError, OSError):
+            refused += 1                # socket buffer full, Snort would lose this one
+    elapsed = time.perf_counter() - start
+    print(f"Sent {sent} alerts in {elapsed:.2f}s ({sent / elapsed:,.0f}/s),"
+          f" {refused} refused (socket full)")
+
+
+def bench_decode(count):
+    alert = build_alert()
+    start = time.perf_counter()
+    for _ in range(count):
+        snort_alerts.decode(alert)
+    elapsed = time.perf_counter() - start
+    print(f"Decoded {count} alerts in {elapsed:.2f}s ({count / elapsed:,.0f}/s,"
+          f" {elapsed / count * 1e6:.2f} us/alert)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send fake Snort alerts")
+    parser.add_argument('--socket', default='/tmp/snort_alert')
+    parser.add_argument('-n', '--count', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=0, help="alerts/s (0 = unpaced)")
+    parser.add_argument('--nonblocking', action='store_true')
+    parser.add_argument('--decode', action='store_true')
+    args = parser.parse_args()
+
+    if args.decode:
+        bench_decode(args.count)
+    else:
+        send(args.socket, args.count, args.rate, args.nonblocking)
+
+
+if __name__ == '__main__':
+    main()
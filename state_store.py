@@ -0,0 +1,211 @@
+import functools
+import sqlite3
+import threading
+import time
+
+try:
+    from eventlet import patcher, tpool     # real OS threads for blocking SQLite calls
+    _threading = patcher.original('threading')
+except ImportError:
+    tpool = None
+    _threading = threading
+
+# SHARED STATE STORE
+# What the controller instances of a cluster (cluster.py) share. Two kinds of data:
+#   keyed values   set(table, key, value, expiry) / items(table); every write gets a
+#                  new version number, so changes(table, since) returns just what was
+#                  written after the caller's last look (value None = deleted). Rows
+#                  past their expiry time are left out. incr() is an atomic counter
+#                  (role generation ids)
+#   window counts  add_counts(table, window, instance, {key: n}) adds to per-instance
+#                  event counts of one time window; window_counts() sums them over the
+#                  other instances (shared detector counts, detectors.SharedDetector);
+#                  drop_counts() forgets old windows
+# purge() drops the rows past their expiry time.
+# Backends, chosen by URL ([cluster] store):
+#   memory[:name]  in this process only: every store opened with the same name is the
+#                  same object (several instances in one process, tests)
+#   sqlite:<path>  an SQLite file (WAL mode) every instance on the host opens. Calls
+#                  run one at a time in a real OS thread (eventlet tpool): a write
+#                  waiting up to BUSY_TIMEOUT for another instance's lock only holds up
+#                  the green thread that made it, never the hub loop
+# Both are a stand-in for a networked store (etcd, Redis, ...), which would implement
+# the same methods.
+
+BUSY_TIMEOUT = 1.0          # seconds an SQLite write waits for another instance's lock
+
+_memory_stores = {}
+
+
+def open_store(url):
+    """StateStore for `url`: 'memory', 'memory:<name>' or 'sqlite:<path>'."""
+    kind, _, where = url.partition(':')
+    if kind == 'memory':
+        store = _memory_stores.get(where)
+        if store is None:
+            store = _memory_stores[where] = MemoryStore()
+        return store
+    if kind == 'sqlite' and where:
+        return SqliteStore(where)
+    raise ValueError(f"Unknown state store: {url}")
+
+
+def _live(expiry, now):
+    return not expiry or expiry > now
+
+
+class MemoryStore(object):
+    def __init__(self):
+        self.lock = threading.Lock()        # worker threads of one process share it too
+        self.version = 0
+        self.tables = {}            # table -> {key: (value, expiry, version)}
+        self.counts = {}            # (table, window) -> {(key, instance): n}
+
+    def set(self, table, key, value, expiry=0):
+        with self.lock:
+            self.version += 1
+            self.tables.setdefault(table, {})[key] = (value, expiry, self.version)
+
+    def get(self, table, key, default=None):
+        value, expiry, _ = self.tables.get(table, {}).get(key, (None, 0, 0))
+        return value if value is not None and _live(expiry, time.time()) else default
+
+    def items(self, table):
+        now = time.time()
+        return {key: value for key, (value, expiry, _) in list(self.tables.get(table, {}).items())
+                if value is not None and _live(expiry, now)}
+
+    def changes(self, table, since):
+        now = time.time()
+        with self.lock:
+            rows = self.tables.get(table, {})
+            return self.version, [(key, value) for key, (value, expiry, version) in rows.items()
+                                  if version > since and _live(expiry, now)]
+
+    def incr(self, table, key, amount=1):
+        with self.lock:
+            value = self.tables.get(table, {}).get(key, (0,))[0] + amount
+            self.version += 1
+            self.tables.setdefault(table, {})[key] = (value, 0, self.version)
+            return value
+
+    def add_counts(self, table, window, instance, counts):
+        with self.lock:
+            cell = self.counts.setdefault((table, window), {})
+            for key, n in counts.items():
+                cell[(key, instance)] = cell.get((key, instance), 0) + n
+
+    def window_counts(self, table, window, exclude=None):
+        totals = {}
+        for (key, instance), n in list(self.counts.get((table, window), {}).items()):
+            if instance != exclude:
+                totals[key] = totals.get(key, 0) + n
+        return totals
+
+    def drop_counts(self, table, before_window):
+        """Forget the counts of `table` for windows before `before_window`."""
+        with self.lock:
+            for cell in [cell for cell in self.counts if cell[0] == table and cell[1] < before_window]:
+                del self.counts[cell]
+
+    def purge(self):
+        """Drop the rows past their expiry time."""
+        now = time.time()
+        with self.lock:
+            for rows in self.tables.values():
+                for key in [key for key, (_, expiry, _) in rows.items() if not _live(expiry, now)]:
+                    del rows[key]
+
+
+def _in_thread(method):
+    """SqliteStore method run under the store's lock in a tpool thread."""
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        def locked():
+            with self.lock:
+                return method(self, *args, **kwargs)
+        return locked() if tpool is None else tpool.execute(locked)
+    return call
+
+
+class SqliteStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = _threading.Lock()       # one connection: one call at a time
+        # Autocommit: each write below opens its own transaction
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS kv (tbl TEXT, key TEXT, value, expiry REAL,'
+                        ' version INTEGER, PRIMARY KEY (tbl, key))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS kv_version ON kv (tbl, version)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS counts (tbl TEXT, win INTEGER, key TEXT,'
+                        ' instance TEXT, n INTEGER, PRIMARY KEY (tbl, win, key, instance))')
+        # Last version handed out (purged rows never give theirs back)
+        self.db.execute('CREATE TABLE IF NOT EXISTS seq (version INTEGER)')
+        self.db.execute('INSERT INTO seq SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM seq)')
+
+    def _next_version(self):
+        self.db.execute('UPDATE seq SET version = version + 1')
+        return self.db.execute('SELECT version FROM seq').fetchone()[0]
+
+    @_in_thread
+    def set(self, table, key, value, expiry=0):
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?, ?)',
+                            (table, key, value, expiry, self._next_version()))
+
+    @_in_thread
+    def get(self, table, key, default=None):
+        row = self.db.execute('SELECT value FROM kv WHERE tbl = ? AND key = ? AND value IS NOT NULL'
+                              ' AND (expiry = 0 OR expiry > ?)',
+                              (table, key, time.time())).fetchone()
+        return default if row is None else row[0]
+
+    @_in_thread
+    def items(self, table):
+        return dict(self.db.execute('SELECT key, value FROM kv WHERE tbl = ? AND value IS NOT NULL'
+                                    ' AND (expiry = 0 OR expiry > ?)', (table, time.time())))
+
+    @_in_thread
+    def changes(self, table, since):
+        rows = self.db.execute('SELECT key, value, version FROM kv WHERE tbl = ? AND version > ?'
+                               ' AND (expiry = 0 OR expiry > ?)',
+                               (table, since, time.time())).fetchall()
+        return max((row[2] for row in rows), default=since), [row[:2] for row in rows]
+
+    @_in_thread
+    def incr(self, table, key, amount=1):
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            row = self.db.execute('SELECT value FROM kv WHERE tbl = ? AND key = ?',
+                                  (table, key)).fetchone()
+            value = (row[0] if row else 0) + amount
+            self.db.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?, 0, ?)',
+                            (table, key, value, self._next_version()))
+            return value
+
+    @_in_thread
+    def add_counts(self, table, window, instance, counts):
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany('INSERT INTO counts VALUES (?, ?, ?, ?, ?)'
+                                ' ON CONFLICT (tbl, win, key, instance) DO UPDATE'
+                                ' SET n = n + excluded.n',
+                                [(table, window, key, instance, n) for key, n in counts.items()])
+
+    @_in_thread
+    def window_counts(self, table, window, exclude=None):
+        return dict(self.db.execute('SELECT key, SUM(n) FROM counts WHERE tbl = ? AND win = ?'
+                                    ' AND instance IS NOT ? GROUP BY key',
+                                    (table, window, exclude)))
+
+    @_in_thread
+    def drop_counts(self, table, before_window):
+        self.db.execute('DELETE FROM counts WHERE tbl = ? AND win < ?', (table, before_window))
+
+    @_in_thread
+    def purge(self):
+        self.db.execute('DELETE FROM kv WHERE expiry != 0 AND expiry <= ?', (time.time(),))
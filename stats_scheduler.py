@@ -0,0 +1,193 @@
+import random
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import metrics
+
+# FLOW STATS SCHEDULER
+# Polls flow statistics per switch instead of dumping every switch at the same time:
+#   - each switch has its own due time, started at a random phase of the interval, so
+#     requests are spread out rather than synchronized
+#   - a switch's interval adapts to its flow churn (entries added/removed since the last
+#     poll relative to its table size): busy switches are polled more often, quiet ones
+#     back off, always within [min_interval, max_interval]
+#   - requests only ask for what the app needs: a cookie/cookie_mask and table filter, or
+#     just the totals with OFPAggregateStatsRequest
+#   - one outstanding request per switch; multipart replies (OFPMPF_REPLY_MORE) are
+#     collected until the last part; a request without a complete reply after
+#     request_timeout is given up and the switch backs off
+#   - at most max_outstanding requests are in flight over all switches
+# The app forwards EventOFPFlowStatsReply / EventOFPAggregateStatsReply to reply();
+# on_stats(datapath, entries) gets the complete list of OFPFlowStats (or a one-element
+# list with the OFPAggregateStats).
+#
+#   [stats]
+#   interval = 10
+#   min_interval = 2
+#   max_interval = 60
+#   request_timeout = 5
+#   max_outstanding = 32
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.FloatOpt('interval', default=10.0,
+                 help='Initial seconds between two stats requests to a switch'),
+    cfg.FloatOpt('min_interval', default=2.0,
+                 help='Shortest polling interval of a busy switch'),
+    cfg.FloatOpt('max_interval', default=60.0,
+                 help='Longest polling interval of a quiet switch'),
+    cfg.FloatOpt('request_timeout', default=5.0,
+                 help='Seconds to wait for a complete reply'),
+    cfg.IntOpt('max_outstanding', default=32,
+               help='Most stats requests in flight over all switches'),
+], group='stats')
+
+TICK = 0.2                  # scheduler resolution (seconds)
+CHURN_HIGH = 0.2            # more than 20% of the entries changed: poll twice as often
+CHURN_LOW = 0.05            # less than 5% changed: poll 1.5x less often
+
+
+class _SwitchState(object):
+    def __init__(self, datapath, interval, due):
+        self.datapath = datapath
+        self.interval = interval
+        self.due = due
+        self.xid = None             # xid of the outstanding request
+        self.sent_at = 0
+        self.parts = []             # bodies received so far for the outstanding request
+        self.last_count = None      # table size at the previous poll
+        self.polled_at = 0          # time of the previous complete reply
+
+
+class StatsScheduler(object):
+    def __init__(self, logger, on_stats, cookie=0, cookie_mask=0, table_id=None,
+                 aggregate=False):
+        conf = CONF.stats
+        self.logger = logger
+        self.on_stats = on_stats
+        self.cookie = cookie
+        self.cookie_mask = cookie_mask
+        self.table_id = table_id        # None = all tables
+        self.aggregate = aggregate
+        self.interval = conf.interval
+        self.min_interval = conf.min_interval
+        self.max_interval = conf.max_interval
+        self.request_timeout = conf.request_timeout
+        self.max_outstanding = conf.max_outstanding
+
+        self.switches = {}              # dpid -> _SwitchState
+        self.outstanding = 0
+        self.requests = 0
+        self.replies = 0
+        self.timeouts = 0
+
+        metrics.Counter('ryu_stats_requests_total', 'Flow stats requests sent',
+                        fn=lambda: self.requests)
+        metrics.Counter('ryu_stats_replies_total', 'Complete flow stats replies',
+                        fn=lambda: self.replies)
+        metrics.Counter('ryu_stats_timeouts_total', 'Flow stats requests given up',
+                        fn=lambda: self.timeouts)
+
+        self.thread = hub.spawn(self._loop)
+
+    # --- SWITCH TRACKING ---
+
+    def add_datapath(self, datapath):
+        # Random phase: switches connecting together are still polled apart
+        due = time.time() + random.random() * self.interval
+        self.switches[datapath.id] = _SwitchState(datapath, self.interval, due)
+
+    def remove_datapath(self, datapath):
+        state = self.switches.pop(datapath.id, None)
+        if state is not None and state.xid is not None:
+            self.outstanding -= 1
+
+    # --- REQUESTS ---
+
+    def _loop(self):
+        while True:
+            hub.sleep(TICK)
+            now = time.time()
+            for state in list(self.switches.values()):
+                if state.xid is not None:
+                    if now - state.sent_at > self.request_timeout:
+                        self._give_up(state, now)
+                    continue
+                if state.due <= now and self.outstanding < self.max_outstanding:
+                    self._send(state, now)
+
+    def _send(self, state, now):
+        datapath = state.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id = ofproto.OFPTT_ALL if self.table_id is None else self.table_id
+        request_cls = parser.OFPAggregateStatsRequest if self.aggregate else parser.OFPFlowStatsRequest
+        req = request_cls(datapath, 0, table_id, ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                          self.cookie, self.cookie_mask, parser.OFPMatch())
+        if not datapath.send_msg(req):          # Sets req.xid
+            state.due = now + state.interval
+            return
+        state.xid = req.xid
+        state.sent_at = now
+        state.parts = []
+        self.outstanding += 1
+        self.requests += 1
+
+    def _give_up(self, state, now):
+        self.logger.warning(f"[STATS] switch {state.datapath.id}: no complete reply after"
+                            f" {self.request_timeout}s, backing off")
+        self.timeouts += 1
+        self.outstanding -= 1
+        state.xid = None
+        state.parts = []
+        state.interval = min(self.max_interval, state.interval * 2)
+        state.due = now + state.interval
+
+    # --- REPLIES ---
+
+    def reply(self, msg):
+        state = self.switches.get(msg.datapath.id)
+        if state is None or msg.xid != state.xid:
+            return                      # stale reply to a request that timed out
+        if self.aggregate:
+            state.parts.append(msg.body)
+        else:
+            state.parts.extend(msg.body)
+        if msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            return
+
+        now = time.time()
+        entries = state.parts
+        state.xid = None
+        state.parts = []
+        self.outstanding -= 1
+        self.replies += 1
+        self._adapt(state, entries, now)
+        state.due = now + state.interval
+        self.on_stats(state.datapath, entries)
+
+    def _adapt(self, state, entries, now):
+        if self.aggregate:
+            count = entries[0].flow_count if entries else 0
+        else:
+            count = len(entries)
+        last_count, state.last_count = state.last_count, count
+        since, state.polled_at = now - state.polled_at, now
+        if last_count is None:
+            return
+
+        if self.aggregate:
+            changed = abs(count - last_count)
+        else:
+            # Entries younger than the last poll were added since, and whatever the
+            # table lost on top of that was removed
+            added = sum(1 for stat in entries if stat.duration_sec < since)
+            changed = added + max(0, last_count + added - count)
+
+        churn = changed / max(count, 1)
+        if churn > CHURN_HIGH:
+            state.interval = max(self.min_interval, state.interval / 2)
+        elif churn < CHURN_LOW:
+            state.interval = min(self.max_interval, state.interval * 1.5)
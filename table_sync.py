@@ -0,0 +1,65 @@
+import time
+
+from ryu.lib import hub
+
+# TABLE SYNC
+# Reads back what a switch already has when it (re)connects, so the entries an app
+# owns are reconciled instead of wiped and re-sent (the switch keeps its flow table
+# across a controller restart; a restarted controller warm-starts from checkpoint.py):
+#   - add_datapath() sends one OFPFlowStatsRequest filtered on the app's cookie and table
+#   - multipart parts (OFPMPF_REPLY_MORE) are collected; on_entries(datapath, stats) gets
+#     the complete list of OFPFlowStats
+#   - no complete reply after SYNC_TIMEOUT: on_entries(datapath, None), the caller then
+#     treats the switch as empty
+# The app forwards EventOFPFlowStatsReply to reply(), which says whether it was ours.
+
+SYNC_TIMEOUT = 10.0
+
+
+class TableSync(object):
+    def __init__(self, logger, on_entries, cookie, cookie_mask, table_id=None):
+        self.logger = logger
+        self.on_entries = on_entries
+        self.cookie = cookie
+        self.cookie_mask = cookie_mask
+        self.table_id = table_id        # None = all tables
+
+        self.pending = {}               # dpid -> [datapath, xid, parts, sent at]
+        self.timeout_thread = hub.spawn(self._timeout_loop)
+
+    def add_datapath(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id = ofproto.OFPTT_ALL if self.table_id is None else self.table_id
+        req = parser.OFPFlowStatsRequest(datapath, 0, table_id, ofproto.OFPP_ANY,
+                                         ofproto.OFPG_ANY, self.cookie, self.cookie_mask,
+                                         parser.OFPMatch())
+        if not datapath.send_msg(req):          # Sets req.xid
+            self.pending.pop(datapath.id, None)
+            self.on_entries(datapath, None)
+            return
+        self.pending[datapath.id] = [datapath, req.xid, [], time.time()]
+
+    def remove_datapath(self, datapath):
+        self.pending.pop(datapath.id, None)
+
+    def reply(self, msg):
+        state = self.pending.get(msg.datapath.id)
+        if state is None or msg.xid != state[1]:
+            return False
+        state[2].extend(msg.body)
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            del self.pending[msg.datapath.id]
+            self.on_entries(state[0], state[2])
+        return True
+
+    def _timeout_loop(self):
+        while True:
+            hub.sleep(1)
+            now = time.time()
+            for dpid, state in list(self.pending.items()):
+                if now - state[3] > SYNC_TIMEOUT:
+                    del self.pending[dpid]
+                    self.logger.warning(f"[SYNC] switch {dpid}: no flow stats after"
+                                        f" {SYNC_TIMEOUT}s")
+                    self.on_entries(state[0], None)
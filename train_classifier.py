@@ -0,0 +1,94 @@
+import argparse
+import csv
+
+import numpy as np
+
+try:
+    from sklearn.linear_model import LogisticRegression
+except ImportError:
+    LogisticRegression = None
+
+from flow_classifier import FlowClassifier
+
+# OFFLINE TRAINING for the collector's online classifier
+# Reads one or more datasets written by 14_collector_twelve_features.py (label column
+# last; e.g. one capture with label = 0 and one with label = 1) and fits a logistic
+# regression on the feature columns. The model is saved as a small .npz file that
+# flow_classifier.FlowClassifier loads at controller start.
+#
+# Usage:
+#   python train_classifier.py normal.csv attack.csv -o flow_model.npz
+#   python train_classifier.py 14_dataset.csv --sklearn        # fit with scikit-learn
+
+
+def load_datasets(paths):
+    names = None
+    rows = []
+    for path in paths:
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            if names is None:
+                names = header
+            elif header != names:
+                raise ValueError(f"{path}: columns differ from {paths[0]}")
+            rows.extend(row for row in reader if row)
+    data = np.asarray(rows, dtype=np.float64)
+    return names[:-1], data[:, :-1], data[:, -1]
+
+
+def fit_numpy(X, y, epochs=500, lr=0.1, l2=1e-4):
+    # Plain batch gradient descent on the log loss; X is already standardized
+    w = np.zeros(X.shape[1])
+    b = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-np.clip(X @ w + b, -50, 50)))
+        err = p - y
+        w -= lr * (X.T @ err / len(y) + l2 * w)
+        b -= lr * err.mean()
+    return w, b
+
+
+def fit_sklearn(X, y):
+    model = LogisticRegression(max_iter=1000).fit(X, y)
+    return model.coef_[0], model.intercept_[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the online flow classifier")
+    parser.add_argument('datasets', nargs='+', help="CSV files from the twelve-feature collector")
+    parser.add_argument('-o', '--output', default='flow_model.npz')
+    parser.add_argument('--sklearn', action='store_true', help="fit with scikit-learn")
+    parser.add_argument('--test-split', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.sklearn and LogisticRegression is None:
+        parser.error("--sklearn needs scikit-learn installed")
+
+    names, X, y = load_datasets(args.datasets)
+    if len(np.unique(y)) < 2:
+        parser.error("the datasets contain a single label; add normal (0) and attack (1) rows")
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(y))
+    n_test = int(len(y) * args.test_split)
+    test, train = order[:n_test], order[n_test:]
+
+    mean = X[train].mean(axis=0)
+    scale = X[train].std(axis=0)
+    scale[scale == 0] = 1.0
+    Xs = (X - mean) / scale
+
+    fit = fit_sklearn if args.sklearn else fit_numpy
+    weights, bias = fit(Xs[train], y[train])
+
+    model = FlowClassifier(names, mean, scale, weights, bias)
+    model.save(args.output)
+
+    print(f"Trained on {len(train)} flows, {len(names)} features -> {args.output}")
+    if n_test:
+        accuracy = (model.predict(X[test]) == (y[test] > 0.5)).mean()
+        print(f"Held-out accuracy on {n_test} flows: {accuracy:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+import importlib
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from ryu import cfg
+from ryu.lib import hub
+
+import metrics
+
+# PACKET-IN WORKER POOL
+# Moves per-packet work (parsing, feature extraction, detection) off the hub thread
+# into worker processes, so it is no longer capped by one CPU core.
+#   sharding     the app picks a shard key per item (e.g. source MAC, host pair, dpid);
+#                the same key always goes to the same worker, so per-key state (rate
+#                detectors, flow table rows) lives in exactly one process
+#   batching     items are pickled in batches (batch_size, or whatever is pending every
+#                flush tick) over one socketpair per worker
+#   results      whatever a worker's handler returns (block verdicts, dataset rows) comes
+#                back to the hub and goes through on_result(), so FlowMods/PacketOuts are
+#                still sent from the hub
+#   ticks        with tick_interval, every worker's handler.tick(now) runs periodically
+#                (e.g. to export finished flows)
+#   back-pressure  at most max_pending items wait per worker; more are dropped and counted
+#   restarts     a worker process that dies is started again after RESTART_DELAY seconds
+#                (its per-key state is lost); items for its shard meanwhile are dropped
+#                and counted
+# A worker is a fresh interpreter that builds its handler as factory(*args), factory being
+# a "module:name" path. The handler has process(item) and optionally flush() (end of
+# each batch) and tick(now); each returns a list of results or None. The config groups
+# named in `groups` are copied into the workers as they are in the hub.
+#
+#   [workers]
+#   processes = 0               # 0 = everything on the hub thread (default)
+#   batch_size = 256
+#   max_pending = 65536
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('processes', default=0,
+               help='Worker processes for packet-in work (0 = run on the hub)'),
+    cfg.IntOpt('batch_size', default=256,
+               help='Items sent to a worker in one message'),
+    cfg.IntOpt('max_pending', default=65536,
+               help='Items waiting per worker before new ones are dropped'),
+], group='workers')
+
+FLUSH_INTERVAL = 0.002          # partial batches wait at most this long
+RESTART_DELAY = 1.0             # seconds before a worker that died is started again
+
+_LENGTH = struct.Struct('!I')
+
+# Message kinds, hub -> worker
+_INIT, _ITEMS, _TICK = 0, 1, 2
+
+
+def _send(sock, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if not n:
+            return None
+        got += n
+    return buf
+
+
+def _recv(sock):
+    header = _recv_exact(sock, _LENGTH.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _LENGTH.unpack(header)[0])
+    return None if data is None else pickle.loads(data)
+
+
+class WorkerPool(object):
+    def __init__(self, logger, factory, on_result, args=(), groups=(), processes=None,
+                 tick_interval=0, batch_size=None, max_pending=None):
+        conf = CONF.workers
+        self.logger = logger
+        self.on_result = on_result
+        self.processes = processes or conf.processes
+        self.batch_size = batch_size or conf.batch_size
+        self.max_pending = max_pending or conf.max_pending
+        self.tick_interval = tick_interval
+        self.factory = factory
+        self.args = args
+        self.settings = {group: dict(CONF[group]) for group in groups}
+
+        # Per worker; sock is None while a worker that died waits for its restart
+        self.socks = [None] * self.processes
+        self.procs = [None] * self.processes
+        self.readers = [None] * self.processes
+        self.pending = [[] for _ in range(self.processes)]     # items not sent yet
+        self.submitted = 0
+        self.dropped = 0
+        self.lost = 0
+        self.restarts = 0
+        self.results = 0
+        self.closed = False
+
+        metrics.Counter('ryu_worker_items_total', 'Items queued for the worker processes',
+                        fn=lambda: self.submitted)
+        metrics.Counter('ryu_worker_dropped_total', 'Items dropped, worker queue full',
+                        fn=lambda: self.dropped)
+        metrics.Counter('ryu_worker_lost_total', 'Items lost with a worker process that died',
+                        fn=lambda: self.lost)
+        metrics.Counter('ryu_worker_restarts_total', 'Worker processes started again',
+                        fn=lambda: self.restarts)
+        metrics.Counter('ryu_worker_results_total', 'Results returned by the workers',
+                        fn=lambda: self.results)
+        metrics.Gauge('ryu_worker_pending', 'Items waiting to be sent to the workers',
+                      fn=lambda: sum(len(items) for items in self.pending))
+
+        for index in range(self.processes):
+            self._start(index)
+
+        self.threads = [hub.spawn(self._flush_loop)]
+        if tick_interval:
+            self.threads.append(hub.spawn(self._tick_loop))
+        logger.info(f"[WORKERS] {self.processes} worker processes running {factory}")
+
+    def _start(self, index):
+        parent, child = socket.socketpair()
+        proc = subprocess.Popen(
+            [sys.executable, '-c',
+             f"import worker_pool; worker_pool.worker_main({child.fileno()})"],
+            pass_fds=[child.fileno()], cwd=os.path.dirname(os.path.abspath(__file__)))
+        child.close()
+        self.socks[index] = parent
+        self.procs[index] = proc
+        self.readers[index] = hub.spawn(self._read_loop, index, parent)
+        self._send(index, (_INIT, (self.factory, self.args, self.settings)))
+
+    def submit(self, key, item):
+        """Queue `item` for the worker owning `key`."""
+        index = hash(key) % self.processes
+        if self.socks[index] is None:
+            self.lost += 1                      # worker died, not started again yet
+            return
+        pending = self.pending[index]
+        if len(pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        pending.append(item)
+        self.submitted += 1
+        if len(pending) >= self.batch_size:
+            self._flush(index)
+
+    def _flush(self, index):
+        items = self.pending[index]
+        if items:
+            self.pending[index] = []
+            if not self._send(index, (_ITEMS, items)):
+                self.lost += len(items)
+
+    def _send(self, index, msg):
+        sock = self.socks[index]
+        if sock is None:
+            return False
+        try:
+            _send(sock, msg)
+            return True
+        except OSError:                         # worker gone, its reader may not know yet
+            self._died(index)
+            return False
+
+    def _flush_loop(self):
+        while True:
+            hub.sleep(FLUSH_INTERVAL)
+            for index in range(self.processes):
+                self._flush(index)
+
+    def _tick_loop(self):
+        while True:
+            hub.sleep(self.tick_interval)
+            for index in range(self.processes):
+                self._flush(index)              # ticks must not overtake queued items
+                self._send(index, (_TICK, None))
+
+    def _read_loop(self, index, sock):
+        while True:
+            try:
+                results = _recv(sock)
+            except OSError:                     # closed by _died
+                results = None
+            if results is None:
+                if self.socks[index] is sock:
+                    self._died(index)
+                return
+            self.results += len(results)
+            for result in results:
+                self.on_result(result)
+
+    def _died(self, index):
+        sock = self.socks[index]
+        if sock is None or self.closed:
+            return
+        self.socks[index] = None
+        self.lost += len(self.pending[index])
+        self.pending[index] = []
+        sock.close()
+        hub.spawn(self._restart, index)
+
+    def _restart(self, index):
+        proc = self.procs[index]
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        self.logger.error(f"[WORKERS] worker {index} exited (code {proc.returncode}),"
+                          f" restarting in {RESTART_DELAY}s")
+        hub.sleep(RESTART_DELAY)
+        if self.closed:
+            return
+        self.restarts += 1
+        self._start(index)
+
+    def close(self):
+        self.closed = True
+        for thread in self.threads + self.readers:
+            if thread is not None:
+                hub.kill(thread)
+        for sock in self.socks:
+            if sock is not None:
+                sock.close()                    # workers exit on EOF
+        for proc in self.procs:
+            proc.wait()
+
+
+# --- WORKER PROCESS SIDE (plain blocking Python, no hub) ---
+
+def worker_main(fd):
+    sock = socket.socket(fileno=fd)
+    sock.setblocking(True)          # created non-blocking by the hub's green socketpair
+    kind, (factory, args, settings) = _recv(sock)
+    module, name = factory.split(':')
+    # Importing the handler's module registers its options, then the hub's values apply
+    handler_cls = getattr(importlib.import_module(module), name)
+    for group, values in settings.items():
+        for opt, value in values.items():
+            CONF.set_override(opt, value, group=group)
+    handler = handler_cls(*args)
+    flush = getattr(handler, 'flush', None)
+    while True:
+        msg = _recv(sock)
+        if msg is None:
+            return
+        kind, items = msg
+        results = []
+        if kind == _ITEMS:
+            process = handler.process
+            for item in items:
+                out = process(item)
+                if out:
+                    results.extend(out)
+            if flush is not None:
+                results.extend(flush() or ())
+        elif kind == _TICK:
+            results.extend(handler.tick(time.time()) or ())
+        if results:
+            _send(sock, results)